@@ -1,22 +1,47 @@
-from fastapi import APIRouter, Query, Depends, HTTPException
-from domain.models.ncm_models import SearchResponse, FilterField
-from application.use_cases.ncm_use_cases import ItemsCache, to_api_rows, to_api_details
+from fastapi import APIRouter, Query, Depends, HTTPException, UploadFile, File, Form
+from fastapi.responses import StreamingResponse, FileResponse
+from domain.models.ncm_models import (
+    SearchResponse, CursorSearchResponse, FilterField, ExportFormat, SearchOrder, MatchMode,
+    DetailsBatchRequest, DetailsBatchResponse, ClassifyJobResponse, SuggestResponse,
+    NcmTreeResponse, DiffChange, DiffResponse)
+from application.use_cases.ncm_use_cases import (
+    ItemsCache, DEFAULT_DATASET, get_dataset_cache, list_datasets, to_api_details,
+    encode_cursor, decode_cursor, iter_export)
+from application.use_cases.ncm_diff import catalog_diff
+from application.use_cases.ncm_classify import ClassifyJob, ClassifyJobManager, get_classify_manager
+from domain.entities.user_classes import RoleType
 from domain.entities.user_classes import UserEntity
 from application.use_cases.security import get_current_user, require_roles
 
 router = APIRouter(prefix="/itens", tags=["Items"])
 
-def get_cache() -> ItemsCache:
-    return ItemsCache()
+def get_cache(
+    dataset: str | None = Query(None, description=f"Spreadsheet version (see /itens/datasets); default '{DEFAULT_DATASET}'"),
+) -> ItemsCache:
+    # catálogo único por processo e versão: carrega uma vez e recarrega só se a planilha mudar
+    try:
+        return get_dataset_cache(dataset)
+    except KeyError:
+        raise HTTPException(status_code=404, detail=f"Unknown dataset '{dataset}'.")
+
+def _page_rows(snap, ids, compact: bool):
+    # (linhas, dicionário de bases legais ou None) de uma página de resultados
+    if compact:
+        return snap.api_rows_compact(ids)
+    return snap.api_rows(ids), None
 
 @router.get("/search", response_model=SearchResponse, summary="Search items from Excel (except TIPI sheet)")
 def search_items(
     q: str = Query("", description="Keyword or code (first filter)"),
     field: FilterField = Query("ALL", description="Column for first filter"),
+    match: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for first filter"),
     q2: str = Query("", description="Keyword or code (second filter)", alias="q2"),
     field2: FilterField | None = Query(None, description="Column for second filter", alias="field2"),
+    match2: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for second filter"),
     page: int = Query(1, ge=1, description="Page number (1-based)"),
     limit: int = Query(15, ge=1, le=200, description="Page size (default 15)"),
+    order: SearchOrder = Query("sheet", description="sheet (spreadsheet order) or relevance (BM25 on the first filter)"),
+    compact: bool = Query(False, description="Rows carry LEGAL_BASIS_ID; texts go once in legal_basis"),
     cache: ItemsCache = Depends(get_cache),
     current: UserEntity = Depends(get_current_user)
 ):
@@ -24,32 +49,250 @@ def search_items(
     Suporta até **dois** filtros combinados com AND.
     - Filtro 1: (field, q) — aceita "ALL"
     - Filtro 2: (field2, q2) — opcional
+    - `match`/`match2=fuzzy`: tolera erros de digitação nas descrições
+      ("farinha de tirgo" acha "farinha de trigo", "leite integal" acha "leite integral";
+      até 1 erro por palavra de 4+ letras); demais colunas seguem "contém".
+    - `match`/`match2=exact|prefix`: igualdade/prefixo em ANEXO, CST IBS E CBS e
+      CCLASSTRIB ("anexo i" exato, "2000" prefixo de cClassTrib), resolvidos por bitmap.
+    - `order=relevance`: linhas com qualquer termo de `q` (em DESCRIÇÃO DO PRODUTO,
+      DESCRIÇÃO TIPI e ITEM, ou só no `field` escolhido), das mais relevantes para
+      as menos; o filtro 2 continua restringindo por "contém".
+    - `compact=true`: DESCRIÇÃO COMPLETA sai das linhas (vira LEGAL_BASIS_ID) e cada
+      texto distinto da página vem uma vez em `legal_basis`. Ids estáveis por versão do catálogo.
     """
+    filters = [(field, q, match), (field2, q2, match2)]
     try:
-        df_filtered = cache.search_multi([(field, q), (field2, q2)])
-        # >>> sanitize contra pd.NA para não quebrar Pydantic
-        df_filtered = df_filtered.astype(object).where(df_filtered.notna(), "")
+        snap = cache.snapshot()
+        # só ids; as linhas já vêm serializadas do snapshot (sem pd.NA)
+        if order == "relevance":
+            ids = cache.search_ranked(filters, snap=snap)
+        else:
+            ids = cache.search_ids(filters, snap=snap)
     except FileNotFoundError:
         raise HTTPException(status_code=500, detail="Excel file not found in package.")
     except Exception as exc:
         raise HTTPException(status_code=500, detail=f"Search error: {exc}")
 
-    total_items = int(df_filtered.shape[0])
+    total_items = int(ids.size)
     total_pages = max(1, (total_items + limit - 1) // limit)
     page = min(max(page, 1), total_pages)
 
     start = (page - 1) * limit
     end = start + limit
-    df_page = df_filtered.iloc[start:end]
+    data, legal_basis = _page_rows(snap, ids[start:end], compact)
 
     return {
         "page": page,
         "total_pages": total_pages,
         "total_items": total_items,
-        "data": to_api_rows(df_page),
+        "data": data,
+        "legal_basis": legal_basis,
+    }
+
+
+@router.get(
+    "/search/cursor",
+    response_model=CursorSearchResponse,
+    summary="Search items with cursor (keyset) pagination",
+)
+def search_items_cursor(
+    q: str = Query("", description="Keyword or code (first filter)"),
+    field: FilterField = Query("ALL", description="Column for first filter"),
+    match: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for first filter"),
+    q2: str = Query("", description="Keyword or code (second filter)", alias="q2"),
+    field2: FilterField | None = Query(None, description="Column for second filter", alias="field2"),
+    match2: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for second filter"),
+    cursor: str | None = Query(None, description="Opaque cursor returned as next_cursor (omit for first page)"),
+    limit: int = Query(15, ge=1, le=200, description="Page size (default 15)"),
+    with_total: bool = Query(False, description="Also count all matches (costs a full search)"),
+    compact: bool = Query(False, description="Rows carry LEGAL_BASIS_ID; texts go once in legal_basis"),
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Paginação para rolagem infinita:
+    - Primeira página sem `cursor`; as seguintes com o `next_cursor` recebido.
+    - Cada página só avalia as linhas até completar `limit`.
+    - `total_items` só é calculado com `with_total=true`.
+    - Se o catálogo for recarregado, o cursor expira (409) e a busca deve recomeçar.
+    - `compact=true`: como em /itens/search (ids de base legal valem para `version`).
+    """
+    filters = [(field, q, match), (field2, q2, match2)]
+    try:
+        snap = cache.snapshot()
+        after = -1
+        if cursor:
+            try:
+                version, after = decode_cursor(cursor)
+            except ValueError:
+                raise HTTPException(status_code=400, detail="Invalid cursor.")
+            if version != snap.version:
+                raise HTTPException(
+                    status_code=409,
+                    detail="Cursor expired: catalog was reloaded. Restart the search without cursor.",
+                )
+
+        total_items = int(cache.search_ids(filters, snap=snap).size) if with_total else None
+        ids, has_more = cache.search_after(filters, after=after, limit=limit, snap=snap)
+    except HTTPException:
+        raise
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Search error: {exc}")
+
+    data, legal_basis = _page_rows(snap, ids, compact)
+    return {
+        "version": snap.version,
+        "limit": limit,
+        "next_cursor": encode_cursor(snap.version, int(ids[-1])) if has_more else None,
+        "total_items": total_items,
+        "data": data,
+        "legal_basis": legal_basis,
     }
 
 
+@router.get("/suggest", response_model=SuggestResponse, summary="Autocomplete de NCMs e termos das descrições")
+def suggest_items(
+    q: str = Query("", description="What the user typed so far (NCM prefix, with or without dots, or text)"),
+    limit: int = Query(10, ge=1, le=50, description="Max completions"),
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Para digitação (typeahead): não executa a busca nem monta linhas.
+    - "0402", "0402.2" -> NCMs com o prefixo (ordem de código)
+    - "leite em p" -> "leite em po", "leite em pedacos"... (termos mais frequentes primeiro)
+    """
+    try:
+        snap = cache.snapshot()
+        data = cache.suggest(q, limit=limit, snap=snap)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Suggest error: {exc}")
+    return {"version": snap.version, "data": data}
+
+
+@router.get("/ncm/tree", response_model=NcmTreeResponse, summary="Filhos de um nível da hierarquia NCM, com contagens")
+def get_ncm_tree(
+    prefix: str = Query("", description="NCM prefix: '' (chapters), '01', '0101', '0101.2', '0101.21'..."),
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Navegação capítulo > posição > subposição > item > subitem.
+    Para listar as linhas de um nó use /itens/search com field=NCM e q=<code>.
+    """
+    try:
+        return cache.ncm_children(prefix)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"NCM tree error: {exc}")
+
+
+@router.get("/diff", response_model=DiffResponse, summary="Linhas incluídas, removidas e alteradas entre duas versões da planilha")
+def get_catalog_diff(
+    target: str = Query(..., description="Dataset compared against base (see /itens/datasets)"),
+    base: str = Query(DEFAULT_DATASET, description="Base dataset"),
+    change: DiffChange = Query("all", description="all, added, removed or changed"),
+    page: int = Query(1, ge=1, description="Page number (1-based)"),
+    limit: int = Query(50, ge=1, le=500, description="Page size (default 50)"),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Linhas casadas por NCM + ITEM + ANEXO (normalizados).
+    - added: só em `target`; removed: só em `base`
+    - changed: nas duas, com CST, cClassTrib, reduções IBS/CBS ou descrições diferentes (`fields`)
+    Calculado uma vez por par de versões; as páginas seguintes só recortam o resultado.
+    """
+    base_cache, target_cache = get_cache(base), get_cache(target)
+    try:
+        base_snap, target_snap = base_cache.snapshot(), target_cache.snapshot()
+        diff = catalog_diff(base_snap, target_snap)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Diff error: {exc}")
+
+    positions = diff.select(change)
+    total_items = int(positions.size)
+    total_pages = max(1, (total_items + limit - 1) // limit)
+    page = min(max(page, 1), total_pages)
+    start = (page - 1) * limit
+
+    return {
+        "base": base,
+        "base_version": base_snap.version,
+        "target": target,
+        "target_version": target_snap.version,
+        "counts": diff.counts(),
+        "page": page,
+        "total_pages": total_pages,
+        "total_items": total_items,
+        "data": diff.entries(positions[start:start + limit], base_snap, target_snap),
+    }
+
+
+@router.get("/export", summary="Stream search results (or the whole catalog) as NDJSON or CSV")
+def export_items(
+    q: str = Query("", description="Keyword or code (first filter); empty exports everything"),
+    field: FilterField = Query("ALL", description="Column for first filter"),
+    match: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for first filter"),
+    q2: str = Query("", description="Keyword or code (second filter)", alias="q2"),
+    field2: FilterField | None = Query(None, description="Column for second filter", alias="field2"),
+    match2: MatchMode = Query("contains", description="contains, fuzzy (typo-tolerant), exact or prefix (ANEXO, CST, CCLASSTRIB) for second filter"),
+    format: ExportFormat = Query("ndjson", description="ndjson (one JSON object per line) or csv"),
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Mesmos filtros de /itens/search, sem paginação: as linhas são geradas em lotes
+    a partir do snapshot atual, com memória constante no servidor.
+    """
+    try:
+        snap = cache.snapshot()
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Export error: {exc}")
+
+    media_type = "text/csv; charset=utf-8" if format == "csv" else "application/x-ndjson"
+    filename = f"itens-{snap.version}.{format}"
+    return StreamingResponse(
+        iter_export(cache, [(field, q, match), (field2, q2, match2)], fmt=format, snap=snap),
+        media_type=media_type,
+        headers={
+            "Content-Disposition": f'attachment; filename="{filename}"',
+            "X-Catalog-Version": snap.version,
+        },
+    )
+
+
+@router.get("/datasets", summary="Versões da planilha disponíveis (parâmetro ?dataset= das demais rotas)")
+def get_datasets(current: UserEntity = Depends(get_current_user)):
+    return list_datasets()
+
+
+@router.get("/cache/stats", summary="Contadores do cache de resultados de /itens/search")
+def get_cache_stats(
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    return cache.cache_stats()
+
+
+@router.get("/memory", summary="Memória do catálogo: colunas (codificação por dicionário), payloads e índices")
+def get_memory_report(
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    return cache.memory_report()
+
+
 # ---------------------------
 # NOVO ENDPOINT: /itens/details
 # ---------------------------
@@ -84,3 +327,106 @@ def get_details(
         "data": to_api_details(df),
     }
 
+
+@router.post(
+    "/details/batch",
+    response_model=DetailsBatchResponse,
+    summary="Detalhes de vários NCMs/ITEMs numa só chamada (ex.: linhas de uma NF-e)",
+)
+def get_details_batch(
+    payload: DetailsBatchRequest,
+    cache: ItemsCache = Depends(get_cache),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Mesmo formato de /itens/details, agrupado pela chave enviada:
+    - `ncm`: {ncm informado: [detalhes]} — NCM com ou sem pontos
+    - `item`: {item informado: [detalhes]}
+    - Chaves sem correspondência voltam com lista vazia.
+    """
+    try:
+        result = cache.find_details_batch(ncms=payload.ncms, items=payload.items)
+    except FileNotFoundError:
+        raise HTTPException(status_code=500, detail="Excel file not found in package.")
+    except Exception as exc:
+        raise HTTPException(status_code=500, detail=f"Details error: {exc}")
+
+    count = sum(len(v) for group in result.values() for v in group.values())
+    return {"count": count, **result}
+
+
+# ---------------------------
+# Classificação em lote (/itens/classify)
+# ---------------------------
+def get_classifier() -> ClassifyJobManager:
+    return get_classify_manager()
+
+def _owned_job(manager: ClassifyJobManager, job_id: str, current: UserEntity) -> ClassifyJob:
+    job = manager.get(job_id)
+    # job de outro usuário responde como inexistente (exceto para administradores)
+    if job is None or (job.owner_id != current.id and current.role != RoleType.administrator):
+        raise HTTPException(status_code=404, detail="Job not found.")
+    return job
+
+
+@router.post(
+    "/classify",
+    response_model=ClassifyJobResponse,
+    status_code=202,
+    summary="Envia uma lista de produtos (CSV/XLSX) para sugerir NCM/ANEXO/CST de cada linha",
+)
+def classify_products(
+    file: UploadFile = File(..., description="CSV (;/, detectado) ou planilha .xlsx/.xls com cabeçalho"),
+    column: str | None = Form(None, description="Coluna com a descrição (padrão: 1ª coluna 'descr*'/'produto')"),
+    min_score: float = Form(0.0, ge=0.0, le=1.0, description="Score mínimo para aceitar a sugestão"),
+    cache: ItemsCache = Depends(get_cache),
+    manager: ClassifyJobManager = Depends(get_classifier),
+    current: UserEntity = Depends(get_current_user)
+):
+    """
+    Cria um job assíncrono e responde na hora (202):
+    - Acompanhe em GET /itens/classify/{job_id} (status, linhas processadas, progress 0..1).
+    - Quando `status = done`, baixe o CSV em GET /itens/classify/{job_id}/result:
+      arquivo original + NCM/ANEXO/ITEM/CST/CCLASSTRIB sugeridos + SCORE (0..1).
+    - A sugestão é a linha do catálogo cuja descrição (TIPI ou do produto) é mais
+      parecida com a do cliente; SCORE baixo = revisar manualmente.
+    """
+    try:
+        job = manager.submit(file.file, file.filename or "", current.id, cache, column=column, min_score=min_score)
+    except ValueError as exc:
+        raise HTTPException(status_code=400, detail=str(exc))
+    finally:
+        file.file.close()
+    return job.to_dict()
+
+
+@router.get(
+    "/classify/{job_id}",
+    response_model=ClassifyJobResponse,
+    summary="Progresso de um job de classificação em lote",
+)
+def get_classify_job(
+    job_id: str,
+    manager: ClassifyJobManager = Depends(get_classifier),
+    current: UserEntity = Depends(get_current_user)
+):
+    return _owned_job(manager, job_id, current).to_dict()
+
+
+@router.get("/classify/{job_id}/result", summary="Baixa o CSV classificado de um job concluído")
+def get_classify_result(
+    job_id: str,
+    manager: ClassifyJobManager = Depends(get_classifier),
+    current: UserEntity = Depends(get_current_user)
+):
+    job = _owned_job(manager, job_id, current)
+    if job.status == "error":
+        raise HTTPException(status_code=409, detail=f"Job failed: {job.error}")
+    if job.status != "done":
+        raise HTTPException(status_code=409, detail=f"Job not finished yet (status: {job.status}).")
+    return FileResponse(
+        job.result_path,
+        media_type="text/csv; charset=utf-8",
+        filename=job.result_filename,
+        headers={"X-Catalog-Version": job.catalog_version or ""},
+    )
@@ -0,0 +1,574 @@
+# application/use_cases/ncm_classify.py
+from __future__ import annotations
+import csv
+import json
+import multiprocessing
+import os
+import re
+import stat
+import tempfile
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional
+
+import pandas as pd
+
+from application.use_cases.ncm_use_cases import (
+    CatalogSnapshot, ItemsCache, ensure_private_dir, normalize_for_compare,
+    normalize_visible, user_cache_dir,
+)
+
+# -----------------------------
+# Constantes
+# -----------------------------
+# Processos que classificam os lotes (1 = no próprio thread do job)
+CLASSIFY_WORKERS = int(os.environ.get("NCM_CLASSIFY_WORKERS", str(os.cpu_count() or 1)))
+
+# Descrições enviadas a um processo por vez
+CLASSIFY_BATCH = 500
+
+# Abaixo disto o job classifica no próprio thread: subir o pool (spawn + snapshot
+# inteiro em cada processo) custa ~1,1 s com 2 workers e ~2 s com 4, e o thread
+# classifica ~0,24 ms/linha -> com 4 CPUs o pool só empata por volta de 10 mil linhas
+CLASSIFY_POOL_MIN_ROWS = int(os.environ.get("NCM_CLASSIFY_POOL_MIN_ROWS", "10000"))
+
+# Tamanho máximo do arquivo enviado
+MAX_UPLOAD_BYTES = int(os.environ.get("NCM_CLASSIFY_MAX_BYTES", str(50 * 1024 * 1024)))
+
+# Por quanto tempo um job terminado (e seu arquivo de resultado) fica disponível
+JOB_TTL_SECONDS = int(os.environ.get("NCM_CLASSIFY_TTL", str(24 * 3600)))
+
+# Upload, resultado e estado (JSON) de cada job. Diretório privado (0700) e
+# compartilhado pelos workers do uvicorn: qualquer um responde /classify/{id}
+JOBS_DIR = os.environ.get("NCM_JOBS_DIR", user_cache_dir("reforma_tributaria_ncm_jobs"))
+
+_JOB_ID = re.compile(r"[0-9a-f]{32}")
+
+# Colunas do catálogo comparadas com a descrição do cliente (maior score vence;
+# empate fica com a primeira, mais específica)
+MATCH_COLUMNS = ("DESCRIÇÃO TIPI", "DESCRIÇÃO DO PRODUTO")
+
+# Colunas acrescentadas ao arquivo do cliente: (nome no resultado, coluna do catálogo)
+RESULT_COLUMNS = [
+    ("NCM SUGERIDO", "NCM"),
+    ("ANEXO SUGERIDO", "ANEXO"),
+    ("ITEM SUGERIDO", "ITEM"),
+    ("CST IBS E CBS SUGERIDO", "CST IBS E CBS"),
+    ("CCLASSTRIB SUGERIDO", "CCLASSTRIB"),
+    ("DESCRIÇÃO TIPI SUGERIDA", "DESCRIÇÃO TIPI"),
+]
+SCORE_COLUMN = "SCORE"
+
+UPLOAD_FORMATS = {".csv": "csv", ".xlsx": "xlsx", ".xls": "xls"}
+
+# -----------------------------
+# Classificação (executada nos processos do pool)
+# -----------------------------
+def classify_texts(snap: CatalogSnapshot, texts: List[str], min_score: float = 0.0) -> List[Optional[tuple[int, float]]]:
+    """
+    Para cada descrição livre: (id da linha mais parecida no catálogo, score)
+    ou None se nada atingir min_score.
+    """
+    indexes = [snap.trigrams[c] for c in MATCH_COLUMNS if c in snap.trigrams]
+    out: List[Optional[tuple[int, float]]] = []
+    for text in texts:
+        q_norm = normalize_for_compare(text, True)
+        best = None
+        for index in indexes:
+            rows, scores = index.rank(q_norm, k=1)
+            if rows.size and (best is None or scores[0] > best[1]):
+                best = (int(rows[0]), float(scores[0]))
+        out.append(best if best is not None and best[1] >= min_score else None)
+    return out
+
+_WORKER_SNAPSHOT: Optional[CatalogSnapshot] = None
+
+def _init_worker(snap: CatalogSnapshot) -> None:
+    global _WORKER_SNAPSHOT
+    _WORKER_SNAPSHOT = snap
+
+def _classify_in_worker(texts: List[str], min_score: float) -> List[Optional[tuple[int, float]]]:
+    return classify_texts(_WORKER_SNAPSHOT, texts, min_score)
+
+# -----------------------------
+# Leitura do arquivo do cliente
+# -----------------------------
+def _detect_encoding(path: str) -> str:
+    with open(path, "rb") as fh:
+        head = fh.read(1 << 16)
+    try:
+        head.decode("utf-8-sig")
+        return "utf-8-sig"
+    except UnicodeDecodeError as exc:
+        # corte no meio de um caractere multibyte no fim do trecho lido
+        return "utf-8-sig" if exc.start >= len(head) - 3 else "latin-1"
+
+def _detect_delimiter(path: str, encoding: str) -> str:
+    with open(path, "r", encoding=encoding, newline="") as fh:
+        sample = fh.read(1 << 16)
+    try:
+        return csv.Sniffer().sniff(sample, delimiters=";,\t|").delimiter
+    except csv.Error:
+        return ","
+
+def _pick_column(columns: List[str], wanted: Optional[str]) -> str:
+    """Coluna com a descrição: a informada (sem diferenciar acento/caixa) ou a 1ª "descr*"/"produto"."""
+    normed = {normalize_for_compare(c, True): c for c in columns}
+    if wanted:
+        col = normed.get(normalize_for_compare(wanted, True))
+        if col is None:
+            raise ValueError(f"Coluna '{wanted}' não encontrada. Colunas: {', '.join(columns)}")
+        return col
+    for hint in ("descr", "produto"):
+        for norm, col in normed.items():
+            if hint in norm:
+                return col
+    if not columns:
+        raise ValueError("Arquivo sem cabeçalho.")
+    return columns[0]
+
+def _count_csv_rows(path: str, encoding: str, delimiter: str) -> int:
+    """Linhas de dados como o pd.read_csv de _read_batches as entrega (sem linhas em branco)."""
+    try:
+        reader = pd.read_csv(
+            path, sep=delimiter, encoding=encoding, dtype=str, keep_default_na=False,
+            usecols=[0], chunksize=1 << 16,
+        )
+        return sum(len(chunk) for chunk in reader)
+    except pd.errors.EmptyDataError:
+        return 0
+
+def _xlsx_cell(value: Any) -> str:
+    # como pd.read_excel(dtype=str): número inteiro sem ".0", vazio -> ""
+    if value is None:
+        return ""
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value)
+
+def _xlsx_rows(path: str) -> Iterator[List[str]]:
+    """Linhas da 1ª aba como texto, lidas em streaming (read_only), sem as células vazias do fim."""
+    import openpyxl
+    book = openpyxl.load_workbook(path, read_only=True, data_only=True)
+    try:
+        for row in book.worksheets[0].iter_rows(values_only=True):
+            cells = [_xlsx_cell(v) for v in row]
+            while cells and cells[-1] == "":
+                cells.pop()
+            yield cells
+    finally:
+        book.close()
+
+def _xlsx_header(cells: List[str], width: int) -> List[str]:
+    """Nomes de coluna como o pandas: "Unnamed: i" para vazios, duplicados viram "nome.1"."""
+    names: List[str] = []
+    seen: Dict[str, int] = {}
+    for i in range(width):
+        name = cells[i] if i < len(cells) and cells[i] != "" else f"Unnamed: {i}"
+        base = name
+        while name in seen:
+            seen[base] += 1
+            name = f"{base}.{seen[base]}"
+        seen[name] = 0
+        names.append(name)
+    return names
+
+def _scan_xlsx(path: str) -> tuple[int, int]:
+    """(linhas de dados até a última não vazia, largura máxima) — 1ª passada, em streaming."""
+    total = width = 0
+    for i, cells in enumerate(_xlsx_rows(path)):
+        if cells:
+            width = max(width, len(cells))
+            total = i
+    return total, width
+
+def _xlsx_batches(path: str, total: int, width: int, batch_size: int) -> Iterator[pd.DataFrame]:
+    rows = _xlsx_rows(path)
+    columns = _xlsx_header(next(rows, []), width)
+    batch: List[List[str]] = []
+    for i, cells in enumerate(rows, 1):
+        if i > total:
+            break
+        batch.append(cells + [""] * (width - len(cells)))
+        if len(batch) == batch_size:
+            yield pd.DataFrame(batch, columns=columns)
+            batch = []
+    if batch:
+        yield pd.DataFrame(batch, columns=columns)
+
+def _read_batches(path: str, fmt: str, batch_size: int) -> tuple[int, Iterator[pd.DataFrame]]:
+    """
+    (total de linhas, lotes de DataFrame com tudo como texto).
+    - CSV e XLSX são lidos em fatias (memória limitada ao lote)
+    - XLS (xlrd) não tem leitura em streaming: o arquivo inteiro vai para a memória,
+      limitado por MAX_UPLOAD_BYTES
+    """
+    if fmt == "csv":
+        encoding = _detect_encoding(path)
+        delimiter = _detect_delimiter(path, encoding)
+        total = _count_csv_rows(path, encoding, delimiter)
+        reader = pd.read_csv(
+            path, sep=delimiter, encoding=encoding, dtype=str,
+            keep_default_na=False, chunksize=batch_size,
+        )
+        return total, iter(reader)
+
+    if fmt == "xlsx":
+        total, width = _scan_xlsx(path)
+        return total, _xlsx_batches(path, total, width, batch_size)
+
+    df = pd.read_excel(path, engine="xlrd", dtype=str, na_filter=False)
+    return len(df), (df.iloc[i:i + batch_size] for i in range(0, len(df), batch_size))
+
+# -----------------------------
+# Arquivos dos jobs (JOBS_DIR)
+# -----------------------------
+def _state_path(job_id: str) -> str:
+    return os.path.join(JOBS_DIR, f"{job_id}-state.json")
+
+def _jobs_dir() -> str:
+    """JOBS_DIR validado (nosso, 0700); OSError se não der para usá-lo com segurança."""
+    if not ensure_private_dir(JOBS_DIR):
+        raise OSError(f"Diretório de jobs inacessível ou com permissões abertas: {JOBS_DIR}")
+    return JOBS_DIR
+
+def _open_private(path: str, mode: str, **kwargs):
+    """Abre um arquivo novo do job com permissão 0600 (falha se já existir)."""
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_NOFOLLOW", 0), 0o600)
+    return os.fdopen(fd, mode, **kwargs)
+
+def _write_job_state(job: "ClassifyJob") -> None:
+    """Grava o estado do job de forma atômica (temporário 0600 + rename)."""
+    fd, tmp_path = tempfile.mkstemp(dir=_jobs_dir(), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as fh:
+            json.dump(job.to_state(), fh)
+        os.replace(tmp_path, job.state_path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+
+def _read_job_state(job_id: str) -> Optional[Dict[str, Any]]:
+    """Estado gravado por qualquer worker; None se não existe ou não é confiável."""
+    if not ensure_private_dir(JOBS_DIR):
+        return None
+    try:
+        fd = os.open(_state_path(job_id), os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+        with os.fdopen(fd, "r", encoding="utf-8") as fh:
+            st = os.fstat(fh.fileno())
+            if not stat.S_ISREG(st.st_mode) or st.st_mode & 0o022:
+                return None
+            if hasattr(os, "getuid") and st.st_uid != os.getuid():
+                return None
+            state = json.load(fh)
+        if state.get("job_id") != job_id or not all(f in state for f in ClassifyJob.STATE_FIELDS):
+            return None
+        return state
+    except (OSError, ValueError):
+        return None
+
+def _is_expired(finished_at: Optional[float], now: float) -> bool:
+    return finished_at is not None and now - finished_at > JOB_TTL_SECONDS
+
+# -----------------------------
+# Jobs
+# -----------------------------
+class ClassifyJob:
+    """
+    Estado de um job (lido pelo endpoint de progresso enquanto o runner escreve).
+    O runner espelha o estado em JOBS_DIR/<id>-state.json para os outros workers.
+    """
+
+    # campos persistidos no arquivo de estado
+    STATE_FIELDS = (
+        "owner_id", "filename", "fmt", "column", "min_score", "status", "error",
+        "total_rows", "processed_rows", "matched_rows", "catalog_version",
+        "created_at", "finished_at",
+    )
+
+    def __init__(
+            self,
+            cache: Optional[ItemsCache],
+            owner_id: int,
+            filename: str,
+            fmt: str,
+            column: Optional[str],
+            min_score: float,
+    ):
+        self.id = uuid.uuid4().hex
+        self.cache = cache                  # versão do catálogo escolhida no envio (None: lido do disco)
+        self.owner_id = owner_id
+        self.filename = filename
+        self.fmt = fmt
+        self.column = column
+        self.min_score = min_score
+        self.status = "queued"              # queued -> running -> done | error
+        self.error: Optional[str] = None
+        self.total_rows: Optional[int] = None
+        self.processed_rows = 0
+        self.matched_rows = 0
+        self.catalog_version: Optional[str] = None
+        self.created_at = time.time()
+        self.finished_at: Optional[float] = None
+
+    @property
+    def upload_path(self) -> str:
+        return os.path.join(JOBS_DIR, f"{self.id}-upload.{self.fmt}")
+
+    @property
+    def result_path(self) -> str:
+        return os.path.join(JOBS_DIR, f"{self.id}-result.csv")
+
+    @property
+    def state_path(self) -> str:
+        return _state_path(self.id)
+
+    def to_state(self) -> Dict[str, Any]:
+        return {"job_id": self.id, **{f: getattr(self, f) for f in self.STATE_FIELDS}}
+
+    @classmethod
+    def from_state(cls, state: Dict[str, Any]) -> "ClassifyJob":
+        """Job visto por outro worker: só leitura (sem cache de catálogo)."""
+        job = cls(None, state["owner_id"], state["filename"], state["fmt"], state["column"], state["min_score"])
+        job.id = state["job_id"]
+        for field in cls.STATE_FIELDS:
+            setattr(job, field, state[field])
+        return job
+
+    @property
+    def result_filename(self) -> str:
+        base = os.path.splitext(os.path.basename(self.filename))[0] or "produtos"
+        return f"{base}-classificado.csv"
+
+    def to_dict(self) -> Dict[str, Any]:
+        progress = 0.0
+        if self.status == "done":
+            progress = 1.0
+        elif self.total_rows:
+            progress = round(self.processed_rows / self.total_rows, 4)
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "filename": self.filename,
+            "total_rows": self.total_rows,
+            "processed_rows": self.processed_rows,
+            "matched_rows": self.matched_rows,
+            "progress": progress,
+            "catalog_version": self.catalog_version,
+            "error": self.error,
+            "created_at": self.created_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class ClassifyJobManager:
+    """
+    Registro dos jobs de classificação em lote.
+
+    - submit() só grava o upload e enfileira: a requisição volta na hora (202)
+    - O estado fica em memória no worker que executa o job e em JOBS_DIR para os
+      demais: get() de outro worker do uvicorn lê o arquivo de estado
+    - Um thread de fundo executa os jobs um de cada vez; cada job divide o
+      arquivo em lotes e distribui entre processos (spawn) com o snapshot do
+      catálogo carregado uma vez por processo
+    - O resultado é o arquivo original + colunas sugeridas + SCORE, em CSV
+    - Jobs terminados expiram após JOB_TTL_SECONDS (arquivos apagados, de qualquer worker)
+    """
+
+    def __init__(self, workers: int = CLASSIFY_WORKERS):
+        self.workers = max(1, workers)
+        self._jobs: Dict[str, ClassifyJob] = {}
+        self._lock = threading.Lock()
+        self._runner = ThreadPoolExecutor(max_workers=1, thread_name_prefix="ncm-classify")
+
+    def submit(
+            self,
+            stream: BinaryIO,
+            filename: str,
+            owner_id: int,
+            cache: ItemsCache,
+            column: Optional[str] = None,
+            min_score: float = 0.0,
+    ) -> ClassifyJob:
+        """
+        Copia o upload (em blocos) para disco e enfileira o job.
+        ValueError para extensão não suportada ou arquivo acima de MAX_UPLOAD_BYTES.
+        """
+        fmt = UPLOAD_FORMATS.get(os.path.splitext(filename or "")[1].lower())
+        if fmt is None:
+            raise ValueError("Formato não suportado: envie .csv, .xlsx ou .xls.")
+        self._purge_expired()
+
+        job = ClassifyJob(cache, owner_id, filename, fmt, column, min_score)
+        _jobs_dir()
+        size = 0
+        try:
+            with _open_private(job.upload_path, "wb") as dst:
+                for chunk in iter(lambda: stream.read(1 << 20), b""):
+                    size += len(chunk)
+                    if size > MAX_UPLOAD_BYTES:
+                        raise ValueError(f"Arquivo maior que {MAX_UPLOAD_BYTES // (1024 * 1024)} MB.")
+                    dst.write(chunk)
+            _write_job_state(job)
+        except BaseException:
+            self._remove_files(job)
+            raise
+
+        with self._lock:
+            self._jobs[job.id] = job
+        self._runner.submit(self._run, job)
+        return job
+
+    def get(self, job_id: str) -> Optional[ClassifyJob]:
+        if not _JOB_ID.fullmatch(job_id or ""):
+            return None
+        with self._lock:
+            job = self._jobs.get(job_id)
+        if job is not None:
+            return job
+        # job enviado a outro worker
+        state = _read_job_state(job_id)
+        if state is None or _is_expired(state["finished_at"], time.time()):
+            return None
+        return ClassifyJob.from_state(state)
+
+    # ---------- execução ----------
+    def _run(self, job: ClassifyJob) -> None:
+        job.status = "running"
+        try:
+            snap = job.cache.snapshot()
+            job.catalog_version = snap.version
+            total, batches = _read_batches(job.upload_path, job.fmt, CLASSIFY_BATCH)
+            job.total_rows = total
+            _write_job_state(job)
+            with _open_private(job.result_path, "w", encoding="utf-8", newline="") as out:
+                self._classify_file(job, snap, batches, csv.writer(out))
+            job.status = "done"
+        except Exception as exc:
+            job.error = str(exc) or exc.__class__.__name__
+            job.status = "error"
+            if os.path.exists(job.result_path):
+                os.remove(job.result_path)
+        finally:
+            job.finished_at = time.time()
+            if os.path.exists(job.upload_path):
+                os.remove(job.upload_path)
+            try:
+                _write_job_state(job)
+            except OSError:
+                pass                        # ainda visível neste worker
+
+    def _classify_file(self, job: ClassifyJob, snap: CatalogSnapshot, batches: Iterator[pd.DataFrame], writer) -> None:
+        pending: deque[tuple[pd.DataFrame, Future]] = deque()
+        header_written = False
+        column = None
+        pool = self._make_pool(snap, job.total_rows or 0)
+        try:
+            for df in batches:
+                if not header_written:
+                    column = _pick_column([str(c) for c in df.columns], job.column)
+                    writer.writerow([*map(str, df.columns), *(name for name, _ in RESULT_COLUMNS), SCORE_COLUMN])
+                    header_written = True
+                texts = df[column].tolist()
+                if pool is None:
+                    self._write_batch(job, snap, df, classify_texts(snap, texts, job.min_score), writer)
+                    continue
+                pending.append((df, pool.submit(_classify_in_worker, texts, job.min_score)))
+                # poucos lotes em voo: memória limitada e resultado gravado na ordem do arquivo
+                while len(pending) >= 2 * self.workers:
+                    done_df, fut = pending.popleft()
+                    self._write_batch(job, snap, done_df, fut.result(), writer)
+            while pending:
+                done_df, fut = pending.popleft()
+                self._write_batch(job, snap, done_df, fut.result(), writer)
+        finally:
+            if pool is not None:
+                pool.shutdown(cancel_futures=True)
+        if not header_written:
+            raise ValueError("Arquivo vazio.")
+
+    def _make_pool(self, snap: CatalogSnapshot, total_rows: int) -> Optional[ProcessPoolExecutor]:
+        """
+        Pool de processos com o snapshot já carregado (None -> classifica no thread do job):
+        só com 2+ workers e arquivo a partir de CLASSIFY_POOL_MIN_ROWS linhas.
+        """
+        workers = min(self.workers, -(-total_rows // CLASSIFY_BATCH))
+        if workers <= 1 or total_rows < CLASSIFY_POOL_MIN_ROWS:
+            return None
+        try:
+            # "spawn": o processo da API tem threads; fork com threads ativas não é seguro
+            return ProcessPoolExecutor(
+                max_workers=workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(snap,),
+            )
+        except (OSError, NotImplementedError):
+            return None
+
+    @staticmethod
+    def _write_batch(job: ClassifyJob, snap: CatalogSnapshot, df: pd.DataFrame, matches, writer) -> None:
+        rows = snap.rows
+        for values, match in zip(df.itertuples(index=False, name=None), matches):
+            if match is None:
+                writer.writerow([*values, *([""] * len(RESULT_COLUMNS)), ""])
+                continue
+            row_id, score = match
+            suggested = rows[row_id]
+            writer.writerow([
+                *values,
+                *(normalize_visible(suggested.get(col, "")) for _, col in RESULT_COLUMNS),
+                f"{score:.4f}",
+            ])
+            job.matched_rows += 1
+        job.processed_rows += len(df)
+        _write_job_state(job)
+
+    # ---------- limpeza ----------
+    def _purge_expired(self) -> None:
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values() if _is_expired(job.finished_at, now)]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            self._remove_files(job)
+        # jobs de outros workers (inclusive de um worker que morreu no meio do job)
+        if not ensure_private_dir(JOBS_DIR):
+            return
+        with self._lock:
+            local = set(self._jobs)
+        for name in os.listdir(JOBS_DIR):
+            job_id = name[:-len("-state.json")]
+            if not name.endswith("-state.json") or not _JOB_ID.fullmatch(job_id) or job_id in local:
+                continue
+            state = _read_job_state(job_id)
+            if state is not None and _is_expired(state["finished_at"] or state["created_at"], now):
+                self._remove_files(ClassifyJob.from_state(state))
+
+    @staticmethod
+    def _remove_files(job: ClassifyJob) -> None:
+        for path in (job.upload_path, job.result_path, job.state_path):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+# -----------------------------
+# Gerenciador compartilhado (escopo de processo)
+# -----------------------------
+_MANAGER: Optional[ClassifyJobManager] = None
+_MANAGER_LOCK = threading.Lock()
+
+def get_classify_manager() -> ClassifyJobManager:
+    """Instância única por processo: os jobs ficam visíveis para todas as requisições."""
+    global _MANAGER
+    if _MANAGER is None:
+        with _MANAGER_LOCK:
+            if _MANAGER is None:
+                _MANAGER = ClassifyJobManager()
+    return _MANAGER
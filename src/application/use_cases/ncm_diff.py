@@ -0,0 +1,173 @@
+# application/use_cases/ncm_diff.py
+from __future__ import annotations
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from application.use_cases.ncm_use_cases import CatalogSnapshot
+
+# -----------------------------
+# Constantes
+# -----------------------------
+# Colunas que identificam "a mesma linha" nas duas versões da planilha
+DIFF_KEY_COLUMNS = ("NCM", "ITEM", "ANEXO")
+
+# Colunas comparadas nas linhas presentes nas duas versões (ordem = bits de CatalogDiff.fields)
+DIFF_COMPARE_COLUMNS = (
+    "CST IBS E CBS",
+    "CCLASSTRIB",
+    "IBS",
+    "CBS",
+    "DESCRIÇÃO DO PRODUTO",
+    "DESCRIÇÃO TIPI",
+    "DESCRIÇÃO COMPLETA",
+)
+
+# Tipos de mudança (códigos de CatalogDiff.kinds)
+DIFF_KINDS = ("added", "removed", "changed")
+ADDED, REMOVED, CHANGED = range(len(DIFF_KINDS))
+
+# Pares de versões (base, alvo) com o diff mantido em memória
+DIFF_CACHE_SIZE = int(os.environ.get("NCM_DIFF_CACHE_SIZE", "8"))
+
+# -----------------------------
+# Chaves e junção
+# -----------------------------
+def _row_keys(snap: CatalogSnapshot) -> np.ndarray:
+    """
+    Chave de junção de cada linha: NCM só com dígitos + ITEM e ANEXO normalizados
+    ("0101.21.00" e "0101 21 00" casam; caixa, acento e pontuação não contam).
+    """
+    n = len(snap)
+    blank = pd.Series(np.full(n, "", dtype=object))
+    ncm, item, anexo = (
+        pd.Series(snap.norm[c], dtype=object) if c in snap.norm else blank for c in DIFF_KEY_COLUMNS
+    )
+    return (ncm.str.replace(" ", "", regex=False) + "\x1f" + item + "\x1f" + anexo).to_numpy(dtype=object)
+
+def _keyed(snap: CatalogSnapshot, side: str) -> pd.DataFrame:
+    # chaves repetidas na mesma versão casam pela ordem de ocorrência (1ª com 1ª, 2ª com 2ª...)
+    keys = _row_keys(snap)
+    return pd.DataFrame({
+        "key": keys,
+        "occ": pd.Series(keys).groupby(keys, sort=False).cumcount().to_numpy(),
+        side: np.arange(len(keys), dtype=np.int64),
+    })
+
+def _compare_value(value: str) -> str:
+    # números comparados pelo valor ("1", "1.0" e "1,0" são iguais); textos como aparecem na API
+    try:
+        return repr(float(value.replace(",", ".")))
+    except (AttributeError, ValueError):
+        return value
+
+def _visible(snap: CatalogSnapshot, col: str) -> np.ndarray:
+    """Coluna dos payloads pronta para comparação (canonicaliza só os valores distintos)."""
+    rows = snap.rows
+    values = np.fromiter((r.get(col, "") for r in rows), dtype=object, count=len(rows))
+    codes, uniques = pd.factorize(values, use_na_sentinel=False)
+    return np.array([_compare_value(u) for u in uniques], dtype=object)[codes]
+
+# -----------------------------
+# Resultado
+# -----------------------------
+class CatalogDiff:
+    """
+    Diferenças da versão base para a versão alvo, como ids de linha de cada snapshot.
+    - kinds: ADDED / REMOVED / CHANGED por entrada
+    - base_ids / target_ids: linha em cada versão (-1 = não existe naquela versão)
+    - fields: bits de DIFF_COMPARE_COLUMNS que mudaram (só CHANGED)
+    Entradas ordenadas pela chave (NCM, ITEM, ANEXO). Não guarda os snapshots:
+    as páginas são montadas com os snapshots das versões correspondentes.
+    """
+    __slots__ = ("base_version", "target_version", "kinds", "base_ids", "target_ids", "fields")
+
+    def __init__(self, base: CatalogSnapshot, target: CatalogSnapshot):
+        self.base_version = base.version
+        self.target_version = target.version
+
+        # junção por hash (chave, ocorrência): linhas só na base, só no alvo, ou nas duas
+        joined = _keyed(base, "base").merge(_keyed(target, "target"), on=["key", "occ"], how="outer", sort=False)
+        base_ids = joined["base"].fillna(-1).to_numpy(dtype=np.int64)
+        target_ids = joined["target"].fillna(-1).to_numpy(dtype=np.int64)
+
+        fields = np.zeros(len(joined), dtype=np.uint8)
+        both = np.flatnonzero((base_ids >= 0) & (target_ids >= 0))
+        for bit, col in enumerate(DIFF_COMPARE_COLUMNS):
+            differs = _visible(base, col)[base_ids[both]] != _visible(target, col)[target_ids[both]]
+            fields[both[differs]] |= np.uint8(1 << bit)
+
+        kinds = np.full(len(joined), CHANGED, dtype=np.int8)
+        kinds[base_ids < 0] = ADDED
+        kinds[target_ids < 0] = REMOVED
+        keep = (kinds != CHANGED) | (fields != 0)
+
+        order = np.flatnonzero(keep)
+        keys = joined["key"].to_numpy(dtype=object)[order].astype(str)
+        order = order[np.lexsort((joined["occ"].to_numpy()[order], keys))]
+        self.kinds = kinds[order]
+        self.base_ids = base_ids[order]
+        self.target_ids = target_ids[order]
+        self.fields = fields[order]
+        for arr in (self.kinds, self.base_ids, self.target_ids, self.fields):
+            arr.flags.writeable = False
+
+    def counts(self) -> Dict[str, int]:
+        totals = np.bincount(self.kinds, minlength=len(DIFF_KINDS))
+        return {kind: int(totals[i]) for i, kind in enumerate(DIFF_KINDS)}
+
+    def select(self, kind: Optional[str] = None) -> np.ndarray:
+        """Posições das entradas do tipo pedido (None/"all" = todas)."""
+        if not kind or kind == "all":
+            return np.arange(len(self.kinds))
+        return np.flatnonzero(self.kinds == DIFF_KINDS.index(kind))
+
+    def entries(self, positions, base: CatalogSnapshot, target: CatalogSnapshot) -> List[Dict[str, Any]]:
+        """Payloads das entradas pedidas: chave, tipo, colunas alteradas e a linha antes/depois."""
+        if (base.version, target.version) != (self.base_version, self.target_version):
+            raise ValueError("Snapshots do not match the diff versions.")
+        out: List[Dict[str, Any]] = []
+        for p in positions:
+            b, t = int(self.base_ids[p]), int(self.target_ids[p])
+            before = dict(base.rows[b]) if b >= 0 else None
+            after = dict(target.rows[t]) if t >= 0 else None
+            ref = after if after is not None else before
+            mask = int(self.fields[p])
+            out.append({
+                "change": DIFF_KINDS[self.kinds[p]],
+                **{c: ref.get(c, "") for c in DIFF_KEY_COLUMNS},
+                "fields": [c for bit, c in enumerate(DIFF_COMPARE_COLUMNS) if mask & (1 << bit)],
+                "before": before,
+                "after": after,
+            })
+        return out
+
+# -----------------------------
+# Cache por par de versões (escopo de processo)
+# -----------------------------
+_DIFFS: "OrderedDict[tuple[str, str], CatalogDiff]" = OrderedDict()
+_DIFFS_LOCK = threading.Lock()
+
+def catalog_diff(base: CatalogSnapshot, target: CatalogSnapshot) -> CatalogDiff:
+    """
+    Diff base -> alvo, calculado uma vez por par de versões (LRU de DIFF_CACHE_SIZE pares).
+    As versões vêm do hash da planilha: recarregar um dataset gera outro par.
+    """
+    key = (base.version, target.version)
+    with _DIFFS_LOCK:
+        diff = _DIFFS.get(key)
+        if diff is not None:
+            _DIFFS.move_to_end(key)
+            return diff
+    diff = CatalogDiff(base, target)
+    if DIFF_CACHE_SIZE > 0:
+        with _DIFFS_LOCK:
+            _DIFFS[key] = diff
+            _DIFFS.move_to_end(key)
+            while len(_DIFFS) > DIFF_CACHE_SIZE:
+                _DIFFS.popitem(last=False)
+    return diff
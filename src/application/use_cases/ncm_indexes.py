@@ -0,0 +1,744 @@
+# application/use_cases/ncm_indexes.py
+from __future__ import annotations
+import bisect
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+# -----------------------------
+# Índice invertido de trigramas
+# -----------------------------
+class TrigramIndex:
+    """
+    Índice de n-gramas sobre uma coluna JÁ normalizada (normalize_for_compare).
+
+    - Indexa apenas os valores distintos da coluna (ANEXO, DESCRIÇÃO TIPI etc. se repetem muito)
+    - gram -> ids (ordenados) dos valores distintos que contêm o gram
+    - Busca "contains": interseção das listas dos grams da consulta -> candidatos
+      -> verificação final (substring) só nos candidatos -> máscara de linhas
+    - Consultas menores que o gram caem para varredura dos valores distintos
+    - rank(): similaridade (Dice sobre trigramas) para classificar texto livre
+    """
+    GRAM = 3
+
+    def __init__(self, norm):
+        codes, uniques = pd.factorize(np.asarray(norm, dtype=object), use_na_sentinel=False)
+        self._codes = codes.astype(np.int32, copy=False)
+        self._values: List[str] = ["" if u is None else str(u) for u in uniques]
+
+        postings: Dict[str, List[int]] = {}
+        n = self.GRAM
+        for vid, text in enumerate(self._values):
+            for gram in {text[i:i + n] for i in range(len(text) - n + 1)}:
+                postings.setdefault(gram, []).append(vid)
+        # Listas empacotadas num único vetor (gram -> fatia), o que deixa o
+        # índice compacto e rápido de serializar no snapshot do catálogo.
+        # vids são inseridos em ordem crescente -> fatias já ordenadas
+        self._grams: Dict[str, int] = {g: i for i, g in enumerate(postings)}
+        lengths = np.fromiter((len(ids) for ids in postings.values()), dtype=np.int64, count=len(postings))
+        self._bounds = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._flat = np.fromiter(
+            (vid for ids in postings.values() for vid in ids), dtype=np.int32, count=int(lengths.sum())
+        )
+        # nº de grams distintos de cada valor e 1ª linha em que ele aparece (rank)
+        self._sizes = np.bincount(self._flat, minlength=len(self._values)).astype(np.int32)
+        _, first = np.unique(self._codes, return_index=True)
+        self._first_row = first.astype(np.int64)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._values = pool.share_list(self._values)
+        self._grams = pool.share_keys(self._grams)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._values, self._grams.keys()]
+
+    def _candidates(self, q_norm: str) -> Optional[np.ndarray]:
+        """ids de valores distintos que contêm TODOS os grams da consulta (None = sem índice)."""
+        n = self.GRAM
+        if len(q_norm) < n:
+            return None
+        grams = {q_norm[i:i + n] for i in range(len(q_norm) - n + 1)}
+        lists = []
+        for g in grams:
+            gid = self._grams.get(g)
+            if gid is None:
+                return np.empty(0, dtype=np.int32)
+            lists.append(self._flat[self._bounds[gid]:self._bounds[gid + 1]])
+        lists.sort(key=len)
+        cand = lists[0]
+        for ids in lists[1:]:
+            if cand.size == 0:
+                break
+            cand = np.intersect1d(cand, ids, assume_unique=True)
+        return cand
+
+    def matcher(self, q_norm: str) -> Callable[[int, int], np.ndarray]:
+        """
+        Resolve a consulta UMA vez (sobre os valores distintos) e devolve
+        f(lo, hi) -> máscara das linhas [lo, hi). Permite varrer o catálogo
+        em fatias e parar cedo (paginação por cursor).
+        """
+        cand = self._candidates(q_norm)
+        if cand is None:
+            # consulta curta: varre os valores distintos
+            matched = [vid for vid, text in enumerate(self._values) if q_norm in text]
+        else:
+            # verificação final: trigramas em comum não garantem a substring
+            values = self._values
+            matched = [int(vid) for vid in cand if q_norm in values[vid]]
+
+        hit = np.zeros(len(self._values), dtype=bool)
+        hit[matched] = True
+        codes = self._codes
+        return lambda lo, hi: hit[codes[lo:hi]]
+
+    def contains(self, q_norm: str) -> np.ndarray:
+        """Máscara booleana (por linha) de `q_norm in valor`."""
+        return self.matcher(q_norm)(0, len(self._codes))
+
+    def rank(self, q_norm: str, k: int = 1) -> tuple[np.ndarray, np.ndarray]:
+        """
+        Os k valores mais parecidos com q_norm (coeficiente de Dice sobre os
+        trigramas): devolve (1ª linha de cada valor, score em [0, 1]), do
+        maior score para o menor. Valores sem nenhum gram em comum ficam de fora.
+        """
+        n = self.GRAM
+        grams = {q_norm[i:i + n] for i in range(len(q_norm) - n + 1)}
+        gids = [self._grams[g] for g in grams if g in self._grams]
+        if not gids:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        bounds, flat = self._bounds, self._flat
+        hits = np.concatenate([flat[bounds[g]:bounds[g + 1]] for g in gids])
+        shared = np.bincount(hits, minlength=len(self._values))
+        score = 2.0 * shared / (len(grams) + self._sizes)
+
+        k = min(k, len(score))
+        top = np.argpartition(-score, k - 1)[:k]
+        top = top[np.argsort(-score[top], kind="stable")]
+        top = top[score[top] > 0]
+        return self._first_row[top], score[top]
+
+# -----------------------------
+# Índice BM25 (busca por relevância)
+# -----------------------------
+class BM25Index:
+    """
+    Pesos BM25 pré-calculados sobre os tokens de uma coluna JÁ normalizada.
+
+    - Como no TrigramIndex, os documentos são os valores distintos da coluna
+      (df/idf contam valores distintos: um texto legal repetido em mil linhas
+      não vira "termo comum" por isso)
+    - termo -> (ids de valores, peso BM25) em vetores únicos (CSR)
+    - scores(): soma os pesos dos termos da consulta por valor distinto e
+      espalha para as linhas pelos códigos — tudo em operações numpy
+    """
+    K1 = 1.2
+    B = 0.75
+    # palavras vazias (já sem acento): não pontuam nem puxam linhas para o resultado
+    STOPWORDS = frozenset(
+        "a ao aos as com da das de do dos e em na nas no nos o os ou para pela pelas "
+        "pelo pelos por que se sem sob sobre um uma".split()
+    )
+
+    def __init__(self, norm):
+        codes, uniques = pd.factorize(np.asarray(norm, dtype=object), use_na_sentinel=False)
+        self._codes = codes.astype(np.int32, copy=False)
+        self._n_values = len(uniques)
+
+        vocab: Dict[str, int] = {}
+        term_ids: List[int] = []
+        doc_ids: List[int] = []
+        tfs: List[int] = []
+        lengths = np.zeros(self._n_values, dtype=np.float64)
+        for vid, text in enumerate(uniques):
+            tokens = [t for t in ("" if text is None else str(text)).split() if t not in self.STOPWORDS]
+            lengths[vid] = len(tokens)
+            for term, tf in Counter(tokens).items():
+                term_ids.append(vocab.setdefault(term, len(vocab)))
+                doc_ids.append(vid)
+                tfs.append(tf)
+
+        terms = np.asarray(term_ids, dtype=np.int64)
+        docs = np.asarray(doc_ids, dtype=np.int32)
+        tf = np.asarray(tfs, dtype=np.float64)
+        df = np.bincount(terms, minlength=len(vocab))
+        n = max(self._n_values, 1)
+        idf = np.log(1.0 + (n - df + 0.5) / (df + 0.5))
+        avg_len = lengths.mean() if self._n_values and lengths.mean() > 0 else 1.0
+        norm_len = self.K1 * (1.0 - self.B + self.B * lengths[docs] / avg_len)
+        weights = idf[terms] * tf * (self.K1 + 1.0) / (tf + norm_len)
+
+        order = np.argsort(terms, kind="stable")
+        self._terms = vocab
+        self._bounds = np.concatenate([[0], np.cumsum(df)]).astype(np.int64)
+        self._docs = docs[order]
+        self._weights = weights[order].astype(np.float32)
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._terms = pool.share_keys(self._terms)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._terms.keys()]
+
+    def scores(self, tokens: List[str]) -> np.ndarray:
+        """Score BM25 de cada LINHA para os tokens (já normalizados) da consulta."""
+        acc = np.zeros(self._n_values, dtype=np.float32)
+        for term in tokens:
+            tid = self._terms.get(term) if term not in self.STOPWORDS else None
+            if tid is None:
+                continue
+            lo, hi = self._bounds[tid], self._bounds[tid + 1]
+            # cada valor aparece no máximo uma vez por termo -> soma direta
+            acc[self._docs[lo:hi]] += self._weights[lo:hi]
+        return acc[self._codes]
+
+# -----------------------------
+# Índice aproximado (tolerante a erro de digitação)
+# -----------------------------
+def within_distance(a: str, b: str, k: int) -> bool:
+    """
+    Distância de edição entre a e b <= k, parando assim que passar de k.
+    Damerau restrita (OSA): troca de duas letras vizinhas ("tirgo" -> "trigo") conta 1.
+    """
+    if abs(len(a) - len(b)) > k:
+        return False
+    if a == b:
+        return True
+    before: List[int] = []
+    prev = list(range(len(b) + 1))
+    for i, ca in enumerate(a, 1):
+        cur = [i]
+        for j, cb in enumerate(b, 1):
+            cost = min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb))
+            if i > 1 and j > 1 and ca == b[j - 2] and a[i - 2] == cb:
+                cost = min(cost, before[j - 2] + 1)
+            cur.append(cost)
+        if min(cur) > k and min(prev) > k:
+            return False
+        before, prev = prev, cur
+    return prev[-1] <= k
+
+
+class FuzzyIndex:
+    """
+    Vocabulário de tokens de uma coluna JÁ normalizada + vizinhança de deleções.
+
+    - token -> ids dos valores distintos que o contêm (CSR, como no TrigramIndex)
+    - deleção -> tokens: cada token do vocabulário é indexado por ele mesmo e por
+      todas as formas com 1 caractere a menos; a consulta gera as mesmas formas e
+      só os tokens encontrados passam pela distância de edição (limitada)
+    - Um valor casa quando TODOS os tokens da consulta casam com algum token dele:
+      igual, prefixo ou até max_distance() edições (no máximo 1: troca, inserção,
+      remoção ou inversão de letras vizinhas)
+    - Deleções de 1 nível acham exatamente os tokens a 1 edição; 2 edições exigiriam
+      indexar deleções de 2 níveis (~370 mil chaves a mais só em DESCRIÇÃO TIPI)
+    """
+    MIN_DELETE_LEN = 3
+
+    def __init__(self, norm):
+        codes, uniques = pd.factorize(np.asarray(norm, dtype=object), use_na_sentinel=False)
+        self._codes = codes.astype(np.int32, copy=False)
+        self._n_values = len(uniques)
+
+        postings: Dict[str, List[int]] = {}
+        for vid, text in enumerate(uniques):
+            for token in set(("" if text is None else str(text)).split()):
+                postings.setdefault(token, []).append(vid)
+        # vocabulário ordenado: prefixos viram um intervalo (bisect)
+        self._vocab: List[str] = sorted(postings)
+        lengths = np.fromiter((len(postings[t]) for t in self._vocab), dtype=np.int64, count=len(self._vocab))
+        self._bounds = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+        self._values = np.fromiter(
+            (vid for t in self._vocab for vid in postings[t]), dtype=np.int32, count=int(lengths.sum())
+        )
+
+        deletes: Dict[str, List[int]] = {}
+        for tid, token in enumerate(self._vocab):
+            if len(token) >= self.MIN_DELETE_LEN:
+                for key in {token, *self._deletes(token)}:
+                    deletes.setdefault(key, []).append(tid)
+        self._del_slots: Dict[str, int] = {k: i for i, k in enumerate(deletes)}
+        del_lengths = np.fromiter((len(v) for v in deletes.values()), dtype=np.int64, count=len(deletes))
+        self._del_bounds = np.concatenate([[0], np.cumsum(del_lengths)]).astype(np.int64)
+        self._del_tokens = np.fromiter(
+            (tid for v in deletes.values() for tid in v), dtype=np.int32, count=int(del_lengths.sum())
+        )
+
+    def __len__(self) -> int:
+        return len(self._codes)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._vocab = pool.share_list(self._vocab)
+        self._del_slots = pool.share_keys(self._del_slots)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._vocab, self._del_slots.keys()]
+
+    @staticmethod
+    def _deletes(token: str) -> set:
+        return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+    @staticmethod
+    def max_distance(token: str) -> int:
+        """Edições toleradas: nenhuma até 3 letras, 1 acima disso."""
+        return 0 if len(token) <= 3 else 1
+
+    def expand(self, token: str) -> List[int]:
+        """Ids dos tokens do vocabulário aceitos para `token` (prefixo ou até max_distance edições)."""
+        vocab = self._vocab
+        lo = bisect.bisect_left(vocab, token)
+        hi = bisect.bisect_left(vocab, token + "\uffff")
+        found = set(range(lo, hi))
+        k = self.max_distance(token)
+        if k:
+            for key in {token, *self._deletes(token)}:
+                slot = self._del_slots.get(key)
+                if slot is None:
+                    continue
+                for tid in self._del_tokens[self._del_bounds[slot]:self._del_bounds[slot + 1]].tolist():
+                    if tid not in found and within_distance(token, vocab[tid], k):
+                        found.add(tid)
+        return sorted(found)
+
+    def vocab_terms(self, tokens: List[str]) -> List[str]:
+        """Tokens do vocabulário aceitos para cada token da consulta (união)."""
+        vocab = self._vocab
+        return [vocab[tid] for token in set(tokens) for tid in self.expand(token)]
+
+    def matcher(self, q_norm: str) -> Callable[[int, int], np.ndarray]:
+        """f(lo, hi) -> máscara das linhas [lo, hi) que casam (aproximadamente) com todos os tokens."""
+        hit = np.ones(self._n_values, dtype=bool)
+        for token in set(q_norm.split()):
+            tids = self.expand(token)
+            has = np.zeros(self._n_values, dtype=bool)
+            if tids:
+                has[np.concatenate([self._values[self._bounds[t]:self._bounds[t + 1]] for t in tids])] = True
+            hit &= has
+        codes = self._codes
+        return lambda lo, hi: hit[codes[lo:hi]]
+
+# -----------------------------
+# Autocomplete (prefixos ordenados)
+# -----------------------------
+class SuggestIndex:
+    """
+    Listas ordenadas para completar o que o usuário está digitando (bisect = O(log n)).
+
+    - NCMs distintos pela chave só de dígitos: "0101", "0101.2" e "01012" caem
+      no mesmo intervalo; devolve o código como está na planilha
+    - Termos das descrições (já normalizados) com o nº de descrições em que
+      aparecem: completa o último token e ordena pelos mais frequentes
+    """
+
+    def __init__(self, ncm_values, term_columns):
+        counts = Counter(str(v).strip() for v in ncm_values)
+        digits = {code: re.sub(r"\D", "", code) for code in counts}
+        entries = sorted((key, code) for code, key in digits.items() if key)
+        self._ncm_keys: List[str] = [k for k, _ in entries]
+        self._ncm_codes: List[str] = [c for _, c in entries]
+        self._ncm_counts = np.asarray([counts[c] for c in self._ncm_codes], dtype=np.int32)
+
+        # frequência = nº de descrições DISTINTAS com o termo (texto legal repetido
+        # em milhares de linhas não domina as sugestões); palavras vazias ficam de fora
+        freq: Counter = Counter()
+        for norm in term_columns:
+            for text in pd.unique(np.asarray(norm, dtype=object)):
+                for token in set(("" if text is None else str(text)).split()):
+                    if token not in BM25Index.STOPWORDS:
+                        freq[token] += 1
+        self._terms: List[str] = sorted(freq)
+        self._term_counts = np.asarray([freq[t] for t in self._terms], dtype=np.int32)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._ncm_keys = pool.share_list(self._ncm_keys)
+        self._ncm_codes = pool.share_list(self._ncm_codes)
+        self._terms = pool.share_list(self._terms)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._ncm_keys, self._ncm_codes, self._terms]
+
+    @staticmethod
+    def _prefix_range(keys: List[str], prefix: str) -> tuple[int, int]:
+        return bisect.bisect_left(keys, prefix), bisect.bisect_left(keys, prefix + "\uffff")
+
+    def ncm(self, digits: str, limit: int) -> List[tuple[str, int]]:
+        """(NCM, nº de linhas) cujos dígitos começam com `digits`, em ordem de código."""
+        lo, hi = self._prefix_range(self._ncm_keys, digits)
+        hi = min(hi, lo + limit)
+        return list(zip(self._ncm_codes[lo:hi], self._ncm_counts[lo:hi].tolist()))
+
+    def terms(self, prefix: str, limit: int) -> List[tuple[str, int]]:
+        """(termo, nº de descrições) que começam com `prefix`, dos mais frequentes para os menos."""
+        lo, hi = self._prefix_range(self._terms, prefix)
+        if hi <= lo:
+            return []
+        counts = self._term_counts[lo:hi]
+        k = min(limit, hi - lo)
+        top = np.argpartition(-counts, k - 1)[:k] if k < hi - lo else np.arange(hi - lo)
+        top = top[np.lexsort((top, -counts[top]))]  # frequência desc, depois alfabética
+        return [(self._terms[lo + i], int(counts[i])) for i in top.tolist()]
+
+# -----------------------------
+# Hierarquia NCM (capítulo > posição > subposição > item > subitem)
+# -----------------------------
+def format_ncm_prefix(digits: str) -> str:
+    """Dígitos -> forma pontuada da planilha: "01012" -> "0101.2", "0101210" -> "0101.21.0"."""
+    out = digits[:4]
+    if len(digits) > 4:
+        out += "." + digits[4:6]
+    if len(digits) > 6:
+        out += "." + digits[6:8]
+    return out
+
+
+class NcmTreeIndex:
+    """
+    Linhas ordenadas pela chave de dígitos do NCM: qualquer prefixo da hierarquia
+    ("01", "0101", "0101.2") é um intervalo contíguo (searchsorted), sem varrer
+    o catálogo. children() conta os nós do nível seguinte dentro do intervalo.
+    """
+    # capítulo, posição, subposição (1º e 2º níveis), item, subitem
+    LEVELS = (2, 4, 5, 6, 7, 8)
+    LEVEL_NAMES = {2: "capitulo", 4: "posicao", 5: "subposicao1", 6: "subposicao2", 7: "item", 8: "subitem"}
+
+    def __init__(self, ncm_values):
+        keys = np.asarray([re.sub(r"\D", "", str(v))[:8] for v in ncm_values], dtype="U8")
+        order = np.argsort(keys, kind="stable")
+        self._keys = keys[order]
+        self._rows = order.astype(np.int64)
+        self._size = len(keys)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        pass  # chaves em array numpy de largura fixa (sem objetos str)
+
+    def strings(self) -> List[Iterable[str]]:
+        return []
+
+    def _range(self, digits: str) -> tuple[int, int]:
+        lo = int(np.searchsorted(self._keys, digits, side="left"))
+        hi = int(np.searchsorted(self._keys, digits + "\uffff", side="left"))
+        return lo, hi
+
+    def rows(self, digits: str) -> np.ndarray:
+        """Ids (em ordem de planilha) das linhas cujo NCM começa com `digits`."""
+        lo, hi = self._range(digits)
+        return np.sort(self._rows[lo:hi])
+
+    def mask(self, digits: str) -> np.ndarray:
+        out = np.zeros(self._size, dtype=bool)
+        lo, hi = self._range(digits)
+        out[self._rows[lo:hi]] = True
+        return out
+
+    def children(self, digits: str) -> tuple[Optional[int], List[tuple[str, int, int]]]:
+        """
+        (nível dos filhos, [(dígitos do filho, nº de linhas, nº de NCMs distintos)])
+        sob o prefixo. Nível None = prefixo já é um subitem (sem filhos).
+        """
+        level = next((n for n in self.LEVELS if n > len(digits)), None)
+        if level is None:
+            return None, []
+        lo, hi = self._range(digits)
+        keys = self._keys[lo:hi]
+        keys = keys[np.char.str_len(keys) >= level]
+        if keys.size == 0:
+            return level, []
+        # truncar o array de largura fixa = agrupar pelo prefixo do nível
+        nodes, rows = np.unique(keys.astype(f"U{level}"), return_counts=True)
+        codes = np.unique(keys)
+        _, ncms = np.unique(codes.astype(f"U{level}"), return_counts=True)
+        return level, list(zip(nodes.tolist(), rows.tolist(), ncms.tolist()))
+
+# -----------------------------
+# Índice hash (chave -> linhas)
+# -----------------------------
+class KeyIndex:
+    """
+    Dicionário chave -> ids de linha (ordenados, na ordem da planilha).
+    Usado para igualdade exata (NCM, ITEM) em O(1).
+    """
+
+    def __init__(self, keys):
+        codes, uniques = pd.factorize(np.asarray(keys, dtype=object), use_na_sentinel=False)
+        self._size = len(keys)
+        self._slots: Dict[str, int] = {k: i for i, k in enumerate(uniques)}
+        # linhas agrupadas por chave (ordem estável) + limites de cada grupo
+        self._rows = np.argsort(codes, kind="stable").astype(np.int64)
+        counts = np.bincount(codes, minlength=len(uniques))
+        self._bounds = np.concatenate([[0], np.cumsum(counts)]).astype(np.int64)
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._slots = pool.share_keys(self._slots)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._slots.keys()]
+
+    def get(self, key: str) -> np.ndarray:
+        i = self._slots.get(key)
+        if i is None:
+            return np.empty(0, dtype=np.int64)
+        return self._rows[self._bounds[i]:self._bounds[i + 1]]
+
+    def mask(self, key: str, lo: int = 0, hi: Optional[int] = None) -> np.ndarray:
+        """Máscara das linhas [lo, hi) com a chave (padrão: catálogo inteiro)."""
+        hi = self._size if hi is None else min(hi, self._size)
+        rows = self.get(key)
+        rows = rows[(rows >= lo) & (rows < hi)]
+        out = np.zeros(max(hi - lo, 0), dtype=bool)
+        out[rows - lo] = True
+        return out
+
+# -----------------------------
+# Índice bitmap (colunas com poucos valores distintos)
+# -----------------------------
+class BitmapIndex:
+    """
+    Um bitmap compactado (np.packbits) por valor distinto, já normalizado.
+    Para colunas com poucos valores e muitas linhas (ANEXO, CST, cClassTrib).
+
+    - "exact": bitmap do valor; "prefix": OR dos valores num intervalo das chaves
+      ordenadas; "contains": OR dos valores cujo texto contém a consulta
+    - A consulta percorre só as chaves distintas, nunca as linhas
+    - Filtros sobre bitmaps combinam-se com AND ainda compactados (bitmap_and)
+    """
+    OPS = ("exact", "prefix", "contains")
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        keys = [str(u) for u in uniques]
+        order = sorted(range(len(keys)), key=keys.__getitem__)
+        self._size = len(codes)
+        self._keys: List[str] = [keys[i] for i in order]
+        # linha i = bitmap da chave self._keys[i]
+        onehot = codes[None, :] == np.asarray(order, dtype=codes.dtype)[:, None]
+        self._bits = np.packbits(onehot, axis=1) if len(keys) else np.zeros((0, (self._size + 7) // 8), np.uint8)
+        self._bits.flags.writeable = False
+
+    def __len__(self) -> int:
+        return self._size
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self._keys = pool.share_list(self._keys)
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self._keys]
+
+    def keys(self) -> List[str]:
+        return list(self._keys)
+
+    def _select(self, op: str, q: str) -> List[int]:
+        """Posições (em self._keys) das chaves que atendem à operação."""
+        if op == "exact":
+            i = bisect.bisect_left(self._keys, q)
+            return [i] if i < len(self._keys) and self._keys[i] == q else []
+        if op == "prefix":
+            lo = bisect.bisect_left(self._keys, q)
+            hi = bisect.bisect_left(self._keys, q + "\uffff")
+            return list(range(lo, hi))
+        if op == "contains":
+            return [i for i, k in enumerate(self._keys) if q in k]
+        raise ValueError(f"Unknown bitmap operation '{op}'.")
+
+    def bitmap(self, op: str, q: str) -> np.ndarray:
+        """Bitmap compactado das linhas cujo valor atende a (op, q)."""
+        rows = self._select(op, q)
+        if not rows:
+            return np.zeros(self._bits.shape[1], dtype=np.uint8)
+        return np.bitwise_or.reduce(self._bits[rows], axis=0)
+
+    def to_mask(self, bits: np.ndarray) -> np.ndarray:
+        return np.unpackbits(bits, count=self._size).astype(bool)
+
+    def matcher(self, op: str, q: str) -> Callable[[int, int], np.ndarray]:
+        """f(lo, hi) -> máscara das linhas [lo, hi); o bitmap é descompactado uma vez."""
+        mask = self.to_mask(self.bitmap(op, q))
+        return lambda lo, hi: mask[lo:hi]
+
+def bitmap_and(bitmaps: List[np.ndarray]) -> np.ndarray:
+    """AND de bitmaps compactados do mesmo catálogo."""
+    return np.bitwise_and.reduce(np.stack(bitmaps), axis=0)
+
+# -----------------------------
+# Colunas codificadas por dicionário
+# -----------------------------
+def _code_dtype(n_uniques: int) -> np.dtype:
+    """Menor inteiro com sinal que endereça n_uniques valores."""
+    for dtype in (np.int8, np.int16, np.int32):
+        if n_uniques <= np.iinfo(dtype).max:
+            return np.dtype(dtype)
+    return np.dtype(np.int64)
+
+class EncodedColumn:
+    """
+    Coluna repetitiva guardada como códigos + tabela de valores distintos.
+
+    - `codes`: um inteiro por linha (int8/int16/int32 conforme o nº de distintos)
+      no lugar do ponteiro de 8 bytes do array object
+    - `uniques`: cada texto distinto uma vez, na ordem de primeira ocorrência
+    - Lê como o array somente-leitura das demais colunas: len(), col[rows], col[lo:hi]
+      decodificam só as linhas pedidas
+    """
+    __slots__ = ("codes", "uniques")
+
+    def __init__(self, values):
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        self.codes = codes.astype(_code_dtype(len(uniques)))
+        self.uniques = np.asarray(uniques, dtype=object)
+        self.codes.flags.writeable = False
+        self.uniques.flags.writeable = False
+
+    def __len__(self) -> int:
+        return len(self.codes)
+
+    def __getitem__(self, rows) -> np.ndarray:
+        return self.uniques[self.codes[rows]]
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        return self.decode() if dtype is None else self.decode().astype(dtype)
+
+    def decode(self) -> np.ndarray:
+        """Coluna inteira como array object (aloca um ponteiro por linha)."""
+        return self.uniques[self.codes]
+
+    def copy(self) -> np.ndarray:
+        return self.decode()
+
+    def share_strings(self, pool: "StringPool") -> None:
+        self.uniques = pool.intern_array(self.uniques)
+        self.uniques.flags.writeable = False
+
+    def strings(self) -> List[Iterable[str]]:
+        return [self.uniques]
+
+    def values_matching(self, predicate: Callable[[object], bool]) -> Callable[[int, int], np.ndarray]:
+        """f(lo, hi) -> máscara; o predicado roda uma vez por valor distinto, não por linha."""
+        hit = np.fromiter((predicate(u) for u in self.uniques), dtype=bool, count=len(self.uniques))
+        codes = self.codes
+        return lambda lo, hi: hit[codes[lo:hi]]
+
+# -----------------------------
+# Textos compartilhados entre versões do catálogo
+# -----------------------------
+class StringPool:
+    """
+    Um único objeto str por texto distinto, compartilhado por todos os snapshots
+    do processo (versões da planilha servidas lado a lado e recargas).
+    Base legal, descrições TIPI e rótulos de ANEXO repetidos entre versões
+    ocupam memória uma vez só: o custo de uma nova versão é o que ela tem de diferente.
+    """
+
+    def __init__(self):
+        self._strings: Dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._strings)
+
+    def intern_array(self, values) -> np.ndarray:
+        """Array object com cada str trocada pela instância do pool (resolve só os distintos)."""
+        codes, uniques = pd.factorize(np.asarray(values, dtype=object), use_na_sentinel=False)
+        shared = np.empty(len(uniques), dtype=object)
+        with self._lock:
+            setdefault = self._strings.setdefault
+            for i, u in enumerate(uniques):
+                shared[i] = setdefault(u, u) if isinstance(u, str) else u
+        return shared[codes]
+
+    def share_list(self, values: List[str]) -> List[str]:
+        with self._lock:
+            setdefault = self._strings.setdefault
+            return [setdefault(v, v) for v in values]
+
+    def share_keys(self, mapping: Dict[str, int]) -> Dict[str, int]:
+        with self._lock:
+            setdefault = self._strings.setdefault
+            return {setdefault(k, k): v for k, v in mapping.items()}
+
+    def retain(self, arrays: Iterable) -> None:
+        """
+        Mantém no pool só os textos ainda usados pelos arrays/listas vivos (chamado após recargas).
+        Tudo sob o lock: um texto internado durante a limpeza não se perde. Textos de uma
+        carga ainda sem snapshot não estão em `arrays`; quem chama garante que não há
+        carga em andamento (ver _prune_string_pool).
+        """
+        with self._lock:
+            keep: Dict[str, str] = {}
+            for arr in arrays:
+                if isinstance(arr, np.ndarray):
+                    arr = pd.unique(arr)
+                for u in arr:
+                    if isinstance(u, str):
+                        keep[u] = self._strings.get(u, u)
+            self._strings = keep
+
+# -----------------------------
+# Cache LRU de resultados de busca
+# -----------------------------
+class QueryResultCache:
+    """
+    LRU limitado: chave (versão do catálogo, filtros normalizados) -> ids de linha.
+    - Paginação/repetição da mesma busca só recorta o array em cache
+    - Os arrays guardados são somente-leitura (compartilhados entre requisições)
+    - clear() é chamado quando o catálogo recarrega
+    - Contadores hits/misses/evictions para monitoramento (só get() conta;
+      peek() é para quem aproveita o cache sem nunca preenchê-lo)
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = max(0, int(maxsize))
+        self._data: "OrderedDict[tuple, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: tuple) -> Optional[np.ndarray]:
+        with self._lock:
+            ids = self._data.get(key)
+            if ids is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return ids
+
+    def peek(self, key: tuple) -> Optional[np.ndarray]:
+        """Consulta oportunista (quem chama não vai fazer put): não mexe nos contadores nem na ordem LRU."""
+        with self._lock:
+            return self._data.get(key)
+
+    def put(self, key: tuple, ids: np.ndarray) -> np.ndarray:
+        ids.flags.writeable = False
+        if self.maxsize == 0:
+            return ids
+        with self._lock:
+            self._data[key] = ids
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+                self.evictions += 1
+        return ids
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+            }
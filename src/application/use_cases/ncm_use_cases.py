@@ -1,14 +1,32 @@
 # application/use_cases/ncm_use_cases.py
 from __future__ import annotations
+import base64
+import csv
+import functools
+import hashlib
+import io
+import json
 import os
+import pickle
+import tempfile
+import threading
 import time
 import unicodedata
 import re
-from typing import List, Dict, Any, Optional
+import stat
+import sys
+from types import BuiltinFunctionType, FunctionType, MappingProxyType, MethodType, ModuleType
+from typing import Callable, Iterable, Iterator, List, Dict, Any, Optional
 
+import numpy as np
 import pandas as pd
 from importlib.resources import files, as_file  # resolve recurso do pacote
 
+from application.use_cases.ncm_indexes import (
+    BitmapIndex, BM25Index, EncodedColumn, FuzzyIndex, KeyIndex, NcmTreeIndex, QueryResultCache, StringPool, SuggestIndex,
+    TrigramIndex, bitmap_and, format_ncm_prefix,
+)
+
 # -----------------------------
 # Constantes & regex
 # -----------------------------
@@ -29,6 +47,87 @@ WANTED_COLUMNS = [
 # Ignorar apenas TIPI (NÃO ignore Exceções)
 IGNORE_SHEETS = {"TIPI"}
 
+# Versões da planilha servidas lado a lado (nome -> arquivo em infrastructure.spreadsheet_database)
+# - Escolhidas por requisição (?dataset=nome); sem o parâmetro vale NCM_DEFAULT_DATASET
+# - NCM_DATASETS="atual=Planilha_NCM.xls,proxima=Planilha_NCM4.xls" substitui a lista
+def _parse_datasets(spec: str) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for part in spec.split(","):
+        name, sep, resource = part.partition("=")
+        if sep and name.strip() and resource.strip():
+            out[name.strip()] = resource.strip()
+    return out
+
+DATASETS: Dict[str, str] = _parse_datasets(os.environ.get("NCM_DATASETS", "")) or {
+    "ncm": "Planilha_NCM.xls",
+    "ncm-xlsx": "Planilha_NCM.xlsx",
+    "ncm2": "Planilha_NCM2.xls",
+    "ncm4": "Planilha_NCM4.xls",
+}
+
+def _check_default_dataset(default: str, datasets: Dict[str, str]) -> str:
+    """Falha na importação (e não com 404 em todo /itens/* sem ?dataset=) se o padrão não existe."""
+    if default not in datasets:
+        raise ValueError(
+            f"NCM_DEFAULT_DATASET={default!r} não está em DATASETS ({', '.join(datasets)}); "
+            "confira NCM_DATASETS/NCM_DEFAULT_DATASET"
+        )
+    return default
+
+DEFAULT_DATASET = _check_default_dataset(os.environ.get("NCM_DEFAULT_DATASET", next(iter(DATASETS))), DATASETS)
+
+# Snapshot binário do catálogo normalizado (arranque rápido)
+# - Suba CATALOG_FORMAT_VERSION sempre que _normalize_df, os índices ou
+#   CatalogSnapshot mudarem: snapshots antigos passam a ser ignorados.
+# - NCM_SNAPSHOT_DIR="" desliga a persistência.
+# - Padrão no cache do usuário do processo, não no /tmp compartilhado: o snapshot é
+#   um pickle (executa código ao carregar). Ver ensure_private_dir.
+CATALOG_FORMAT_VERSION = 12
+def user_cache_dir(name: str) -> str:
+    """$XDG_CACHE_HOME/name (padrão ~/.cache/name): diretório de cache do usuário do processo."""
+    base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, name)
+
+SNAPSHOT_DIR = os.environ.get("NCM_SNAPSHOT_DIR", user_cache_dir("reforma_tributaria_ncm"))
+
+# Máximo de buscas distintas (filtros normalizados -> ids) mantidas em memória
+QUERY_CACHE_SIZE = int(os.environ.get("NCM_QUERY_CACHE_SIZE", "256"))
+
+# Linhas avaliadas por vez na paginação por cursor (search_after)
+SCAN_CHUNK = 4096
+
+# Linhas por lote na exportação em streaming (/itens/export)
+EXPORT_BATCH = 1000
+
+# Colunas devolvidas por /itens/details
+DETAIL_COLUMNS = ["ANEXO", "ITEM", "NCM", "DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO COMPLETA", "IBS", "CBS"]
+
+# Colunas pesquisáveis por texto (busca "ALL" percorre todas)
+SEARCH_COLUMNS = ["ITEM", "ANEXO", "DESCRIÇÃO DO PRODUTO", "NCM", "DESCRIÇÃO TIPI"]
+
+# Colunas pontuadas na busca por relevância (BM25); "ALL" soma todas
+RANK_COLUMNS = ["DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO TIPI", "ITEM"]
+
+# Colunas com busca aproximada (match="fuzzy"); nas demais o filtro fica "contains"
+FUZZY_COLUMNS = ["DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO TIPI"]
+
+# Colunas cujos termos alimentam o autocomplete (/itens/suggest)
+SUGGEST_COLUMNS = ["DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO TIPI"]
+
+# Colunas com índice bitmap (poucos valores distintos): match exact/prefix e "contém"
+# resolvidos pelos valores distintos, sem varrer linhas
+BITMAP_COLUMNS = ["ANEXO", "CST IBS E CBS", "CCLASSTRIB"]
+
+# Colunas repetitivas guardadas codificadas por dicionário (códigos + valores distintos)
+# - poucos distintos por muitas linhas: rótulos de ANEXO, CST/cClassTrib, alíquotas
+#   e a base legal (DESCRIÇÃO COMPLETA) repetida em cada linha do bloco
+ENCODED_COLUMNS = ["ANEXO", "CST IBS E CBS", "CCLASSTRIB", "IBS", "CBS", "DESCRIÇÃO COMPLETA"]
+
+# Modo compacto de /itens/search: a base legal vira um id (estável na versão do catálogo)
+# e o texto vai uma vez só no dicionário da resposta
+LEGAL_BASIS_COLUMN = "DESCRIÇÃO COMPLETA"
+LEGAL_BASIS_ID = "LEGAL_BASIS_ID"
+
 SPACE_RE = re.compile(r"\s+", flags=re.UNICODE)
 NON_ALNUM_RE = re.compile(r"[^0-9A-Za-zÀ-ÿ]+", flags=re.UNICODE)
 
@@ -36,7 +135,7 @@ NON_ALNUM_RE = re.compile(r"[^0-9A-Za-zÀ-ÿ]+", flags=re.UNICODE)
 LEGAL_TEXT_RE = re.compile(
     r"""(?ix)
     ^\s*
-    (art(igo)?\.?|art[ºo]?)      # Art., Artigo, Artº, Arto
+    (?:art(?:igo)?\.?|art[ºo]?)  # Art., Artigo, Artº, Arto
     [\s\-]*\d+                    # número do artigo
     | \s*§                        # parágrafo
     | \binciso\b | \bal[ií]nea\b | \bcap[uú]t\b
@@ -65,6 +164,17 @@ def normalize_visible(text):
     t = SPACE_RE.sub(" ", t).strip()
     return t
 
+def normalize_visible_series(s: pd.Series) -> pd.Series:
+    """
+    normalize_visible para uma coluna inteira (mesmo resultado, célula a célula).
+    Normaliza só os valores distintos e espalha pelos códigos: as abas repetem
+    muito (células mescladas, base legal, ANEXO), e os acessores .str de pandas
+    em colunas object são laços Python por célula — mais lentos que isto.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    normed = np.array([normalize_visible(u) for u in uniques], dtype=object)
+    return pd.Series(normed[codes], index=s.index, dtype=object)
+
 def normalize_for_compare(text, remove_accents: bool = True) -> str:
     if text is None:
         t = ""
@@ -126,6 +236,11 @@ def map_columns_to_canonical(columns: List[str]) -> dict:
 
     return mapping
 
+@functools.lru_cache(maxsize=64)
+def _canonical_field(field: str) -> str:
+    """Coluna canônica do campo de um filtro (map_columns_to_canonical é caro demais por requisição)."""
+    return map_columns_to_canonical([field]).get(field, field)
+
 def choose_engine(path: str) -> str:
     p = path.lower()
     if p.endswith(".xls"):
@@ -203,15 +318,527 @@ def _extract_anexo_label(sheet_name: str) -> str:
     # Sem sufixo → comportamento padrão
     return f"Anexo {token}" if token != "-" else "-"
 
+def _block_ffill(values: pd.Series, blocks) -> np.ndarray:
+    """
+    Forward-fill segmentado: cada vazio ("", só espaços ou NA) recebe o último
+    valor não vazio do MESMO bloco; sem valor anterior no bloco -> "".
+    Equivale a groupby(blocks).apply(lambda s: s.replace(r"^\s*$", NA).ffill()).fillna("")
+    sem chamar Python por grupo. `blocks` deve ser contíguo (ex.: cumsum de âncoras).
+    """
+    arr = values.to_numpy(dtype=object)
+    n = len(arr)
+    if n == 0:
+        return arr
+    blocks = np.asarray(blocks)
+    blank = values.isna().to_numpy() | values.astype(str).str.strip().eq("").to_numpy()
+
+    pos = np.arange(n)
+    # última linha preenchida até aqui (-1 = nenhuma)
+    last = np.maximum.accumulate(np.where(blank, -1, pos))
+    # primeira linha do bloco de cada posição
+    is_start = np.empty(n, dtype=bool)
+    is_start[0] = True
+    is_start[1:] = blocks[1:] != blocks[:-1]
+    start = np.maximum.accumulate(np.where(is_start, pos, 0))
+
+    filled = last >= start
+    out = np.full(n, "", dtype=object)
+    out[filled] = arr[last[filled]]
+    return out
+
 def _is_long_header_text(s: str) -> bool:
     if not s:
         return False
     t = str(s).strip()
     return (len(t) >= 40) and any(ch.isalpha() for ch in t)
 
+def _series_for_compare(s: pd.Series) -> pd.Series:
+    """
+    normalize_for_compare aplicado a uma coluna inteira.
+    Normaliza apenas os valores distintos (a planilha repete muito ANEXO,
+    DESCRIÇÃO TIPI etc.) e espalha o resultado pelos códigos.
+    """
+    codes, uniques = pd.factorize(s, use_na_sentinel=False)
+    normed = [normalize_for_compare(u, True) for u in uniques]
+    return pd.Series(
+        pd.Index(normed, dtype=object).take(codes).to_numpy(dtype=object),
+        index=s.index,
+        dtype=object,
+    )
+
+def ncm_key(text) -> str:
+    """Chave de NCM sem separadores: "0101.21.00", "0101 21 00" e "01012100" -> "01012100"."""
+    return normalize_for_compare(text, True).replace(" ", "")
+
+NCM_EXACT_RE = re.compile(r"\d{4}\.\d{2}\.\d{2}")
+NCM_PREFIX_RE = re.compile(r"[\d.\s]+")
+# NCM parcial (prefixo da hierarquia): "01", "0101", "0101.2", "010121", "0101.21.0"
+NCM_PARTIAL_RE = re.compile(r"\d{2,4}|\d{4}\.?\d{1,2}|\d{4}\.?\d{2}\.?\d{1,2}")
+
 # -----------------------------
 # Cache e carregamento
 # -----------------------------
+# Textos das colunas/payloads compartilhados por todos os snapshots do processo
+STRING_POOL = StringPool()
+
+def _frozen_array(values) -> np.ndarray:
+    arr = np.asarray(values, dtype=object)
+    arr.flags.writeable = False
+    return arr
+
+def _compare_values(col) -> np.ndarray:
+    """normalize_for_compare de uma coluna do snapshot (EncodedColumn: só os valores distintos)."""
+    if isinstance(col, EncodedColumn):
+        normed = np.array([normalize_for_compare(u, True) for u in col.uniques], dtype=object)
+        return normed[col.codes]
+    return _series_for_compare(pd.Series(col, dtype=object)).to_numpy(dtype=object)
+
+def _store_column(name: str, values):
+    """Coluna do snapshot: EncodedColumn nas ENCODED_COLUMNS, array object somente-leitura nas demais."""
+    if isinstance(values, EncodedColumn):
+        values.share_strings(STRING_POOL)
+        return values
+    if name in ENCODED_COLUMNS:
+        col = EncodedColumn(values)
+        col.share_strings(STRING_POOL)
+        return col
+    return _frozen_array(STRING_POOL.intern_array(values))
+
+def _build_api_rows(columns, n: int) -> tuple:
+    """
+    Monta UMA vez por carga o dict de cada linha no formato de to_api_rows
+    (mesmas chaves, mesma normalização visual), para /itens/search só
+    recortar a página.
+    """
+    blank = np.full(n, "", dtype=object)
+    return _api_rows_from_visible({
+        c: normalize_visible_series(pd.Series(np.asarray(columns.get(c, blank)), dtype=object))
+        for c in WANTED_COLUMNS
+    })
+
+def _api_rows_from_visible(visible: Dict[str, Any]) -> tuple:
+    """
+    Payloads a partir das colunas de WANTED_COLUMNS já com normalize_visible.
+    Cada linha é um MappingProxyType: compartilhada por todas as requisições,
+    ninguém consegue alterá-la (api_rows devolve cópias mutáveis).
+    """
+    values = [STRING_POOL.intern_array(visible[c]) for c in WANTED_COLUMNS]
+    return tuple(MappingProxyType(dict(zip(WANTED_COLUMNS, vals))) for vals in zip(*values))
+
+def _share_api_rows(rows: tuple) -> tuple:
+    """Payloads vindos do snapshot em disco com os textos trocados pelos do STRING_POOL."""
+    return _api_rows_from_visible({c: [r[c] for r in rows] for c in WANTED_COLUMNS})
+
+class CatalogSnapshot:
+    """
+    Snapshot imutável e versionado do catálogo (uma carga da planilha).
+
+    - Colunas guardadas como arrays numpy somente-leitura; nada é copiado por requisição
+    - ENCODED_COLUMNS guardadas como EncodedColumn (códigos + valores distintos)
+    - Buscas devolvem ids de linha; só as linhas pedidas viram DataFrame (take)
+      ou payload da API (api_rows, pré-montado na carga)
+    - `version` vem do hash da planilha: igual em todos os workers que servem o mesmo arquivo
+    - É trocado de uma vez só no reload; quem já tem um snapshot continua com ele
+    """
+    __slots__ = (
+        "version", "columns", "norm", "trigrams", "bm25", "fuzzy",
+        "ncm_exact", "ncm_keys", "ncm_tree", "item_keys", "suggest", "rows", "legal_basis", "bitmaps",
+    )
+
+    def __init__(
+            self,
+            df: pd.DataFrame,
+            version: str,
+            norm: Optional[Dict[str, np.ndarray]] = None,
+            visible: Optional[Dict[str, np.ndarray]] = None,
+    ):
+        """
+        `norm`/`visible` (opcionais) são as colunas já normalizadas para comparação
+        e para os payloads, vindas dos segmentos por aba; sem elas são calculadas de `df`.
+        """
+        set_ = object.__setattr__
+        set_(self, "version", version)
+        set_(self, "columns", MappingProxyType({
+            str(c): _store_column(str(c), df[c].to_numpy(dtype=object)) for c in df.columns
+        }))
+        # Versões "para comparação" (sem acento, minúsculas, pontuação -> espaço)
+        # das colunas pesquisáveis, calculadas uma única vez por carga
+        if norm is None:
+            norm = {c: _series_for_compare(df[c]).to_numpy(dtype=object) for c in SEARCH_COLUMNS if c in df.columns}
+        norm = {c: _frozen_array(STRING_POOL.intern_array(v)) for c, v in norm.items()}
+        set_(self, "norm", MappingProxyType(norm))
+        # Índice de trigramas por coluna para a busca "contains"
+        set_(self, "trigrams", MappingProxyType({c: TrigramIndex(v) for c, v in norm.items()}))
+        # Pesos BM25 por coluna para a busca ordenada por relevância
+        set_(self, "bm25", MappingProxyType({c: BM25Index(norm[c]) for c in RANK_COLUMNS if c in norm}))
+        # Vocabulário + vizinhança de deleções para a busca tolerante a erros
+        set_(self, "fuzzy", MappingProxyType({c: FuzzyIndex(norm[c]) for c in FUZZY_COLUMNS if c in norm}))
+        # Bitmaps por valor distinto (normalizado) das colunas de baixa cardinalidade
+        set_(self, "bitmaps", MappingProxyType({
+            c: BitmapIndex(norm[c] if c in norm else _compare_values(self.columns[c]))
+            for c in BITMAP_COLUMNS if c in self.columns
+        }))
+        # Índices hash de igualdade
+        # - ncm_exact: NCM como está na planilha (busca "0000.00.00" em /search)
+        # - ncm_keys: NCM normalizado, com e sem pontos (/details)
+        # - item_keys: ITEM normalizado (/details)
+        blank = np.full(len(df), "", dtype=object)
+        ncm = self.columns.get("NCM", blank)
+        set_(self, "ncm_exact", KeyIndex([str(x).strip() for x in ncm]))
+        set_(self, "ncm_keys", KeyIndex([k.replace(" ", "") for k in norm.get("NCM", blank)]))
+        set_(self, "item_keys", KeyIndex(norm.get("ITEM", blank)))
+        # Linhas ordenadas pelos dígitos do NCM: prefixos da hierarquia viram intervalos
+        set_(self, "ncm_tree", NcmTreeIndex(ncm))
+        # Prefixos ordenados (NCM e termos) para o autocomplete
+        set_(self, "suggest", SuggestIndex(ncm, [norm[c] for c in SUGGEST_COLUMNS if c in norm]))
+        set_(self, "rows", _build_api_rows(self.columns, len(df)) if visible is None else _api_rows_from_visible(visible))
+        # Base legal dos payloads codificada: id = posição do texto na tabela (ordem de 1ª ocorrência)
+        set_(self, "legal_basis", EncodedColumn([r[LEGAL_BASIS_COLUMN] for r in self.rows]))
+        self._share_index_strings()
+
+    def __setattr__(self, name, value):
+        raise AttributeError("CatalogSnapshot is read-only")
+
+    def __delattr__(self, name):
+        raise AttributeError("CatalogSnapshot is read-only")
+
+    # pickle (snapshot binário): restaura slots sem passar pelo __setattr__ bloqueado
+    def __getstate__(self):
+        return {
+            "version": self.version,
+            "columns": dict(self.columns),
+            "norm": dict(self.norm),
+            "trigrams": dict(self.trigrams),
+            "bm25": dict(self.bm25),
+            "fuzzy": dict(self.fuzzy),
+            "bitmaps": dict(self.bitmaps),
+            "ncm_exact": self.ncm_exact,
+            "ncm_keys": self.ncm_keys,
+            "ncm_tree": self.ncm_tree,
+            "item_keys": self.item_keys,
+            "suggest": self.suggest,
+            "rows": tuple(dict(r) for r in self.rows),       # mappingproxy não é serializável
+            "legal_basis": self.legal_basis,
+        }
+
+    def __setstate__(self, state):
+        set_ = object.__setattr__
+        for name in ("columns", "norm", "trigrams", "bm25", "fuzzy", "bitmaps"):
+            values = state[name]
+            if name == "columns":
+                values = {k: _store_column(k, v) for k, v in values.items()}
+            elif name == "norm":
+                values = {k: _frozen_array(STRING_POOL.intern_array(v)) for k, v in values.items()}
+            state[name] = MappingProxyType(values)
+        state["rows"] = _share_api_rows(state["rows"])
+        for name in self.__slots__:
+            set_(self, name, state[name])
+        self._share_index_strings()
+
+    def __len__(self) -> int:
+        for arr in self.columns.values():
+            return len(arr)
+        return 0
+
+    def _indexes(self) -> list:
+        return [
+            *self.trigrams.values(), *self.bm25.values(), *self.fuzzy.values(), *self.bitmaps.values(),
+            self.ncm_exact, self.ncm_keys, self.ncm_tree, self.item_keys, self.suggest,
+            self.legal_basis,
+        ]
+
+    def _share_index_strings(self) -> None:
+        # vocabulários/chaves dos índices também vêm do STRING_POOL (entre versões)
+        for index in self._indexes():
+            index.share_strings(STRING_POOL)
+
+    def string_arrays(self) -> Iterator:
+        """Textos do snapshot, colunas e índices (para StringPool.retain)."""
+        for col in self.columns.values():
+            yield col.uniques if isinstance(col, EncodedColumn) else col
+        yield from self.norm.values()
+        for c in WANTED_COLUMNS:
+            yield np.fromiter((r[c] for r in self.rows), dtype=object, count=len(self.rows))
+        for index in self._indexes():
+            yield from index.strings()
+
+    def column(self, name: str) -> np.ndarray:
+        """Coluna inteira (array somente-leitura, sem cópia; EncodedColumn é decodificada)."""
+        col = self.columns[name]
+        return col.decode() if isinstance(col, EncodedColumn) else col
+
+    def memory_report(self) -> List[Dict[str, Any]]:
+        """
+        Memória por coluna do snapshot.
+        - row_bytes: códigos (dictionary) ou ponteiros (plain), um por linha
+        - dictionary_bytes: tabela de valores distintos (só dictionary)
+        - text_bytes: os textos distintos em si (compartilhados via STRING_POOL
+          com payloads, outras colunas e outras versões)
+        - plain_bytes: o que a coluna ocuparia como array object
+        """
+        out: List[Dict[str, Any]] = []
+        for name, col in self.columns.items():
+            if isinstance(col, EncodedColumn):
+                uniques = col.uniques
+                row_bytes, dictionary_bytes = col.codes.nbytes, uniques.nbytes
+                encoding, code_type = "dictionary", str(col.codes.dtype)
+            else:
+                uniques = pd.unique(col)
+                row_bytes, dictionary_bytes = col.nbytes, 0
+                encoding, code_type = "plain", None
+            text_bytes = int(sum(sys.getsizeof(u) for u in uniques))
+            out.append({
+                "column": name,
+                "encoding": encoding,
+                "code_type": code_type,
+                "rows": len(col),
+                "distinct": len(uniques),
+                "row_bytes": int(row_bytes),
+                "dictionary_bytes": int(dictionary_bytes),
+                "text_bytes": text_bytes,
+                "total_bytes": int(row_bytes + dictionary_bytes + text_bytes),
+                "plain_bytes": int(len(col) * np.dtype(object).itemsize + text_bytes),
+            })
+        return out
+
+    # estruturas além das colunas, na ordem do relatório
+    STRUCTURES = (
+        "rows", "norm", "trigrams", "bm25", "fuzzy", "bitmaps", "suggest",
+        "ncm_exact", "ncm_keys", "ncm_tree", "item_keys", "legal_basis",
+    )
+
+    def structures_report(self) -> List[Dict[str, Any]]:
+        """
+        Memória do que não é coluna: payloads da API (rows), colunas normalizadas
+        (norm) e índices. Cada objeto conta uma vez só: textos já contados nas
+        colunas (ou numa estrutura anterior) não entram de novo.
+        """
+        seen: set = set()
+        for col in self.columns.values():
+            _deep_sizeof(col, seen)
+        return [{"structure": name, "bytes": _deep_sizeof(getattr(self, name), seen)} for name in self.STRUCTURES]
+
+    def take(self, rows) -> pd.DataFrame:
+        """DataFrame com apenas as linhas pedidas (índice = id da linha no catálogo)."""
+        rows = np.asarray(rows, dtype=np.int64)
+        return pd.DataFrame(
+            {c: arr[rows] for c, arr in self.columns.items()},
+            index=pd.Index(rows),
+            columns=list(self.columns),
+        )
+
+    def to_frame(self) -> pd.DataFrame:
+        """Cópia completa e mutável do catálogo (compatibilidade com ItemsCache.df())."""
+        return pd.DataFrame(
+            {c: arr.copy() for c, arr in self.columns.items()},
+            columns=list(self.columns),
+        )
+
+    def api_rows(self, rows) -> list[dict]:
+        """Payloads prontos (formato de to_api_rows) das linhas pedidas."""
+        prebuilt = self.rows
+        return [dict(prebuilt[i]) for i in rows]
+
+    def api_rows_compact(self, rows) -> tuple[list[dict], Dict[int, str]]:
+        """
+        api_rows com DESCRIÇÃO COMPLETA trocada por LEGAL_BASIS_ID
+        + dicionário id -> texto só das bases legais usadas nessas linhas.
+        """
+        prebuilt, codes, texts = self.rows, self.legal_basis.codes, self.legal_basis.uniques
+        out: list[dict] = []
+        used: Dict[int, str] = {}
+        for i in rows:
+            lid = int(codes[i])
+            used[lid] = texts[lid]
+            out.append({
+                (LEGAL_BASIS_ID if k == LEGAL_BASIS_COLUMN else k): (lid if k == LEGAL_BASIS_COLUMN else v)
+                for k, v in prebuilt[i].items()
+            })
+        return out, used
+
+    def matcher(self, col: str, q_norm: str, remove_accents: bool = True) -> Callable[[int, int], np.ndarray]:
+        """f(lo, hi) -> máscara das linhas [lo, hi) cuja coluna (normalizada) contém q_norm."""
+        if remove_accents and col in self.bitmaps:
+            return self.bitmaps[col].matcher("contains", q_norm)
+        if remove_accents and col in self.trigrams:
+            return self.trigrams[col].matcher(q_norm)
+        # sem remoção de acento não há índice: normaliza e varre na hora
+        values = self.columns[col]
+        if isinstance(values, EncodedColumn):
+            # coluna codificada: normaliza cada valor distinto uma vez só
+            return values.values_matching(
+                lambda x: q_norm in normalize_for_compare(x, remove_accents=remove_accents)
+            )
+
+        def scan(lo: int, hi: int) -> np.ndarray:
+            part = values[lo:hi]
+            return np.fromiter(
+                (q_norm in normalize_for_compare(x, remove_accents=remove_accents) for x in part),
+                dtype=bool,
+                count=len(part),
+            )
+        return scan
+
+    def contains(self, col: str, q_norm: str, remove_accents: bool = True) -> np.ndarray:
+        """Máscara booleana de linhas cuja coluna (normalizada) contém q_norm."""
+        return self.matcher(col, q_norm, remove_accents)(0, len(self))
+
+    def fuzzy_matcher(self, cols: List[str], q_norm: str) -> Callable[[int, int], np.ndarray]:
+        """
+        f(lo, hi) -> máscara das linhas [lo, hi) em que alguma das colunas contém
+        q_norm OU em que CADA token da consulta casa, tolerando erros de digitação,
+        em alguma das colunas (sempre sem acento). Colunas sem FuzzyIndex
+        comparam o token por "contains".
+        """
+        exact = [self.matcher(c, q_norm, True) for c in cols]
+        per_token = [
+            [self.fuzzy[c].matcher(token) if c in self.fuzzy else self.matcher(c, token, True) for c in cols]
+            for token in sorted(set(q_norm.split()))
+        ]
+
+        def match(lo: int, hi: int) -> np.ndarray:
+            m = np.ones(max(hi - lo, 0), dtype=bool)
+            for parts in per_token:
+                any_col = parts[0](lo, hi)
+                for part in parts[1:]:
+                    any_col = any_col | part(lo, hi)
+                m &= any_col
+            for part in exact:
+                m |= part(lo, hi)
+            return m
+        return match
+
+    def rank_scores(self, q_norm: str, cols: List[str]) -> np.ndarray:
+        """Score BM25 de cada linha (soma das colunas pedidas); 0 = nenhum termo em comum."""
+        tokens = q_norm.split()
+        total = np.zeros(len(self), dtype=np.float32)
+        for c in cols:
+            if c in self.bm25:
+                total += self.bm25[c].scores(tokens)
+        return total
+
+def _file_digest(path: str) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+def _file_signature(path: str) -> tuple:
+    """(mtime_ns, tamanho, inode): muda com regravação no mesmo segundo e com troca por rename."""
+    st = os.stat(path)
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
+# código/singletons: não são dados do catálogo
+_NOT_DATA = (type, bool, ModuleType, FunctionType, BuiltinFunctionType, MethodType)
+
+def _deep_sizeof(obj: Any, seen: set) -> int:
+    """
+    Bytes de `obj` e de tudo o que ele referencia (containers, arrays numpy,
+    atributos de instâncias), contando cada objeto uma vez (ids em `seen`).
+    """
+    if id(obj) in seen or obj is None or isinstance(obj, _NOT_DATA):
+        return 0
+    seen.add(id(obj))
+    if isinstance(obj, np.ndarray):
+        if isinstance(obj.base, np.ndarray):
+            return _deep_sizeof(obj.base, seen)      # view: a memória é do array base
+        size = obj.nbytes
+        if obj.dtype == object:
+            size += sum(_deep_sizeof(v, seen) for v in obj.ravel().tolist())
+        return size
+    size = sys.getsizeof(obj)
+    if isinstance(obj, (str, bytes, int, float)):
+        return size
+    if isinstance(obj, MappingProxyType):
+        # o dict por trás da proxy não é acessível: mede uma cópia (sem registrá-la em `seen`)
+        size += sys.getsizeof(dict(obj))
+    if isinstance(obj, (dict, MappingProxyType)):
+        return size + sum(_deep_sizeof(k, seen) + _deep_sizeof(v, seen) for k, v in obj.items())
+    if isinstance(obj, (list, tuple, set, frozenset)):
+        return size + sum(_deep_sizeof(v, seen) for v in obj)
+    for klass in type(obj).__mro__:
+        for slot in getattr(klass, "__slots__", ()):
+            size += _deep_sizeof(getattr(obj, slot, None), seen)
+    if hasattr(obj, "__dict__"):
+        size += _deep_sizeof(vars(obj), seen)
+    return size
+
+def ensure_private_dir(path: str) -> bool:
+    """
+    Cria (0700) ou valida um diretório privado do usuário do processo.
+    False se não é um diretório de verdade (ex.: symlink), pertence a outro usuário
+    ou tem escrita para grupo/outros: nada deve ser lido nem gravado ali.
+    Diretório nosso só com leitura para grupo/outros é fechado para 0700.
+    """
+    try:
+        os.makedirs(path, mode=0o700, exist_ok=True)
+        st = os.lstat(path)
+        if not stat.S_ISDIR(st.st_mode) or not _owned_by_us(st):
+            return False
+        if st.st_mode & 0o022:
+            return False
+        if st.st_mode & 0o077:
+            os.chmod(path, 0o700)
+        return True
+    except OSError:
+        return False
+
+def _owned_by_us(st: os.stat_result) -> bool:
+    return not hasattr(os, "getuid") or st.st_uid == os.getuid()
+
+def _snapshot_path(digest: str) -> str:
+    return os.path.join(SNAPSHOT_DIR, f"catalog-v{CATALOG_FORMAT_VERSION}-{digest}.pkl")
+
+def _read_snapshot(digest: str) -> Optional[dict]:
+    """Lê o snapshot do catálogo; qualquer problema => None (reconstrói a partir da planilha)."""
+    if not SNAPSHOT_DIR or not ensure_private_dir(SNAPSHOT_DIR):
+        return None
+    try:
+        fd = os.open(_snapshot_path(digest), os.O_RDONLY | getattr(os, "O_NOFOLLOW", 0))
+        with os.fdopen(fd, "rb") as fh:
+            # só arquivo regular, nosso e sem escrita para grupo/outros (mkstemp grava 0600)
+            st = os.fstat(fh.fileno())
+            if not stat.S_ISREG(st.st_mode) or not _owned_by_us(st) or st.st_mode & 0o022:
+                return None
+            payload = pickle.load(fh)
+        snapshot = payload["snapshot"]
+        if payload.get("version") != CATALOG_FORMAT_VERSION or not isinstance(snapshot, CatalogSnapshot):
+            return None
+        if not all(hasattr(snapshot, slot) for slot in CatalogSnapshot.__slots__):
+            return None
+        return payload
+    except Exception:
+        return None
+
+def _write_snapshot(
+        digest: str,
+        snapshot: CatalogSnapshot,
+        debug_sheets: Dict[str, Dict[str, Any]],
+        sheets: List[tuple],
+) -> None:
+    """Grava o snapshot de forma atômica (arquivo temporário + rename). Falhas são ignoradas."""
+    if not SNAPSHOT_DIR or not ensure_private_dir(SNAPSHOT_DIR):
+        return
+    payload = {
+        "version": CATALOG_FORMAT_VERSION,
+        "snapshot": snapshot,
+        "debug_sheets": debug_sheets,
+        "sheets": sheets,
+    }
+    tmp_path = None
+    try:
+        fd, tmp_path = tempfile.mkstemp(dir=SNAPSHOT_DIR, suffix=".tmp")
+        with os.fdopen(fd, "wb") as fh:
+            pickle.dump(payload, fh, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, _snapshot_path(digest))
+        tmp_path = None
+    except Exception:
+        pass
+    finally:
+        if tmp_path and os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
 class ItemsCache:
     """
     Em 'Exceções':
@@ -232,9 +859,18 @@ class ItemsCache:
         self._resource = resource
 
         self._resolved_path: Optional[str] = None
-        self._df: Optional[pd.DataFrame] = None
-        self._mtime: Optional[float] = None
+        self._snapshot: Optional[CatalogSnapshot] = None
+        # stat da planilha (mtime_ns, tamanho, inode) tirado ANTES da carga do snapshot atual
+        self._file_sig: Optional[tuple] = None
         self._debug_sheets: Dict[str, Dict[str, Any]] = {}
+        # Abas do snapshot atual: (nome, hash do conteúdo, início, fim) -> base da recarga incremental
+        self._sheets: List[tuple] = []
+        # Como foi a última carga (snapshot em disco ou planilha; abas relidas/reaproveitadas)
+        self._load_stats: Dict[str, Any] = {}
+        # Serializa recargas; leitores concorrentes seguem com o snapshot anterior
+        self._reload_lock = threading.Lock()
+        # Resultados de busca por (versão, filtros normalizados); esvaziado a cada recarga
+        self._results = QueryResultCache(QUERY_CACHE_SIZE)
 
     def _resolve_excel_path(self) -> str:
         if self._explicit_path and os.path.exists(self._explicit_path):
@@ -251,12 +887,13 @@ class ItemsCache:
     def _needs_reload(self) -> bool:
         try:
             path = self._resolved_path or self._resolve_excel_path()
-            mtime = os.path.getmtime(path)
+            sig = _file_signature(path)
         except FileNotFoundError:
             return True
-        return (self._df is None) or (self._mtime != mtime)
+        return (self._snapshot is None) or (self._file_sig != sig)
 
-    def _normalize_df(self, df: pd.DataFrame, *, exceptions_mode: bool = False) -> pd.DataFrame:
+    @staticmethod
+    def _normalize_df(df: pd.DataFrame, *, exceptions_mode: bool = False) -> pd.DataFrame:
         # 1) Renomeia
         mapping = map_columns_to_canonical(list(df.columns))
         if mapping:
@@ -272,18 +909,17 @@ class ItemsCache:
             if len(same_named_cols) == 1:
                 out[c] = df[same_named_cols[0]]
             else:
-                merged = (
-                    df[same_named_cols]
-                    .replace(r"^\s*$", pd.NA, regex=True)
-                    .bfill(axis=1)
-                    .iloc[:, 0]
-                )
-                out[c] = merged
+                dup = df[same_named_cols]
+                blank = np.column_stack([
+                    dup.iloc[:, i].astype(str).str.strip().eq("").to_numpy()
+                    for i in range(dup.shape[1])
+                ])
+                out[c] = dup.mask(blank).bfill(axis=1).iloc[:, 0]
 
         # 3) Normalização visual
         for c in WANTED_COLUMNS:
             if c in out.columns:
-                out[c] = out[c].map(normalize_visible)
+                out[c] = normalize_visible_series(out[c])
 
         # 3.1) Correção específica para aba "Tributado":
         #      remover textos de cabeçalho que entram como dado
@@ -309,46 +945,36 @@ class ItemsCache:
 
         # 4) Preenchimentos
         if not exceptions_mode:
-            # Normaliza valores vazios para NaN antes de propagação
-            for c in ["ITEM", "DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO COMPLETA"]:
-                if c in out.columns:
-                    out[c] = out[c].replace(r"^\s*$", pd.NA, regex=True)
+            # Máscara única de vazio por coluna (após 3) as células já estão aparadas)
+            empty = {
+                c: out[c].eq("")
+                for c in ["ITEM", "DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO COMPLETA"]
+                if c in out.columns
+            }
 
             # Propaga ITEM e DESCRIÇÃO DO PRODUTO (planilhas usam células mescladas)
-            if "ITEM" in out.columns:
-                out["ITEM"] = out["ITEM"].ffill()
-
-            if "DESCRIÇÃO DO PRODUTO" in out.columns:
-                out["DESCRIÇÃO DO PRODUTO"] = out["DESCRIÇÃO DO PRODUTO"].ffill()
+            for c in ["ITEM", "DESCRIÇÃO DO PRODUTO"]:
+                if c in empty:
+                    # infer_objects antes do ffill: coluna toda vazia vira float já aqui,
+                    # sem o downcast silencioso (FutureWarning) dentro do ffill
+                    out[c] = out[c].mask(empty[c]).infer_objects(copy=False).ffill()
 
             # 🔹 PROPAGA BASE LEGAL POR BLOCO JURÍDICO (robusto p/ células mescladas)
             if "DESCRIÇÃO COMPLETA" in out.columns:
                 # Detecta linhas âncora (onde começa um texto jurídico)
-                desc_series = out["DESCRIÇÃO COMPLETA"].astype(str).str.strip()
+                desc_series = out["DESCRIÇÃO COMPLETA"]
 
                 anchor_mask = desc_series.str.contains(LEGAL_TEXT_RE, na=False)
+                out["DESCRIÇÃO COMPLETA"] = desc_series.mask(empty["DESCRIÇÃO COMPLETA"])
 
                 # Cria blocos cumulativos
-                block_id = anchor_mask.astype(int).cumsum()
-                out["__BLK"] = block_id
+                block_id = anchor_mask.astype(int).cumsum().to_numpy()
 
                 # Propaga a base legal dentro de cada bloco
-                out["DESCRIÇÃO COMPLETA"] = (
-                    out.groupby("__BLK")["DESCRIÇÃO COMPLETA"]
-                    .apply(lambda s: s.replace(r"^\s*$", pd.NA, regex=True).ffill())
-                    .fillna("")
-                    .values
-                )
-
-                # Remove coluna auxiliar
-                del out["__BLK"]
+                out["DESCRIÇÃO COMPLETA"] = _block_ffill(out["DESCRIÇÃO COMPLETA"], block_id)
 
             # Preenche vazios restantes
-            for c in out.columns:
-                out[c] = out[c].fillna("")
-
-            for c in out.columns:
-                out[c] = out[c].fillna("")
+            out = out.fillna("")
 
         else:
             # === MODO EXCEÇÕES ===
@@ -391,31 +1017,20 @@ class ItemsCache:
             )
 
             # 4.3) block_id por cumulativo de âncoras
-            block_id = anchor_mask.astype(int).cumsum()
-            out["__BLOCK_ID"] = block_id
+            block_id = anchor_mask.astype(int).cumsum().to_numpy()
 
             # 4.4) propaga por bloco apenas DESCRIÇÃO COMPLETA e DESCRIÇÃO TIPI
             for col in ["DESCRIÇÃO COMPLETA", "DESCRIÇÃO TIPI"]:
                 if col in out.columns:
-                    out[col] = (
-                        out.groupby("__BLOCK_ID")[col]
-                        .apply(lambda s: s.replace(r"^\s*$", pd.NA, regex=True).ffill())
-                        .fillna("")
-                        .values
-                    )
+                    out[col] = _block_ffill(out[col], block_id)
 
             # 4.5) fallback para TIPI em exceções (há planilhas sem âncoras formais)
             if "DESCRIÇÃO TIPI" in out.columns:
-                out["DESCRIÇÃO TIPI"] = (
-                    out["DESCRIÇÃO TIPI"]
-                    .replace(r"^\s*$", pd.NA, regex=True)
-                    .ffill()
-                    .fillna("")
-                )
+                tipi = out["DESCRIÇÃO TIPI"]
+                out["DESCRIÇÃO TIPI"] = tipi.mask(tipi.eq("")).ffill().fillna("")
 
             # 4.6) NÃO propagar ITEM/Descrição do Produto (permanece como veio)
-            for c in out.columns:
-                out[c] = out[c].fillna("")
+            out = out.fillna("")
 
             # 4.7) remover âncoras “puras” (sem NCM/ITEM/DESC PRODUTO)
             only_anchor = anchor_mask & \
@@ -423,9 +1038,6 @@ class ItemsCache:
                           out.get("DESCRIÇÃO DO PRODUTO", "").astype(str).str.strip().eq("")
             out = out.loc[~only_anchor].reset_index(drop=True)
 
-            if "__BLOCK_ID" in out.columns:
-                del out["__BLOCK_ID"]
-
         # 5) Remove linhas totalmente vazias
         empty_mask = (
             (out.get("NCM", "") == "") &
@@ -466,238 +1078,918 @@ class ItemsCache:
         if not os.path.exists(path):
             raise FileNotFoundError(f"Excel not found at: {path}")
 
+        segments = self._load_segments(path)
+        self._debug_sheets = {seg.name: seg.debug for seg in segments}
+        # NÃO re-normalizar aqui; já normalizado por aba
+        return _concat_segments(segments)[0]
+
+    def _load_segments(self, path: str) -> List[SheetSegment]:
+        """
+        Segmentos normalizados de todas as abas, na ordem do Excel.
+        - Primeira carga: parse completo, aba por aba
+        - Recarga: lê o conteúdo bruto de cada aba e compara o hash com o do snapshot atual;
+          abas iguais são recortadas do snapshot, só as alteradas são normalizadas de novo
+        """
         engine = choose_engine(path)
-        sheets = pd.read_excel(
-            path,
-            sheet_name=None,
-            engine=engine,
-            dtype=str,
-            header=None,      # detecta cabeçalho dinamicamente
-            na_filter=False,
-        )
-
-        frames: List[pd.DataFrame] = []
-        self._debug_sheets = {}
-
-        # Mantém a ordem das abas exatamente como no Excel
-        for raw_name, raw in sheets.items():
-            name = str(raw_name).strip()
-            upper_name = strip_accents(name).upper()
-
-            # Ignora apenas TIPI
-            if name.upper() in IGNORE_SHEETS:
-                continue
-
-            is_exceptions = "EXCE" in upper_name  # Exceções/Excecoes
-
-            hdr_idx = _detect_header_row(raw, max_scan=10)
-            if hdr_idx is None:
-                header_vals = [str(x) if x is not None else "" for x in list(raw.iloc[0].values)]
-                body = raw.iloc[1:].copy()
-            else:
-                header_vals = [str(x) if x is not None else "" for x in list(raw.iloc[hdr_idx].values)]
-
-                # --- CASO ESPECIAL PARA "TRIBUTADO" ---
-                if "TRIBUT" in upper_name:
-                    # A linha de cabeçalho contém dados (Base Legal)
-                    body = raw.iloc[hdr_idx:].copy()
-                else:
-                    body = raw.iloc[hdr_idx + 1:].copy()
-
-            body = body.reset_index(drop=True)
-
-            if "TRIBUT" in upper_name:
-                # Remove linha de cabeçalho duplicado dentro dos dados
-                def is_fake_header(val, target):
-                    return str(val).strip().lower() == target.lower()
-
-                mask_fake = (
-                    body.apply(lambda row:
-                               is_fake_header(row.get("ITEM", ""), "ITEM") or
-                               is_fake_header(row.get("DESCRIÇÃO DO PRODUTO", ""), "DESCRIÇÃO DO PRODUTO"),
-                               axis=1
-                               )
-                )
-
-                # Remove linhas onde ITEM ou DESCRIÇÃO DO PRODUTO são cabeçalhos falsos
-                body = body.loc[~mask_fake].reset_index(drop=True)
-
-            # equaliza colunas
-            max_cols = max(len(header_vals), body.shape[1])
-            while len(header_vals) < max_cols:
-                header_vals.append("")
-            if body.shape[1] < max_cols:
-                for k in range(body.shape[1], max_cols):
-                    body[k] = ""
-            body.columns = header_vals
-
-            # Em Exceções NÃO inferir "DESCRIÇÃO COMPLETA" por cabeçalho longo
-            if "DESCRIÇÃO COMPLETA" not in body.columns and not is_exceptions:
-                long_headers = [(i, h) for i, h in enumerate(header_vals) if _is_long_header_text(h)]
-                if long_headers:
-                    chosen_idx, chosen_text = max(long_headers, key=lambda x: len(str(x[1])))
-                    body["DESCRIÇÃO COMPLETA"] = str(chosen_text).strip()
-
-            # ANEXO
-            if "TRIBUT" in upper_name:
-                anexo_label = "Tributado"
-            elif "MONOF" in upper_name:
-                anexo_label = "MONOFÁSICO"
-            elif is_exceptions:
-                anexo_label = "Exceções"
+        previous = self._snapshot
+        known = {(name, digest): (lo, hi) for name, digest, lo, hi in self._sheets} if previous is not None else {}
+
+        if not known:
+            sheets = pd.read_excel(
+                path,
+                sheet_name=None,
+                engine=engine,
+                dtype=str,
+                header=None,      # detecta cabeçalho dinamicamente
+                na_filter=False,
+            )
+            segments = [
+                _segment_from_raw(str(raw_name).strip(), raw)
+                for raw_name, raw in sheets.items()
+                if not _is_ignored_sheet(raw_name)
+            ]
+            self._load_stats = {"source": "spreadsheet", "sheets": len(segments), "reparsed": len(segments), "reused": 0}
+            return segments
+
+        with pd.ExcelFile(path, engine=engine) as book:
+            raws = [
+                (raw_name, str(raw_name).strip(), book.parse(raw_name, header=None, dtype=str, na_filter=False))
+                for raw_name in book.sheet_names
+                if not _is_ignored_sheet(raw_name)
+            ]
+
+        segments: List[Optional[SheetSegment]] = []
+        changed: List[int] = []
+        for _, name, raw in raws:
+            digest = _sheet_digest(name, raw)
+            span = known.get((name, digest))
+            if span is None:
+                changed.append(len(segments))
+                segments.append(None)
             else:
-                anexo_label = _extract_anexo_label(name)
-            body["ANEXO"] = anexo_label
-
-            # rastro opcional
-            body["__SHEET_TAG"] = ("EXC::" + name) if is_exceptions else ("ANX::" + anexo_label)
+                debug = self._debug_sheets.get(name, {})
+                segments.append(SheetSegment.from_snapshot(previous, name, digest, debug, *span))
+
+        for i in changed:
+            segments[i] = _segment_from_raw(raws[i][1], raws[i][2])
+
+        self._load_stats = {
+            "source": "spreadsheet",
+            "sheets": len(segments),
+            "reparsed": len(changed),
+            "reused": len(segments) - len(changed),
+        }
+        return segments
+
+    def _reload(self) -> None:
+        """
+        Recarrega a planilha se ela mudou.
+        - Apenas uma thread faz o parse por vez.
+        - Se já existe um snapshot carregado, as demais threads NÃO esperam:
+          continuam usando o DataFrame anterior até a troca.
+        - Na primeira carga (sem snapshot) todas aguardam a mesma carga.
+        """
+        if not self._reload_lock.acquire(blocking=self._snapshot is None):
+            return
+        try:
+            # outra thread pode ter recarregado enquanto aguardávamos o lock
+            if not self._needs_reload():
+                return
+            # stat ANTES da carga: planilha trocada durante o parse fica com outra
+            # assinatura e a próxima chamada recarrega (no pior caso relê à toa e o
+            # hash igual mantém o snapshot)
+            try:
+                sig = _file_signature(self._resolve_excel_path())
+            except OSError:
+                sig = None
+            snapshot = self._load_snapshot()
+            # troca atômica: leitores veem o snapshot antigo ou o novo, nunca parcial
+            previous = self._snapshot
+            if snapshot is not previous:
+                self._snapshot = snapshot
+                self._results.clear()
+            self._file_sig = sig
+            if (previous is not None and snapshot is not previous) or _PRUNE_PENDING:
+                # textos só da versão antiga saem do pool (a 1ª carga não libera nada,
+                # a menos que uma limpeza tenha sido adiada à espera dela)
+                _prune_string_pool(self, snapshot)
+        finally:
+            self._reload_lock.release()
+
+    def _load_snapshot(self) -> CatalogSnapshot:
+        """
+        Monta o snapshot do catálogo.
+        Usa o snapshot binário (hash do arquivo + versão do normalizador) quando existir;
+        senão faz o parse da planilha (só das abas alteradas, se já há snapshot carregado)
+        e grava o snapshot para as próximas cargas.
+        """
+        path = self._resolve_excel_path()
+        self._resolved_path = path
+        if not os.path.exists(path):
+            raise FileNotFoundError(f"Excel not found at: {path}")
 
-            before_rows = int(body.shape[0])
-            before_cols = list(map(str, body.columns))
+        started = time.perf_counter()
+        digest = _file_digest(path)
+        current = self._snapshot
+        if current is not None and current.version == digest[:16]:
+            # só o stat mudou (arquivo regravado/tocado sem alteração): mantém o snapshot
+            return current
+        payload = _read_snapshot(digest)
+        if payload is not None:
+            self._debug_sheets = payload.get("debug_sheets", {})
+            self._sheets = payload.get("sheets", [])
+            self._load_stats = {"source": "snapshot", "seconds": round(time.perf_counter() - started, 3)}
+            return payload["snapshot"]
+
+        segments = self._load_segments(path)
+        df, norm, visible = _concat_segments(segments)
+        snapshot = CatalogSnapshot(df, version=digest[:16], norm=norm, visible=visible)
+        self._debug_sheets = {seg.name: seg.debug for seg in segments}
+        self._sheets = _segment_spans(segments)
+        self._load_stats["seconds"] = round(time.perf_counter() - started, 3)
+        _write_snapshot(digest, snapshot, self._debug_sheets, self._sheets)
+        return snapshot
+
+    @property
+    def loaded_snapshot(self) -> Optional[CatalogSnapshot]:
+        """Snapshot já carregado (None se ainda não carregou); não dispara carga."""
+        return self._snapshot
+
+    def snapshot(self) -> CatalogSnapshot:
+        """Snapshot atual (imutável). Recarrega antes se a planilha mudou."""
+        if self._needs_reload():
+            self._reload()
+        return self._snapshot
 
-            normalized = self._normalize_df(body, exceptions_mode=is_exceptions)
+    def df(self) -> pd.DataFrame:
+        """Cópia completa do catálogo. Para consultas prefira snapshot()/search_ids()."""
+        return self.snapshot().to_frame()
 
-            after_rows = int(normalized.shape[0])
-            self._debug_sheets[name] = {
-                "header_row_detected": hdr_idx,
-                "rows_before": before_rows,
-                "cols_before": before_cols[:20],
-                "rows_after": after_rows,
-                "is_exceptions": is_exceptions,
-            }
+    # -----------------------------
+    # Buscas
+    # -----------------------------
+    @staticmethod
+    def _filter_key(
+            snap: CatalogSnapshot,
+            field: str | None,
+            q: str | None,
+            remove_accents: bool = True,
+            match: str = "contains",
+    ) -> tuple[str, str] | None:
+        """
+        Forma normalizada de UM filtro (field, q) -> (coluna, consulta).
+        None = filtro vazio (não restringe). Serve de chave do cache de resultados.
+        match="fuzzy" -> coluna prefixada com "~" (busca aproximada, sempre sem acento).
+        match="exact"/"prefix" em BITMAP_COLUMNS -> coluna prefixada com "="/"^" (bitmap, sem acento);
+        nas demais colunas seguem "contém".
+        """
+        if not q:
+            return None
+
+        q_clean = q.strip()
+
+        # 🔥 1) Se o valor é um NCM exato → busca EXATA!
+        if NCM_EXACT_RE.fullmatch(q_clean):
+            return ("=NCM", q_clean)
+
+        # 🔥 1b) NCM parcial → sub-árvore da hierarquia (prefixo)
+        # - campo NCM: "01" (capítulo), "0101", "0101.2", "01012100"... só o prefixo
+        # - ALL (contains): com ponto ou 4+ dígitos -> sub-árvore OU "contém" em todas
+        #   as colunas ("0206" também aparece em textos e ITENS); "01" segue só "contém"
+        if NCM_PARTIAL_RE.fullmatch(q_clean):
+            digits = q_clean.replace(".", "")
+            if field and field.upper() == "NCM":
+                return ("^NCM", digits)
+            if (not field or field.upper() == "ALL") and match == "contains" and ("." in q_clean or len(digits) >= 4):
+                return ("^NCM|ALL", q_clean)
+
+        # 🔥 2) Busca normal (contains) ou aproximada (fuzzy) para textos
+        fuzzy = match == "fuzzy"
+        canon = _canonical_field(field) if field and field.upper() != "ALL" else field
+        bitmap_op = match in ("exact", "prefix") and canon in snap.bitmaps
+        q_norm = normalize_for_compare(q_clean, remove_accents=remove_accents or fuzzy or bitmap_op)
+        if fuzzy:
+            prefix = "~"
+        elif bitmap_op:
+            prefix = "=" if match == "exact" else "^"
+        else:
+            prefix = ""
 
-            if after_rows > 0:
-                frames.append(normalized)
+        if not field or field.upper() == "ALL":
+            return (prefix + "ALL", q_norm)
+
+        # Campo específico
+        if canon not in snap.columns:
+            return None
+        return (prefix + canon, q_norm)
+
+    @staticmethod
+    def _unpack_filter(flt: tuple) -> tuple[str | None, str | None, str]:
+        """(field, q) ou (field, q, match) -> (field, q, match)."""
+        field, q, *rest = flt
+        return field, q, (rest[0] if rest and rest[0] else "contains")
+
+    @staticmethod
+    def _filter_matcher(
+            snap: CatalogSnapshot,
+            key: tuple[str, str],
+            remove_accents: bool = True,
+    ) -> Callable[[int, int], np.ndarray] | None:
+        """
+        Filtro já normalizado (ver _filter_key) -> f(lo, hi) com a máscara das linhas [lo, hi).
+        A consulta é resolvida nos índices uma vez; cada chamada só aplica o resultado à fatia.
+        """
+        col, q_norm = key
+        if col == "=NCM":
+            return lambda lo, hi: snap.ncm_exact.mask(q_norm, lo, hi)
+        if col == "^NCM":
+            subtree = snap.ncm_tree.mask(q_norm)
+            return lambda lo, hi: subtree[lo:hi]
+        if col == "^NCM|ALL":
+            subtree = snap.ncm_tree.mask(q_norm.replace(".", ""))
+            contains = ItemsCache._filter_matcher(snap, ("ALL", normalize_for_compare(q_norm, remove_accents)), remove_accents)
+            if contains is None:
+                return lambda lo, hi: subtree[lo:hi]
+            return lambda lo, hi: subtree[lo:hi] | contains(lo, hi)
+        if col[:1] in ("=", "^") and col[1:] in snap.bitmaps:
+            return snap.bitmaps[col[1:]].matcher("exact" if col[0] == "=" else "prefix", q_norm)
+
+        if col.startswith("~"):
+            col = col.lstrip("~")
+            cols = [c for c in SEARCH_COLUMNS if c in snap.columns] if col == "ALL" else [col]
+            return snap.fuzzy_matcher(cols, q_norm) if cols else None
+
+        if col == "ALL":
+            parts = [
+                snap.matcher(c, q_norm, remove_accents)
+                for c in SEARCH_COLUMNS if c in snap.columns
+            ]
+            if not parts:
+                return None
 
-        if not frames:
-            return pd.DataFrame(columns=WANTED_COLUMNS)
+            def any_column(lo: int, hi: int) -> np.ndarray:
+                m = parts[0](lo, hi)
+                for part in parts[1:]:
+                    m = m | part(lo, hi)
+                return m
+            return any_column
+
+        return snap.matcher(col, q_norm, remove_accents)
+
+    @staticmethod
+    def _filter_bitmap(
+            snap: CatalogSnapshot,
+            key: tuple[str, str],
+            remove_accents: bool = True,
+    ) -> np.ndarray | None:
+        """Bitmap compactado do filtro quando ele é resolvido por BitmapIndex (senão None)."""
+        col, q_norm = key
+        if col[:1] in ("=", "^") and col[1:] in snap.bitmaps:
+            return snap.bitmaps[col[1:]].bitmap("exact" if col[0] == "=" else "prefix", q_norm)
+        if remove_accents and col in snap.bitmaps:
+            return snap.bitmaps[col].bitmap("contains", q_norm)
+        return None
+
+    def _filter_keys(
+            self,
+            snap: CatalogSnapshot,
+            filters: list[tuple[str | None, str | None]],
+            remove_accents: bool = True,
+    ) -> list[tuple[str, str]]:
+        keys = [
+            self._filter_key(snap, field, q, remove_accents, match)
+            for field, q, match in map(self._unpack_filter, filters[:2])
+        ]
+        return sorted({k for k in keys if k is not None})  # AND é comutativo
+
+    def search_ids(
+            self,
+            filters: list[tuple[str | None, str | None]],
+            remove_accents: bool = True,
+            snap: Optional[CatalogSnapshot] = None,
+    ) -> np.ndarray:
+        """
+        Ids (ordenados, somente-leitura) das linhas que atendem a até dois filtros
+        combinados com AND. Nada do catálogo é copiado; use snapshot().take(ids)
+        ou snapshot().api_rows(ids) para materializar linhas.
+        Resultados ficam no cache LRU por (versão do catálogo, filtros normalizados).
+        """
+        snap = snap or self.snapshot()
+        keys = self._filter_keys(snap, filters, remove_accents)
+
+        cache_key = (snap.version, remove_accents, tuple(keys))
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        n = len(snap)
+        combined = None
+        bitmaps = []
+        for key in keys:
+            bits = self._filter_bitmap(snap, key, remove_accents)
+            if bits is not None:
+                bitmaps.append(bits)
+                continue
+            matcher = self._filter_matcher(snap, key, remove_accents)
+            if matcher is not None:
+                m = matcher(0, n)
+                combined = m if combined is None else (combined & m)
+        if bitmaps:
+            # filtros de bitmap: AND ainda compactado, uma descompactação só
+            m = np.unpackbits(bitmap_and(bitmaps), count=n).astype(bool)
+            combined = m if combined is None else (combined & m)
+        if combined is None:
+            ids = np.arange(n, dtype=np.int64)
+        else:
+            ids = np.flatnonzero(combined)
+        return self._results.put(cache_key, ids)
 
-        # NÃO re-normalizar aqui; já normalizado por aba
-        df_all = pd.concat(frames, ignore_index=True)
-        return df_all
+    def search_ranked(
+            self,
+            filters: list[tuple[str | None, str | None]],
+            remove_accents: bool = True,
+            snap: Optional[CatalogSnapshot] = None,
+    ) -> np.ndarray:
+        """
+        Como search_ids, mas ordenado por relevância (BM25) do 1º filtro:
+        - o 1º filtro pontua os termos em RANK_COLUMNS ("ALL") ou na coluna pedida,
+          e entram as linhas com pelo menos um termo da consulta
+        - 1º filtro fuzzy: entram as linhas do filtro aproximado, pontuadas pelos
+          termos do vocabulário que casaram com a consulta (ex.: "integal" -> "integral")
+        - o 2º filtro só restringe (contains ou fuzzy)
+        - empates ficam na ordem da planilha
+        - 1º filtro vazio, só palavras vazias, NCM (exato/parcial) ou coluna sem BM25
+          (ANEXO, NCM) -> search_ids
+        O resultado ordenado vai para o mesmo cache LRU: paginar só recorta o array.
+        """
+        snap = snap or self.snapshot()
+        first = self._filter_keys(snap, filters[:1], remove_accents)
+        if not first or first[0][0] in ("=NCM", "^NCM", "^NCM|ALL"):
+            return self.search_ids(filters, remove_accents, snap)
+        key = first[0]
+        col, q_norm = key
+        fuzzy = col.startswith("~")
+        col = col.lstrip("~")
+        cols = RANK_COLUMNS if col == "ALL" else [col]
+        rank_q = normalize_for_compare(q_norm, True)
+        terms = [t for t in rank_q.split() if t not in BM25Index.STOPWORDS]
+        if not terms or not any(c in snap.bm25 for c in cols):
+            return self.search_ids(filters, remove_accents, snap)
+
+        rest = self._filter_keys(snap, filters[1:], remove_accents)
+        cache_key = (snap.version, remove_accents, ("RANK", key[0], rank_q), tuple(rest))
+        cached = self._results.get(cache_key)
+        if cached is not None:
+            return cached
+
+        n = len(snap)
+        if fuzzy:
+            # pontua com as grafias do catálogo que casaram com cada termo
+            expanded = set(terms)
+            for c in cols:
+                index = snap.fuzzy.get(c)
+                if index is not None:
+                    expanded.update(index.vocab_terms(terms))
+            scores = snap.rank_scores(" ".join(sorted(expanded)), cols)
+            keep = self._filter_matcher(snap, key, remove_accents)(0, n)
+        else:
+            scores = snap.rank_scores(rank_q, cols)
+            keep = scores > 0
+        for k in rest:
+            matcher = self._filter_matcher(snap, k, remove_accents)
+            if matcher is not None:
+                keep &= matcher(0, n)
+        ids = np.flatnonzero(keep)
+        ids = ids[np.argsort(-scores[ids], kind="stable")]
+        return self._results.put(cache_key, ids)
+
+    def search_after(
+            self,
+            filters: list[tuple[str | None, str | None]],
+            after: int = -1,
+            limit: int = 15,
+            remove_accents: bool = True,
+            snap: Optional[CatalogSnapshot] = None,
+    ) -> tuple[np.ndarray, bool]:
+        """
+        Paginação por cursor: até `limit` ids > `after` e se há mais linhas depois.
+        - Se a busca completa já está no cache LRU, só recorta o array (peek: a
+          varredura abaixo nunca preenche o cache, então não conta hit/miss)
+        - Senão varre o catálogo em fatias a partir de `after` e para assim que
+          acha limit+1 linhas (não conta o total, não materializa o resto)
+        """
+        snap = snap or self.snapshot()
+        keys = self._filter_keys(snap, filters, remove_accents)
+        n = len(snap)
+        start = max(int(after) + 1, 0)
+
+        cached = self._results.peek((snap.version, remove_accents, tuple(keys)))
+        if cached is not None:
+            pos = int(np.searchsorted(cached, start, side="left"))
+            page = cached[pos:pos + limit + 1]
+            return page[:limit], page.size > limit
+
+        matchers = [m for m in (self._filter_matcher(snap, k, remove_accents) for k in keys) if m is not None]
+        if not matchers:
+            page = np.arange(start, min(start + limit + 1, n), dtype=np.int64)
+            return page[:limit], page.size > limit
+
+        found: list[np.ndarray] = []
+        total = 0
+        lo = start
+        while lo < n and total <= limit:
+            hi = min(lo + SCAN_CHUNK, n)
+            m = matchers[0](lo, hi)
+            for matcher in matchers[1:]:
+                m = m & matcher(lo, hi)
+            hits = np.flatnonzero(m) + lo
+            found.append(hits)
+            total += hits.size
+            lo = hi
+        page = np.concatenate(found)[:limit + 1] if found else np.empty(0, dtype=np.int64)
+        return page[:limit], page.size > limit
+
+    def ncm_children(self, prefix: str = "", snap: Optional[CatalogSnapshot] = None) -> Dict[str, Any]:
+        """
+        Um nível da árvore NCM: nós filhos de `prefix` ("" = capítulos) com o nº
+        de linhas e de NCMs distintos em cada um. ValueError se `prefix` não for NCM.
+        """
+        snap = snap or self.snapshot()
+        digits = re.sub(r"[.\s]", "", prefix or "")
+        if not digits.isdigit() and digits:
+            raise ValueError(f"Invalid NCM prefix: {prefix!r}")
+        if len(digits) > 8:
+            raise ValueError(f"NCM prefix too long: {prefix!r}")
+        level, nodes = snap.ncm_tree.children(digits)
+        return {
+            "prefix": format_ncm_prefix(digits),
+            "level": NcmTreeIndex.LEVEL_NAMES.get(level) if level else None,
+            "total_rows": int(snap.ncm_tree.rows(digits).size),
+            "children": [
+                {"code": format_ncm_prefix(node), "digits": node, "rows": rows, "ncms": ncms}
+                for node, rows, ncms in nodes
+            ],
+        }
+
+    def suggest(self, q: str, limit: int = 10, snap: Optional[CatalogSnapshot] = None) -> list[dict]:
+        """
+        Autocomplete sem tocar nas linhas do catálogo (só listas ordenadas + bisect):
+        - só dígitos/pontos/espaços -> NCMs com esse prefixo ("0402", "0402.2", "04022")
+        - texto -> completa o último termo pelas palavras das descrições, mais
+          frequentes primeiro, mantendo o que já foi digitado antes dele
+        """
+        snap = snap or self.snapshot()
+        q_clean = (q or "").strip()
+        if not q_clean:
+            return []
+        if NCM_PREFIX_RE.fullmatch(q_clean):
+            digits = re.sub(r"\D", "", q_clean)
+            return [
+                {"value": code, "kind": "ncm", "count": n}
+                for code, n in snap.suggest.ncm(digits, limit)
+            ]
+
+        tokens = normalize_for_compare(q_clean, True).split()
+        if not tokens:
+            return []
+        head = " ".join(tokens[:-1])
+        return [
+            {"value": f"{head} {term}".strip(), "kind": "term", "count": n}
+            for term, n in snap.suggest.terms(tokens[-1], limit)
+        ]
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """Contadores do cache de resultados + versão do catálogo carregado."""
+        out: Dict[str, Any] = self._results.stats()
+        out["catalog_version"] = self._snapshot.version if self._snapshot is not None else None
+        out["last_load"] = dict(self._load_stats)
+        return out
 
-    def df(self) -> pd.DataFrame:
-        if self._needs_reload():
-            df = self._load_excel()
-            try:
-                self._mtime = os.path.getmtime(self._resolved_path or "")
-            except Exception:
-                self._mtime = time.time()
-            self._df = df
-        return self._df.copy()
+    def memory_report(self) -> Dict[str, Any]:
+        """
+        Memória do catálogo carregado:
+        - columns / columns_total_bytes / columns_plain_bytes: só as colunas
+          (CatalogSnapshot.memory_report, codificadas x como array object)
+        - structures: payloads, colunas normalizadas e índices (structures_report)
+        - total_bytes: colunas + estruturas
+        """
+        snap = self.snapshot()
+        columns = snap.memory_report()
+        structures = snap.structures_report()
+        columns_total = sum(c["total_bytes"] for c in columns)
+        structures_total = sum(s["bytes"] for s in structures)
+        return {
+            "catalog_version": snap.version,
+            "rows": len(snap),
+            "columns": columns,
+            "columns_total_bytes": columns_total,
+            "columns_plain_bytes": sum(c["plain_bytes"] for c in columns),
+            "structures": structures,
+            "structures_total_bytes": structures_total,
+            "total_bytes": columns_total + structures_total,
+        }
 
-    # -----------------------------
-    # Buscas
-    # -----------------------------
     def search(self, q: str, field: Optional[str], remove_accents: bool = True) -> pd.DataFrame:
-        df = self.df()
+        snap = self.snapshot()
         q_norm = normalize_for_compare(q or "", remove_accents=remove_accents)
         if not q_norm:
-            return df
-
-        def series_norm(s: pd.Series) -> pd.Series:
-            return s.map(lambda x: normalize_for_compare(x, remove_accents=remove_accents))
-
-        search_cols = ["ITEM", "ANEXO", "DESCRIÇÃO DO PRODUTO", "NCM", "DESCRIÇÃO TIPI"]
+            return snap.take(np.arange(len(snap)))
 
         if not field or field.upper() == "ALL":
 
             # Se for um NCM no formato 0000.00.00 → match EXATO, não parcial
-            if re.fullmatch(r"\d{4}\.\d{2}\.\d{2}", q.strip()):
-                wanted = q.strip()
-
-                return df.loc[df["NCM"].astype(str).str.strip() == wanted]
+            if NCM_EXACT_RE.fullmatch(q.strip()):
+                return snap.take(snap.ncm_exact.get(q.strip()))
 
             # Busca normal por texto (contains)
             mask = None
-            for col in search_cols:
-                if col in df.columns:
-                    part = series_norm(df[col]).str.contains(q_norm, na=False, regex=False)
+            for col in SEARCH_COLUMNS:
+                if col in snap.columns:
+                    part = snap.contains(col, q_norm, remove_accents)
                     mask = part if mask is None else (mask | part)
-            return df.loc[mask] if mask is not None else df.iloc[0:0]
+            return snap.take(np.flatnonzero(mask)) if mask is not None else snap.take([])
 
         col_map = map_columns_to_canonical([field])
         canon = col_map.get(field, field)
-        if canon not in df.columns:
-            return df.iloc[0:0]
-        return df.loc[series_norm(df[canon]).str.contains(q_norm, na=False, regex=False)]
+        if canon not in snap.columns:
+            return snap.take([])
+        return snap.take(np.flatnonzero(snap.contains(canon, q_norm, remove_accents)))
 
     def search_multi(
             self,
             filters: list[tuple[str | None, str | None]],
             remove_accents: bool = True
     ) -> pd.DataFrame:
-        df = self.df()
+        snap = self.snapshot()
+        return snap.take(self.search_ids(filters, remove_accents, snap=snap))
 
-        def series_norm(s: pd.Series) -> pd.Series:
-            return s.map(lambda x: normalize_for_compare(x, remove_accents=remove_accents))
+    # ---------------------------------------
+    # Detalhes
+    # ---------------------------------------
+    def find_details(self, ncm: Optional[str] = None, item: Optional[str] = None) -> pd.DataFrame:
+        snap = self.snapshot()
+        if ncm:
+            # NCM com ou sem pontos resolve para a mesma chave
+            out = snap.take(snap.ncm_keys.get(ncm_key(ncm)))
+        elif item:
+            out = snap.take(snap.item_keys.get(normalize_for_compare(item, True)))
+        else:
+            out = snap.take([])
 
-        def mask_for(field: str | None, q: str | None) -> pd.Series | None:
-            if not q:
-                return None
+        existing = [c for c in DETAIL_COLUMNS if c in out.columns]
+        return out[existing].reset_index(drop=True)
 
-            q_clean = q.strip()
+    def find_details_batch(
+            self,
+            ncms: Iterable[str] = (),
+            items: Iterable[str] = (),
+    ) -> Dict[str, Dict[str, list[dict]]]:
+        """
+        Detalhes de vários NCMs/ITEMs de uma vez (ex.: todas as linhas de uma NF-e).
+        Retorna {"ncm": {entrada: [detalhes]}, "item": {entrada: [detalhes]}} no formato
+        de to_api_details; entrada sem correspondência (ou vazia) -> [].
+        Todas as chaves são resolvidas nos índices hash, as linhas distintas são
+        materializadas num único take e cada linha é serializada uma vez só.
+        """
+        snap = self.snapshot()
+        empty = np.empty(0, dtype=np.int64)
+        ncm_rows = {
+            k: snap.ncm_keys.get(ncm_key(k)) if k else empty
+            for k in dict.fromkeys(ncms)
+        }
+        item_rows = {
+            k: snap.item_keys.get(normalize_for_compare(k, True)) if k else empty
+            for k in dict.fromkeys(items)
+        }
+
+        found = [rows for rows in (*ncm_rows.values(), *item_rows.values()) if rows.size]
+        unique = np.unique(np.concatenate(found)) if found else empty
+        frame = snap.take(unique)
+        details = to_api_details(frame[[c for c in DETAIL_COLUMNS if c in frame.columns]])
+        by_row = dict(zip(unique.tolist(), details))
+
+        # uma cópia por entrada: a mesma linha pode responder a vários NCMs/ITEMs
+        return {
+            "ncm": {k: [dict(by_row[i]) for i in rows.tolist()] for k, rows in ncm_rows.items()},
+            "item": {k: [dict(by_row[i]) for i in rows.tolist()] for k, rows in item_rows.items()},
+        }
 
-            # 🔥 1) Se o valor é um NCM exato → busca EXATA!
-            if re.fullmatch(r"\d{4}\.\d{2}\.\d{2}", q_clean):
-                return df["NCM"].astype(str).str.strip() == q_clean
+# -----------------------------
+# Leitura por aba
+# -----------------------------
+def _is_ignored_sheet(raw_name) -> bool:
+    # Ignora apenas TIPI
+    return str(raw_name).strip().upper() in IGNORE_SHEETS
 
-            # 🔥 2) Busca normal (contains) para textos
-            q_norm = normalize_for_compare(q_clean, remove_accents=remove_accents)
+def _prepare_sheet(name: str, raw: pd.DataFrame) -> tuple[str, pd.DataFrame, Dict[str, Any]]:
+    """Detecta cabeçalho, rotula ANEXO e normaliza UMA aba. Retorna (nome, df normalizado, debug)."""
+    upper_name = strip_accents(name).upper()
 
-            search_cols = ["ITEM", "ANEXO", "DESCRIÇÃO DO PRODUTO", "NCM", "DESCRIÇÃO TIPI"]
+    is_exceptions = "EXCE" in upper_name  # Exceções/Excecoes
 
-            if not field or field.upper() == "ALL":
-                m = None
-                for col in search_cols:
-                    if col in df.columns:
-                        part = series_norm(df[col]).str.contains(q_norm, na=False, regex=False)
-                        m = part if m is None else (m | part)
-                return m
+    hdr_idx = _detect_header_row(raw, max_scan=10)
+    if hdr_idx is None:
+        header_vals = [str(x) if x is not None else "" for x in list(raw.iloc[0].values)]
+        body = raw.iloc[1:].copy()
+    else:
+        header_vals = [str(x) if x is not None else "" for x in list(raw.iloc[hdr_idx].values)]
 
-            # Campo específico
-            col_map = map_columns_to_canonical([field])
-            canon = col_map.get(field, field)
-            if canon not in df.columns:
-                return None
+        # --- CASO ESPECIAL PARA "TRIBUTADO" ---
+        if "TRIBUT" in upper_name:
+            # A linha de cabeçalho contém dados (Base Legal)
+            body = raw.iloc[hdr_idx:].copy()
+        else:
+            body = raw.iloc[hdr_idx + 1:].copy()
 
-            return series_norm(df[canon]).str.contains(q_norm, na=False, regex=False)
+    body = body.reset_index(drop=True)
 
-        # ---- Combinação de máscaras ----
-        masks = []
-        for f, q in filters[:2]:
-            m = mask_for(f, q)
-            if m is not None:
-                masks.append(m)
+    if "TRIBUT" in upper_name:
+        # Remove linha de cabeçalho duplicado dentro dos dados
+        def is_fake_header(val, target):
+            return str(val).strip().lower() == target.lower()
 
-        if not masks:
-            return df
+        mask_fake = (
+            body.apply(lambda row:
+                       is_fake_header(row.get("ITEM", ""), "ITEM") or
+                       is_fake_header(row.get("DESCRIÇÃO DO PRODUTO", ""), "DESCRIÇÃO DO PRODUTO"),
+                       axis=1
+                       )
+        )
 
-        combined = masks[0]
-        for m in masks[1:]:
-            combined = combined & m
+        # Remove linhas onde ITEM ou DESCRIÇÃO DO PRODUTO são cabeçalhos falsos
+        body = body.loc[~mask_fake].reset_index(drop=True)
+
+    # equaliza colunas
+    max_cols = max(len(header_vals), body.shape[1])
+    while len(header_vals) < max_cols:
+        header_vals.append("")
+    if body.shape[1] < max_cols:
+        for k in range(body.shape[1], max_cols):
+            body[k] = ""
+    body.columns = header_vals
+
+    # Em Exceções NÃO inferir "DESCRIÇÃO COMPLETA" por cabeçalho longo
+    if "DESCRIÇÃO COMPLETA" not in body.columns and not is_exceptions:
+        long_headers = [(i, h) for i, h in enumerate(header_vals) if _is_long_header_text(h)]
+        if long_headers:
+            chosen_idx, chosen_text = max(long_headers, key=lambda x: len(str(x[1])))
+            body["DESCRIÇÃO COMPLETA"] = str(chosen_text).strip()
+
+    # ANEXO
+    if "TRIBUT" in upper_name:
+        anexo_label = "Tributado"
+    elif "MONOF" in upper_name:
+        anexo_label = "MONOFÁSICO"
+    elif is_exceptions:
+        anexo_label = "Exceções"
+    else:
+        anexo_label = _extract_anexo_label(name)
+    body["ANEXO"] = anexo_label
 
-        return df.loc[combined]
+    # rastro opcional
+    body["__SHEET_TAG"] = ("EXC::" + name) if is_exceptions else ("ANX::" + anexo_label)
 
-    # ---------------------------------------
-    # Detalhes
-    # ---------------------------------------
-    def find_details(self, ncm: Optional[str] = None, item: Optional[str] = None) -> pd.DataFrame:
-        df = self.df()
-        if ncm:
-            key = normalize_for_compare(ncm, True)
-            mask = df["NCM"].map(lambda x: normalize_for_compare(x, True) == key)
-            out = df.loc[mask]
-        elif item:
-            key = normalize_for_compare(item, True)
-            mask = df["ITEM"].map(lambda x: normalize_for_compare(x, True) == key)
-            out = df.loc[mask]
-        else:
-            out = df.iloc[0:0]
+    before_rows = int(body.shape[0])
+    before_cols = list(map(str, body.columns))
 
-        cols = ["ANEXO", "ITEM", "NCM", "DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO COMPLETA", "IBS", "CBS"]
-        existing = [c for c in cols if c in out.columns]
-        return out[existing].reset_index(drop=True)
+    normalized = ItemsCache._normalize_df(body, exceptions_mode=is_exceptions)
+
+    after_rows = int(normalized.shape[0])
+    debug = {
+        "header_row_detected": hdr_idx,
+        "rows_before": before_rows,
+        "cols_before": before_cols[:20],
+        "rows_after": after_rows,
+        "is_exceptions": is_exceptions,
+    }
+    return name, normalized, debug
+
+def _sheet_digest(name: str, raw: pd.DataFrame) -> str:
+    """Hash do conteúdo bruto de uma aba (nome, dimensões e células, na ordem)."""
+    h = hashlib.sha256(name.encode("utf-8"))
+    h.update(np.asarray(raw.shape, dtype=np.int64).tobytes())
+    h.update(pd.util.hash_pandas_object(raw, index=False).to_numpy().tobytes())
+    return h.hexdigest()
+
+class SheetSegment:
+    """
+    Saída normalizada de UMA aba, reaproveitada nas recargas enquanto o conteúdo da aba não muda.
+    - digest: hash do conteúdo bruto (_sheet_digest)
+    - columns: colunas da aba normalizada (_prepare_sheet)
+    - norm: SEARCH_COLUMNS "para comparação"; visible: WANTED_COLUMNS para os payloads
+    Os índices (trigramas, BM25, fuzzy...) têm estatísticas do catálogo inteiro:
+    são refeitos sobre a concatenação dos segmentos.
+    """
+    __slots__ = ("name", "digest", "debug", "columns", "norm", "visible")
+
+    def __init__(self, name: str, digest: str, debug: Dict[str, Any], columns: dict, norm: dict, visible: dict):
+        self.name = name
+        self.digest = digest
+        self.debug = debug
+        self.columns = columns
+        self.norm = norm
+        self.visible = visible
+
+    def __len__(self) -> int:
+        for arr in self.columns.values():
+            return len(arr)
+        return 0
+
+    @classmethod
+    def from_frame(cls, name: str, digest: str, frame: pd.DataFrame, debug: Dict[str, Any]) -> "SheetSegment":
+        blank = np.full(len(frame), "", dtype=object)
+        return cls(
+            name, digest, debug,
+            columns={str(c): frame[c].to_numpy(dtype=object) for c in frame.columns},
+            norm={c: _series_for_compare(frame[c]).to_numpy(dtype=object) for c in SEARCH_COLUMNS if c in frame.columns},
+            visible={
+                c: normalize_visible_series(frame[c]).to_numpy(dtype=object) if c in frame.columns else blank
+                for c in WANTED_COLUMNS
+            },
+        )
+
+    @classmethod
+    def from_snapshot(
+            cls, snap: CatalogSnapshot, name: str, digest: str, debug: Dict[str, Any], lo: int, hi: int,
+    ) -> "SheetSegment":
+        """Segmento de uma aba inalterada recortado do snapshot atual (linhas [lo, hi))."""
+        rows = snap.rows[lo:hi]
+        return cls(
+            name, digest, debug,
+            columns={c: np.asarray(col[lo:hi]) for c, col in snap.columns.items()},
+            norm={c: arr[lo:hi] for c, arr in snap.norm.items()},
+            visible={c: np.fromiter((r[c] for r in rows), dtype=object, count=len(rows)) for c in WANTED_COLUMNS},
+        )
+
+def _segment_from_raw(name: str, raw: pd.DataFrame) -> SheetSegment:
+    digest = _sheet_digest(name, raw)
+    name, normalized, debug = _prepare_sheet(name, raw)
+    return SheetSegment.from_frame(name, digest, normalized, debug)
+
+def _concat_segments(segments: List[SheetSegment]) -> tuple[pd.DataFrame, Optional[dict], Optional[dict]]:
+    """(catálogo, norm, visible) das abas com linhas, na ordem dos segmentos."""
+    filled = [seg for seg in segments if len(seg)]
+    if not filled:
+        return pd.DataFrame(columns=WANTED_COLUMNS), None, None
+    names = list(dict.fromkeys(c for seg in filled for c in seg.columns))
+
+    def concat(part: str, cols) -> dict:
+        out = {}
+        for c in cols:
+            arrays = [getattr(seg, part).get(c) for seg in filled]
+            out[c] = np.concatenate([
+                np.full(len(seg), "", dtype=object) if arr is None else arr
+                for seg, arr in zip(filled, arrays)
+            ])
+        return out
+
+    df = pd.DataFrame(concat("columns", names), columns=names)
+    norm = concat("norm", [c for c in SEARCH_COLUMNS if c in names])
+    return df, norm, concat("visible", WANTED_COLUMNS)
+
+def _segment_spans(segments: List[SheetSegment]) -> List[tuple]:
+    """(nome, hash, início, fim) de cada aba no catálogo concatenado."""
+    spans, lo = [], 0
+    for seg in segments:
+        spans.append((seg.name, seg.digest, lo, lo + len(seg)))
+        lo += len(seg)
+    return spans
+
+# -----------------------------
+# Exportação em streaming
+# -----------------------------
+def iter_export(
+    cache: ItemsCache,
+    filters: list[tuple[str | None, str | None]],
+    fmt: str = "ndjson",
+    snap: Optional[CatalogSnapshot] = None,
+    batch_size: int = EXPORT_BATCH,
+) -> Iterator[bytes]:
+    """
+    Gera o resultado da busca (ou o catálogo inteiro, sem filtros) em NDJSON ou CSV.
+    Percorre o snapshot em lotes via search_after: memória constante,
+    independente do tamanho do resultado.
+    """
+    snap = snap or cache.snapshot()
+    if fmt == "csv":
+        buf = io.StringIO()
+        writer = csv.writer(buf)
+        writer.writerow(WANTED_COLUMNS)
+        yield buf.getvalue().encode("utf-8")
+
+    after = -1
+    while True:
+        ids, has_more = cache.search_after(filters, after=after, limit=batch_size, snap=snap)
+        if ids.size:
+            rows = snap.api_rows(ids)
+            if fmt == "csv":
+                buf = io.StringIO()
+                writer = csv.writer(buf)
+                writer.writerows([r[c] for c in WANTED_COLUMNS] for r in rows)
+                yield buf.getvalue().encode("utf-8")
+            else:
+                yield "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in rows).encode("utf-8")
+        if not has_more:
+            break
+        after = int(ids[-1])
+
+# -----------------------------
+# Cursor opaco (paginação keyset)
+# -----------------------------
+def encode_cursor(version: str, row_id: int) -> str:
+    """Cursor opaco = versão do catálogo + id da última linha entregue."""
+    raw = f"{version}:{int(row_id)}".encode("ascii")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def decode_cursor(cursor: str) -> tuple[str, int]:
+    """Inverso de encode_cursor. ValueError se o cursor for inválido."""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        version, row_id = base64.urlsafe_b64decode(padded.encode("ascii")).decode("ascii").split(":")
+        return version, int(row_id)
+    except Exception as exc:
+        raise ValueError(f"Invalid cursor: {cursor!r}") from exc
+
+# -----------------------------
+# Cache compartilhado (escopo de processo)
+# -----------------------------
+_SHARED_CACHES: Dict[tuple, ItemsCache] = {}
+_SHARED_CACHES_LOCK = threading.Lock()
+
+def get_shared_cache(
+    excel_path: Optional[str] = None,
+    package: str = "infrastructure.spreadsheet_database",
+    resource: str = "Planilha_NCM.xls",
+) -> ItemsCache:
+    """
+    Retorna a instância única de ItemsCache para a planilha informada.
+    Todas as requisições/threads do processo compartilham o mesmo catálogo,
+    que só é recarregado quando o arquivo de origem muda.
+    """
+    key = (excel_path, package, resource)
+    cache = _SHARED_CACHES.get(key)
+    if cache is None:
+        with _SHARED_CACHES_LOCK:
+            cache = _SHARED_CACHES.get(key)
+            if cache is None:
+                cache = ItemsCache(excel_path=excel_path, package=package, resource=resource)
+                _SHARED_CACHES[key] = cache
+    return cache
+
+def get_dataset_cache(name: Optional[str] = None) -> ItemsCache:
+    """
+    Catálogo de uma das versões em DATASETS (None -> DEFAULT_DATASET).
+    KeyError se o nome não existir.
+    """
+    name = name or DEFAULT_DATASET
+    if name not in DATASETS:
+        raise KeyError(name)
+    return get_shared_cache(resource=DATASETS[name])
+
+def list_datasets() -> list[dict]:
+    """Versões configuradas e, para as já carregadas, versão e nº de linhas."""
+    out = []
+    for name, resource in DATASETS.items():
+        cache = _SHARED_CACHES.get((None, "infrastructure.spreadsheet_database", resource))
+        snap = cache.loaded_snapshot if cache is not None else None
+        out.append({
+            "name": name,
+            "resource": resource,
+            "default": name == DEFAULT_DATASET,
+            "loaded": snap is not None,
+            "version": snap.version if snap is not None else None,
+            "rows": len(snap) if snap is not None else None,
+        })
+    return out
+
+_PRUNE_PENDING = False
+
+def _prune_string_pool(owner: "ItemsCache", current: Optional[CatalogSnapshot] = None) -> None:
+    """
+    Após uma recarga (com o _reload_lock de `owner`): o pool fica só com os textos
+    dos snapshots ainda servidos.
+    Uma carga em andamento em outro catálogo já internou textos que ainda não estão
+    em snapshot nenhum; a limpeza roda só com os _reload_lock de todos os catálogos
+    compartilhados (sem esperar) e, se algum estiver carregando, fica para o fim dessa carga.
+    """
+    global _PRUNE_PENDING
+    with _SHARED_CACHES_LOCK:
+        caches = [c for c in _SHARED_CACHES.values() if c is not owner]
+    held: List[ItemsCache] = []
+    try:
+        for cache in caches:
+            if not cache._reload_lock.acquire(blocking=False):
+                _PRUNE_PENDING = True
+                return
+            held.append(cache)
+        _PRUNE_PENDING = False
+        live = {id(s): s for s in (c.loaded_snapshot for c in caches) if s is not None}
+        if current is not None:
+            live[id(current)] = current
+        STRING_POOL.retain(arr for snap in live.values() for arr in snap.string_arrays())
+    finally:
+        for cache in held:
+            cache._reload_lock.release()
 
 # -----------------------------
 # Serializadores para API
@@ -748,11 +2040,3 @@ def to_api_details(df: pd.DataFrame) -> list[dict]:
             "CBS": _fmt_pct(r.get("CBS", "")),
         })
     return out
-
-
-
-
-
-
-
-
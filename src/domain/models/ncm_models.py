@@ -1,6 +1,6 @@
-from typing import List, Literal, Optional, TypedDict
+from typing import Dict, List, Literal, Optional, TypedDict
 from typing import List
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, model_validator
 from pydantic.config import ConfigDict  # pydantic v2
 
 
@@ -11,10 +11,25 @@ FilterField = Literal[
     "DESCRIÇÃO DO PRODUTO",
     "NCM",
     "DESCRIÇÃO TIPI",
+    "CST IBS E CBS",
+    "CCLASSTRIB",
     "ALL"
 ]
 
 
+# modo de cada filtro: "contém" (padrão), aproximado (tolera erros de digitação)
+# ou igualdade/prefixo (ANEXO, CST IBS E CBS, CCLASSTRIB; nas demais vale "contém")
+MatchMode = Literal["contains", "fuzzy", "exact", "prefix"]
+
+
+# ordem de /itens/search: planilha (padrão) ou relevância (BM25)
+SearchOrder = Literal["sheet", "relevance"]
+
+
+# formatos de /itens/export
+ExportFormat = Literal["ndjson", "csv"]
+
+
 class RowItem(BaseModel):
     ITEM: Optional[str] = None
     ANEXO: Optional[str] = None
@@ -32,9 +47,108 @@ class SearchResponse(BaseModel):
     total_pages: int
     total_items: int
     data: List[dict]  # mantém como antes
+    legal_basis: Optional[Dict[int, str]] = None  # compact=true: id -> DESCRIÇÃO COMPLETA
+
+
+class CursorSearchResponse(BaseModel):
+    version: str                        # versão do catálogo usada na busca
+    limit: int
+    next_cursor: Optional[str] = None   # None = não há mais páginas
+    total_items: Optional[int] = None   # só quando with_total=true
+    data: List[dict]
+    legal_basis: Optional[Dict[int, str]] = None  # compact=true: id -> DESCRIÇÃO COMPLETA
+
+
+class Suggestion(BaseModel):
+    value: str                          # NCM como na planilha ou texto completado
+    kind: Literal["ncm", "term"]
+    count: int                          # NCM: linhas do catálogo; termo: descrições distintas
+
+
+class SuggestResponse(BaseModel):
+    version: str
+    data: List[Suggestion]
+
+
+class NcmNode(BaseModel):
+    code: str                           # prefixo pontuado: "01", "0101", "0101.2", "0101.21.00"
+    digits: str                         # mesmo prefixo só com dígitos
+    rows: int                           # linhas do catálogo na sub-árvore
+    ncms: int                           # NCMs distintos na sub-árvore
+
+
+class NcmTreeResponse(BaseModel):
+    prefix: str
+    level: Optional[str] = None         # nível dos filhos (capitulo, posicao, ...); None = folha
+    total_rows: int
+    children: List[NcmNode]
+
+
+# filtro de /itens/diff
+DiffChange = Literal["all", "added", "removed", "changed"]
+
+
+class DiffCounts(BaseModel):
+    added: int
+    removed: int
+    changed: int
+
+
+class DiffResponse(BaseModel):
+    base: str                           # dataset base e versão do catálogo
+    base_version: str
+    target: str                         # dataset alvo e versão do catálogo
+    target_version: str
+    counts: DiffCounts                  # totais por tipo (independe de `change`)
+    page: int
+    total_pages: int
+    total_items: int
+    data: List[dict]                    # change, NCM, ITEM, ANEXO, fields, before, after
 
 
 class CstDetailsResponse(BaseModel):
     reduction_percent_ibs: Optional[str] = None
     reduction_percent_cbs: Optional[str] = None
-    legal_basis: str = ""
\ No newline at end of file
+    legal_basis: str = ""
+
+
+# limite de chaves por chamada de /itens/details/batch (NCMs + ITEMs)
+MAX_DETAILS_BATCH = 5000
+
+
+class DetailsBatchRequest(BaseModel):
+    ncms: List[str] = Field(default_factory=list, description="Códigos NCM (com ou sem pontos)")
+    items: List[str] = Field(default_factory=list, description="ITEMs (usados quando não há NCM)")
+
+    @model_validator(mode="after")
+    def check_size(self):
+        total = len(self.ncms) + len(self.items)
+        if total == 0:
+            raise ValueError("Informe ao menos um NCM ou ITEM.")
+        if total > MAX_DETAILS_BATCH:
+            raise ValueError(f"Máximo de {MAX_DETAILS_BATCH} chaves por chamada (recebido {total}).")
+        return self
+
+
+class DetailsBatchResponse(BaseModel):
+    count: int                                   # total de linhas encontradas
+    ncm: Dict[str, List[dict]] = Field(default_factory=dict)
+    item: Dict[str, List[dict]] = Field(default_factory=dict)
+
+
+# estados de um job de /itens/classify
+ClassifyStatus = Literal["queued", "running", "done", "error"]
+
+
+class ClassifyJobResponse(BaseModel):
+    job_id: str
+    status: ClassifyStatus
+    filename: str
+    total_rows: Optional[int] = None     # conhecido quando o job começa a ler o arquivo
+    processed_rows: int = 0
+    matched_rows: int = 0
+    progress: float = 0.0                # 0..1
+    catalog_version: Optional[str] = None
+    error: Optional[str] = None
+    created_at: float
+    finished_at: Optional[float] = None
@@ -0,0 +1,48 @@
+# src/tests/conftest.py
+import os
+import sys
+import warnings
+
+import pytest
+
+# os testes importam os pacotes da aplicação como o main.py (src/ no sys.path)
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if SRC_DIR not in sys.path:
+    sys.path.insert(0, SRC_DIR)
+
+import pandas as pd  # noqa: E402
+
+from application.use_cases import ncm_use_cases as ncm  # noqa: E402
+
+WORKBOOK_DIR = os.path.join(SRC_DIR, "infrastructure", "spreadsheet_database")
+WORKBOOKS = sorted(f for f in os.listdir(WORKBOOK_DIR) if f.startswith("Planilha_NCM"))
+
+_RAW_SHEETS: dict = {}
+
+
+def pytest_generate_tests(metafunc):
+    # `workbook`: um caso por planilha empacotada (Planilha_NCM*.xls[x])
+    if "workbook" in metafunc.fixturenames:
+        metafunc.parametrize("workbook", WORKBOOKS)
+
+
+@pytest.fixture
+def workbook_path(workbook) -> str:
+    return os.path.join(WORKBOOK_DIR, workbook)
+
+
+@pytest.fixture
+def raw_sheets(workbook_path) -> dict:
+    """Abas cruas da planilha, lidas como ItemsCache lê (cacheadas na sessão)."""
+    if workbook_path not in _RAW_SHEETS:
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            _RAW_SHEETS[workbook_path] = pd.read_excel(
+                workbook_path,
+                sheet_name=None,
+                engine=ncm.choose_engine(workbook_path),
+                dtype=str,
+                header=None,
+                na_filter=False,
+            )
+    return _RAW_SHEETS[workbook_path]
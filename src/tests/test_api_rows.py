@@ -0,0 +1,81 @@
+# src/tests/test_api_rows.py
+import pickle
+
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def test_prebuilt_rows_are_read_only(cache):
+    snap = cache.snapshot()
+    with pytest.raises(TypeError):
+        snap.rows[0]["NCM"] = "0000.00.00"
+
+
+def test_api_rows_are_private_copies(cache):
+    snap = cache.snapshot()
+    first = snap.api_rows([0])[0]
+    first["NCM"] = "alterado"
+    assert snap.api_rows([0])[0]["NCM"] != "alterado"
+    assert snap.rows[0]["NCM"] != "alterado"
+
+
+def test_details_batch_entries_do_not_share_dicts(cache):
+    snap = cache.snapshot()
+    ncm_code = snap.rows[0]["NCM"]
+    item = snap.rows[0]["ITEM"]
+    out = cache.find_details_batch(ncms=[ncm_code], items=[item])
+    a, b = out["ncm"][ncm_code][0], out["item"][item][0]
+    assert a == b and a is not b
+    a["NCM"] = "alterado"
+    assert cache.find_details_batch(ncms=[ncm_code])["ncm"][ncm_code][0]["NCM"] != "alterado"
+
+
+def test_read_only_rows_survive_pickle(cache):
+    snap = cache.snapshot()
+    restored = pickle.loads(pickle.dumps(snap))
+    assert restored.rows == snap.rows
+    with pytest.raises(TypeError):
+        restored.rows[0]["NCM"] = "x"
+
+
+def test_compact_rows_rebuild_full_rows(cache):
+    snap = cache.snapshot()
+    ids = cache.search_ids([("ALL", "leite")])
+    full = snap.api_rows(ids)
+    rows, legal_basis = snap.api_rows_compact(ids)
+    assert len(rows) == len(full)
+    assert set(legal_basis) == {r[ncm.LEGAL_BASIS_ID] for r in rows}
+    # texto repetido em várias linhas vai uma vez só no dicionário
+    assert len(legal_basis) < len(rows)
+    rebuilt = [
+        {(ncm.LEGAL_BASIS_COLUMN if k == ncm.LEGAL_BASIS_ID else k): (legal_basis[v] if k == ncm.LEGAL_BASIS_ID else v)
+         for k, v in r.items()}
+        for r in rows
+    ]
+    assert rebuilt == full
+    assert all(list(a) == list(b) for a, b in zip(rebuilt, full))  # mesma ordem de colunas
+
+
+def test_compact_ids_are_stable_across_pages(cache):
+    snap = cache.snapshot()
+    ids = cache.search_ids([("ALL", "queijo")])
+    _, first = snap.api_rows_compact(ids[:5])
+    _, second = snap.api_rows_compact(ids[3:])
+    _, whole = snap.api_rows_compact(ids)
+    for lid, text in {**first, **second}.items():
+        assert whole[lid] == text
+
+
+def test_compact_rows_are_plain_dicts(cache):
+    snap = cache.snapshot()
+    rows, _ = snap.api_rows_compact([0, 1])
+    rows[0]["NCM"] = "alterado"
+    assert snap.rows[0]["NCM"] != "alterado"
+    assert pickle.loads(pickle.dumps(snap)).api_rows_compact([0, 1]) == snap.api_rows_compact([0, 1])
+    assert snap.api_rows_compact([]) == ([], {})
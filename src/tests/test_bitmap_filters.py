@@ -0,0 +1,99 @@
+# src/tests/test_bitmap_filters.py
+import numpy as np
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import BitmapIndex, bitmap_and
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def normalized(snap, col: str) -> list:
+    values = snap.norm[col] if col in snap.norm else ncm._compare_values(snap.columns[col])
+    return list(values)
+
+
+def test_index_operations():
+    # 11 linhas: o último byte do bitmap fica incompleto
+    values = ["anexo i", "anexo iv", "anexo i", "", "anexo ix", "anexo iv", "anexo i", "b", "anexo v", "", "anexo i"]
+    index = BitmapIndex(values)
+    for op, q, expected in [
+        ("exact", "anexo i", [0, 2, 6, 10]),
+        ("exact", "anexo", []),
+        ("prefix", "anexo i", [0, 1, 2, 4, 5, 6, 10]),
+        ("prefix", "", list(range(11))),
+        ("contains", "iv", [1, 5]),
+        ("exact", "", [3, 9]),
+    ]:
+        assert np.flatnonzero(index.to_mask(index.bitmap(op, q))).tolist() == expected, (op, q)
+        assert np.flatnonzero(index.matcher(op, q)(0, 11)).tolist() == expected, (op, q)
+    assert index.matcher("prefix", "anexo i")(4, 8).tolist() == [True, True, True, False]
+    with pytest.raises(ValueError):
+        index.bitmap("regex", "x")
+
+
+def test_bitmap_and():
+    index = BitmapIndex(["a", "b", "a", "c", "a", "b", "a", "c", "a"])
+    other = BitmapIndex(["x", "x", "y", "x", "x", "y", "x", "x", "x"])
+    both = bitmap_and([index.bitmap("exact", "a"), other.bitmap("exact", "x")])
+    assert np.flatnonzero(index.to_mask(both)).tolist() == [0, 4, 6, 8]
+
+
+@pytest.mark.parametrize("col", ncm.BITMAP_COLUMNS)
+def test_exact_and_prefix_match_scan(cache, col):
+    snap = cache.snapshot()
+    values = normalized(snap, col)
+    for key in snap.bitmaps[col].keys():
+        if not key:
+            continue
+        exact = [i for i, v in enumerate(values) if v == key]
+        prefix = [i for i, v in enumerate(values) if v.startswith(key)]
+        assert cache.search_ids([(col, key, "exact")]).tolist() == exact, key
+        assert cache.search_ids([(col, key, "prefix")]).tolist() == prefix, key
+
+
+def test_exact_ignores_case_and_accents(cache):
+    ids = cache.search_ids([("ANEXO", "ANEXO IV - ÓRGÃO PÚBLICO", "exact")])
+    assert ids.size
+    assert ids.tolist() == cache.search_ids([("ANEXO", "anexo iv orgao publico", "exact")]).tolist()
+    assert cache.search_ids([("ANEXO", "anexo i", "exact")]).size < cache.search_ids([("ANEXO", "anexo i", "prefix")]).size
+
+
+def test_two_bitmap_filters_are_anded(cache):
+    snap = cache.snapshot()
+    anexo, cst = normalized(snap, "ANEXO"), normalized(snap, "CST IBS E CBS")
+    expected = [i for i in range(len(snap)) if anexo[i].startswith("anexo i") and cst[i] == "200"]
+    assert expected
+    got = cache.search_ids([("ANEXO", "anexo i", "prefix"), ("CST IBS E CBS", "200", "exact")])
+    assert got.tolist() == expected
+
+
+def test_bitmap_with_text_filter_and_cursor(cache):
+    filters = [("CCLASSTRIB", "2000", "prefix"), ("ALL", "leite")]
+    expected = np.intersect1d(
+        cache.search_ids(filters[:1]),
+        cache.search_ids(filters[1:]),
+    ).tolist()
+    assert expected
+    assert cache.search_ids(filters).tolist() == expected
+
+    # cursor sem cache (varredura por fatias) dá o mesmo resultado
+    cache._results.clear()
+    after, pages = -1, []
+    while True:
+        ids, has_more = cache.search_after(filters, after=after, limit=3)
+        pages.extend(ids.tolist())
+        if not has_more:
+            break
+        after = int(ids[-1])
+    assert pages == expected
+
+
+def test_contains_on_bitmap_column_matches_scan(cache):
+    snap = cache.snapshot()
+    got = cache.search_ids([("ANEXO", "publico")])
+    assert got.tolist() == np.flatnonzero(snap.contains("ANEXO", "publico")).tolist()
+    assert got.size
@@ -0,0 +1,56 @@
+# src/tests/test_block_ffill.py
+import numpy as np
+import pandas as pd
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+
+def groupby_ffill(values, blocks) -> np.ndarray:
+    """Implementação anterior de _normalize_df (groupby + apply por bloco), mantida como referência."""
+    df = pd.DataFrame({"v": pd.Series(values, dtype=object).to_numpy(dtype=object), "b": np.asarray(blocks)})
+    return (
+        df.groupby("b")["v"]
+        .apply(lambda s: s.replace(r"^\s*$", pd.NA, regex=True).ffill())
+        .fillna("")
+        .values
+    )
+
+
+CELLS = ["", " ", "  \t", None, np.nan, pd.NA, "a", "b", " c ", "Base Legal: Art. 1º"]
+
+
+@pytest.mark.parametrize("seed", range(200))
+def test_matches_groupby_on_random_blocks(seed):
+    rng = np.random.default_rng(seed)
+    n = int(rng.integers(1, 80))
+    values = pd.Series([CELLS[i] for i in rng.integers(0, len(CELLS), n)], dtype=object)
+    blocks = np.cumsum(rng.random(n) < 0.2)
+
+    out = ncm._block_ffill(values, blocks)
+
+    assert list(out) == list(groupby_ffill(values, blocks))
+
+
+def test_empty_column():
+    out = ncm._block_ffill(pd.Series([], dtype=object), np.array([], dtype=int))
+    assert len(out) == 0
+
+
+def test_matches_groupby_on_bundled_workbooks(raw_sheets, monkeypatch):
+    calls = []
+    block_ffill = ncm._block_ffill
+
+    def recording(values, blocks):
+        out = block_ffill(values, blocks)
+        calls.append((values.copy(), np.asarray(blocks).copy(), out))
+        return out
+
+    monkeypatch.setattr(ncm, "_block_ffill", recording)
+    for raw_name, raw in raw_sheets.items():
+        if not ncm._is_ignored_sheet(raw_name):
+            ncm._prepare_sheet(str(raw_name).strip(), raw)
+
+    assert calls
+    for values, blocks, out in calls:
+        assert list(out) == list(groupby_ffill(values, blocks))
@@ -0,0 +1,73 @@
+# src/tests/test_bm25_rank.py
+import numpy as np
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import BM25Index
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def test_rare_term_outweighs_common_term():
+    index = BM25Index(["leite integral", "leite desnatado", "leite em po", "queijo"])
+    scores = index.scores(["leite", "integral"])
+    assert scores[0] > scores[1] == scores[2] > 0
+    assert scores[3] == 0
+
+
+def test_shorter_value_ranks_first():
+    index = BM25Index(["queijo", "queijo minas frescal", "leite"])
+    scores = index.scores(["queijo"])
+    assert scores[0] > scores[1] > scores[2] == 0
+
+
+def test_repeated_values_count_once():
+    # df conta valores distintos: repetir "leite" não o torna mais comum que "queijo"
+    index = BM25Index(["leite"] * 50 + ["queijo", "leite queijo"])
+    scores = index.scores(["leite"])
+    assert np.unique(scores[:50]).size == 1
+    assert index.scores(["leite"])[51] == pytest.approx(index.scores(["queijo"])[51])
+
+
+def test_stopwords_do_not_score():
+    index = BM25Index(["carne de boi", "carne suina"])
+    assert (index.scores(["de"]) == 0).all()
+    assert index.scores(["carne", "de"]).tolist() == index.scores(["carne"]).tolist()
+
+
+def test_ranked_search_is_ordered_by_score(cache):
+    snap = cache.snapshot()
+    ids = cache.search_ranked([("ALL", "leite em po")])
+    scores = snap.rank_scores("leite em po", ncm.RANK_COLUMNS)
+    assert set(ids.tolist()) == set(np.flatnonzero(scores > 0).tolist())
+    ranked = scores[ids]
+    assert (np.diff(ranked) <= 0).all()
+    # empates na ordem da planilha
+    for s in np.unique(ranked):
+        tied = ids[ranked == s]
+        assert (np.diff(tied) > 0).all()
+
+
+@pytest.mark.parametrize("q, top, col", [
+    ("leite integral", "leite integral", "DESCRIÇÃO TIPI"),
+    ("farinha de trigo", "farinha de trigo do codigo", "DESCRIÇÃO DO PRODUTO"),
+])
+def test_best_match_comes_first(cache, q, top, col):
+    snap = cache.snapshot()
+    ids = cache.search_ranked([("ALL", q)])
+    assert top in ncm.normalize_for_compare(snap.rows[int(ids[0])][col])
+
+
+def test_second_filter_only_restricts(cache):
+    ranked = cache.search_ranked([("ALL", "leite"), ("ANEXO", "I")])
+    alone = cache.search_ranked([("ALL", "leite")])
+    allowed = set(cache.search_ids([("ANEXO", "I")]).tolist())
+    assert ranked.tolist() == [i for i in alone.tolist() if i in allowed]
+
+
+def test_ncm_and_stopword_queries_keep_sheet_order(cache):
+    for filters in ([("ALL", "0402.10.10")], [("ALL", "de")]):
+        assert cache.search_ranked(filters).tolist() == cache.search_ids(filters).tolist()
@@ -0,0 +1,119 @@
+# src/tests/test_catalog_diff.py
+import pandas as pd
+import pytest
+
+from application.controllers import ncm_controller
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_diff import CatalogDiff, catalog_diff
+
+# (ITEM, ANEXO, NCM, DESCRIÇÃO TIPI, CST IBS E CBS, IBS, CBS)
+BASE = [
+    ("1", "Anexo I", "0101.21.00", "Reprodutores de raça pura", "200", "60", "60"),
+    ("2", "Anexo I", "0102.21.10", "Prenhes", "200", "60", "60"),
+    ("3", "Anexo II", "0201.10.00", "Carcaças", "200", "60", "60"),
+    ("4", "Anexo II", "0301.11.00", "Peixes de água doce", "200", "60", "60"),
+    ("5", "Anexo III", "0401.10.10", "Leite UHT", "200", "60", "60"),
+    ("5", "Anexo III", "0401.10.10", "Leite UHT", "200", "60", "60"),
+]
+TARGET = [
+    # mesma chave escrita de outro jeito (sem pontos, caixa) e número "60,0" == "60": sem mudança
+    ("1", "ANEXO I", "01012100", "Reprodutores de raça pura", "200", "60,0", "60"),
+    ("2", "Anexo I", "0102.21.10", "Prenhes (vacas)", "200", "60", "60"),
+    ("3", "Anexo II", "0201.10.00", "Carcaças", "000", "60", "100"),
+    ("5", "Anexo III", "0401.10.10", "Leite UHT", "200", "60", "60"),
+    ("9", "Anexo IV", "0901.11.00", "Café não torrado", "200", "60", "60"),
+    ("8", "Anexo IV", "0902.10.00", "Chá verde", "200", "60", "60"),
+]
+
+
+def snapshot(rows, version: str) -> ncm.CatalogSnapshot:
+    cols = ["ITEM", "ANEXO", "NCM", "DESCRIÇÃO TIPI", "CST IBS E CBS", "IBS", "CBS"]
+    df = pd.DataFrame(rows, columns=cols)
+    for c in ncm.WANTED_COLUMNS:
+        if c not in df.columns:
+            df[c] = ""
+    return ncm.CatalogSnapshot(df[ncm.WANTED_COLUMNS], version=version)
+
+
+@pytest.fixture(scope="module")
+def pair():
+    return snapshot(BASE, "base"), snapshot(TARGET, "target")
+
+
+def test_counts(pair):
+    diff = CatalogDiff(*pair)
+    assert diff.counts() == {"added": 2, "removed": 2, "changed": 2}
+
+
+def test_entries(pair):
+    base, target = pair
+    diff = CatalogDiff(base, target)
+    by_kind = {
+        kind: [(e["ITEM"], e["fields"]) for e in diff.entries(diff.select(kind), base, target)]
+        for kind in ("added", "removed", "changed")
+    }
+    assert by_kind["changed"] == [("2", ["DESCRIÇÃO TIPI"]), ("3", ["CST IBS E CBS", "CBS"])]
+    assert by_kind["removed"] == [("4", []), ("5", [])]  # 2ª ocorrência de "5" sumiu
+    assert sorted(by_kind["added"]) == [("8", []), ("9", [])]
+
+    removed = diff.entries(diff.select("removed"), base, target)
+    assert all(e["after"] is None and e["before"]["ITEM"] == e["ITEM"] for e in removed)
+    changed = diff.entries(diff.select("changed")[:1], base, target)[0]
+    assert (changed["before"]["DESCRIÇÃO TIPI"], changed["after"]["DESCRIÇÃO TIPI"]) == ("Prenhes", "Prenhes (vacas)")
+
+
+def test_same_version_has_no_changes(pair):
+    base, _ = pair
+    assert CatalogDiff(base, base).counts() == {"added": 0, "removed": 0, "changed": 0}
+
+
+def test_entries_need_matching_snapshots(pair):
+    base, target = pair
+    diff = CatalogDiff(base, target)
+    with pytest.raises(ValueError):
+        diff.entries(diff.select(), target, base)
+
+
+def test_diff_is_computed_once_per_pair(pair):
+    assert catalog_diff(*pair) is catalog_diff(*pair)
+
+
+class _Cache:
+    def __init__(self, snap):
+        self._snap = snap
+
+    def snapshot(self):
+        return self._snap
+
+
+@pytest.fixture
+def route(pair, monkeypatch):
+    caches = {"v1": _Cache(pair[0]), "v2": _Cache(pair[1])}
+    monkeypatch.setattr(ncm_controller, "get_cache", caches.__getitem__)
+
+    def call(**params):
+        params = {"target": "v2", "base": "v1", "change": "all", "page": 1, "limit": 50, **params}
+        return ncm_controller.get_catalog_diff(current=None, **params)
+    return call
+
+
+def test_route_pages_through_every_entry(route):
+    whole = route()
+    assert (whole["total_items"], whole["total_pages"]) == (6, 1)
+    assert whole["counts"] == {"added": 2, "removed": 2, "changed": 2}
+
+    pages = [route(page=p, limit=4) for p in (1, 2)]
+    assert [p["total_pages"] for p in pages] == [2, 2]
+    assert [len(p["data"]) for p in pages] == [4, 2]
+    assert pages[0]["data"] + pages[1]["data"] == whole["data"]
+    # página além do fim volta a última
+    assert route(page=9, limit=4)["data"] == pages[1]["data"]
+
+
+def test_route_filters_by_change(route):
+    out = route(change="changed", limit=1)
+    assert (out["total_items"], out["total_pages"], out["page"]) == (2, 2, 1)
+    assert [e["change"] for e in out["data"]] == ["changed"]
+    assert out["counts"] == {"added": 2, "removed": 2, "changed": 2}
+    empty = route(base="v2", target="v2")
+    assert (empty["total_items"], empty["total_pages"], empty["data"]) == (0, 1, [])
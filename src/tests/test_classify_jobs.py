@@ -0,0 +1,159 @@
+# src/tests/test_classify_jobs.py
+import datetime
+import io
+import os
+import time
+
+import openpyxl
+import pandas as pd
+import pytest
+
+from application.use_cases import ncm_classify as nc
+from application.use_cases import ncm_use_cases as ncm
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "getuid"), reason="permissões POSIX")
+
+
+class FixedCache:
+    """Stand-in do ItemsCache: só snapshot() é usado pelo job."""
+
+    def __init__(self):
+        df = pd.DataFrame({c: [""] * 2 for c in ncm.WANTED_COLUMNS})
+        df["NCM"] = ["1001.99.00", "0402.21.10"]
+        df["DESCRIÇÃO TIPI"] = ["Trigo e mistura de trigo com centeio", "Leite em pó integral"]
+        self._snap = ncm.CatalogSnapshot(df, version="v1")
+
+    def snapshot(self):
+        return self._snap
+
+
+def wait_done(manager, job_id):
+    for _ in range(200):
+        job = manager.get(job_id)
+        if job is not None and job.status in ("done", "error"):
+            return job
+        time.sleep(0.05)
+    raise AssertionError("job não terminou")
+
+
+@pytest.fixture
+def jobs_dir(tmp_path, monkeypatch):
+    target = tmp_path / "jobs"
+    monkeypatch.setattr(nc, "JOBS_DIR", str(target))
+    return target
+
+
+def test_job_is_visible_from_another_worker(jobs_dir):
+    # dois gerenciadores = dois workers do uvicorn com o mesmo JOBS_DIR
+    submitter, other = nc.ClassifyJobManager(workers=1), nc.ClassifyJobManager(workers=1)
+    upload = io.BytesIO("codigo;descricao\n1;trigo em grão\n2;leite em pó\n".encode())
+
+    job = submitter.submit(upload, "produtos.csv", owner_id=7, cache=FixedCache())
+    seen = wait_done(other, job.id)
+
+    assert seen is not job
+    assert (seen.status, seen.owner_id, seen.total_rows, seen.processed_rows) == ("done", 7, 2, 2)
+    assert seen.catalog_version == "v1"
+    assert seen.to_dict() == submitter.get(job.id).to_dict()
+    with open(seen.result_path, encoding="utf-8") as fh:
+        assert fh.read().splitlines()[1].startswith("1,trigo em grão,1001.99.00")
+
+
+def test_job_files_are_private(jobs_dir):
+    manager = nc.ClassifyJobManager(workers=1)
+    job = manager.submit(io.BytesIO(b"descricao\ntrigo\n"), "p.csv", owner_id=1, cache=FixedCache())
+    wait_done(manager, job.id)
+
+    assert os.stat(jobs_dir).st_mode & 0o777 == 0o700
+    for path in (job.state_path, job.result_path):
+        assert os.stat(path).st_mode & 0o077 == 0
+
+
+def test_unknown_or_malformed_job_id(jobs_dir):
+    manager = nc.ClassifyJobManager(workers=1)
+    assert manager.get("0" * 32) is None
+    assert manager.get("../../etc/passwd") is None
+
+
+def test_shared_writable_jobs_dir_is_refused(jobs_dir):
+    jobs_dir.mkdir()
+    os.chmod(jobs_dir, 0o777)
+    manager = nc.ClassifyJobManager(workers=1)
+
+    with pytest.raises(OSError):
+        manager.submit(io.BytesIO(b"descricao\ntrigo\n"), "p.csv", owner_id=1, cache=FixedCache())
+    assert os.listdir(jobs_dir) == []
+
+
+def test_expired_job_of_another_worker_is_purged(jobs_dir, monkeypatch):
+    first = nc.ClassifyJobManager(workers=1)
+    job = first.submit(io.BytesIO(b"descricao\ntrigo\n"), "p.csv", owner_id=1, cache=FixedCache())
+    wait_done(first, job.id)
+
+    monkeypatch.setattr(nc, "JOB_TTL_SECONDS", -1)
+    second = nc.ClassifyJobManager(workers=1)
+    assert second.get(job.id) is None
+    second._purge_expired()
+    assert not os.path.exists(job.state_path) and not os.path.exists(job.result_path)
+
+
+def run_job(manager, data: bytes, filename: str):
+    job = manager.submit(io.BytesIO(data), filename, owner_id=1, cache=FixedCache())
+    done = wait_done(manager, job.id)
+    assert done.status == "done", done.error
+    with open(done.result_path, encoding="utf-8") as fh:
+        return done, fh.read()
+
+
+def test_csv_total_skips_blank_lines_like_the_reader(jobs_dir):
+    data = 'codigo;descricao\n1;trigo\n\n   \n;\n2;"leite\nem pó"\n\n'.encode()
+    job, result = run_job(nc.ClassifyJobManager(workers=1), data, "p.csv")
+    assert job.total_rows == job.processed_rows == 3
+    assert job.to_dict()["progress"] == 1.0
+
+
+def test_xlsx_is_streamed_like_read_excel(tmp_path):
+    path = str(tmp_path / "p.xlsx")
+    book = openpyxl.Workbook()
+    sheet = book.active
+    for row in (
+        ["codigo", "descricao", "codigo", None],
+        [1, "trigo", 2.5, None],
+        [None, None, None, None],
+        [3.0, "leite", datetime.datetime(2024, 1, 2), "x"],
+        [None, None],
+    ):
+        sheet.append(row)
+    book.save(path)
+
+    total, batches = nc._read_batches(path, "xlsx", 2)
+    streamed = pd.concat(list(batches), ignore_index=True)
+    expected = pd.read_excel(path, engine="openpyxl", dtype=str, na_filter=False)
+
+    assert total == len(expected) == 3
+    assert list(streamed.columns) == list(expected.columns)
+    assert streamed.values.tolist() == expected.values.tolist()
+
+
+def test_small_upload_skips_the_pool(jobs_dir, monkeypatch):
+    manager = nc.ClassifyJobManager(workers=4)
+    monkeypatch.setattr(nc, "ProcessPoolExecutor", lambda *a, **k: pytest.fail("pool criado"))
+    job, _ = run_job(manager, b"descricao\ntrigo\nleite\n", "p.csv")
+    assert job.processed_rows == 2
+
+
+def test_pool_matches_in_thread_result(jobs_dir, monkeypatch):
+    monkeypatch.setattr(nc, "CLASSIFY_POOL_MIN_ROWS", 0)
+    pools = []
+    pool_class = nc.ProcessPoolExecutor
+    monkeypatch.setattr(nc, "ProcessPoolExecutor", lambda *a, **k: pools.append(k["max_workers"]) or pool_class(*a, **k))
+    lines = ["trigo em grão", "leite em pó integral", "parafuso"] * 400
+    data = ("codigo;descricao\n" + "".join(f"{i};{d}\n" for i, d in enumerate(lines))).encode()
+
+    pooled, pooled_csv = run_job(nc.ClassifyJobManager(workers=2), data, "p.csv")
+    serial, serial_csv = run_job(nc.ClassifyJobManager(workers=1), data, "p.csv")
+
+    assert pools == [2]
+    assert pooled.processed_rows == serial.processed_rows == len(lines)
+    assert pooled.matched_rows == serial.matched_rows
+    assert pooled_csv == serial_csv
@@ -0,0 +1,26 @@
+# src/tests/test_datasets.py
+import os
+import subprocess
+import sys
+
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from tests.conftest import SRC_DIR
+
+
+def test_default_dataset_must_be_configured():
+    datasets = {"atual": "Planilha_NCM.xls"}
+    assert ncm._check_default_dataset("atual", datasets) == "atual"
+    with pytest.raises(ValueError, match="NCM_DEFAULT_DATASET='proxima'"):
+        ncm._check_default_dataset("proxima", datasets)
+
+
+def test_bad_default_fails_at_import():
+    env = {**os.environ, "NCM_DATASETS": "atual=Planilha_NCM.xls", "NCM_DEFAULT_DATASET": "ncm"}
+    proc = subprocess.run(
+        [sys.executable, "-c", "import application.use_cases.ncm_use_cases"],
+        cwd=SRC_DIR, env=env, capture_output=True, text=True,
+    )
+    assert proc.returncode != 0
+    assert "NCM_DEFAULT_DATASET='ncm'" in proc.stderr
@@ -0,0 +1,49 @@
+# src/tests/test_details_batch.py
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def sample_keys(snap, n: int = 5) -> tuple[list, list]:
+    ncms = list(dict.fromkeys(r["NCM"] for r in snap.rows if r["NCM"]))[:n]
+    items = list(dict.fromkeys(r["ITEM"] for r in snap.rows if r["ITEM"]))[:n]
+    return ncms, items
+
+
+def test_batch_matches_single_lookups(cache):
+    ncms, items = sample_keys(cache.snapshot())
+    out = cache.find_details_batch(ncms=ncms, items=items)
+    assert list(out["ncm"]) == ncms and list(out["item"]) == items
+    for k in ncms:
+        assert out["ncm"][k] == ncm.to_api_details(cache.find_details(ncm=k))
+        assert out["ncm"][k]
+    for k in items:
+        assert out["item"][k] == ncm.to_api_details(cache.find_details(item=k))
+        assert out["item"][k]
+
+
+def test_ncm_with_or_without_dots(cache):
+    code = next(r["NCM"] for r in cache.snapshot().rows if "." in r["NCM"])
+    digits = code.replace(".", "")
+    out = cache.find_details_batch(ncms=[code, digits])
+    assert out["ncm"][code] == out["ncm"][digits] != []
+
+
+def test_unknown_and_empty_keys_are_empty_lists(cache):
+    out = cache.find_details_batch(ncms=["9999.99.99", ""], items=["item que não existe"])
+    assert out == {"ncm": {"9999.99.99": [], "": []}, "item": {"item que não existe": []}}
+
+
+def test_repeated_keys_are_answered_once(cache):
+    ncms, _ = sample_keys(cache.snapshot(), 2)
+    out = cache.find_details_batch(ncms=[ncms[0], ncms[1], ncms[0]])
+    assert list(out["ncm"]) == ncms
+
+
+def test_no_keys(cache):
+    assert cache.find_details_batch() == {"ncm": {}, "item": {}}
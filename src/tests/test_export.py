@@ -0,0 +1,55 @@
+# src/tests/test_export.py
+import csv
+import io
+import json
+
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def ndjson_rows(chunks) -> list:
+    return [json.loads(line) for line in b"".join(chunks).decode("utf-8").splitlines()]
+
+
+def test_ndjson_matches_search(cache):
+    snap = cache.snapshot()
+    filters = [("DESCRIÇÃO TIPI", "leite")]
+    expected = snap.api_rows(cache.search_ids(filters))
+    assert expected
+    assert ndjson_rows(ncm.iter_export(cache, filters, "ndjson", snap=snap, batch_size=7)) == expected
+
+
+def test_csv_has_header_and_same_rows(cache):
+    snap = cache.snapshot()
+    filters = [("ALL", "0206")]
+    expected = snap.api_rows(cache.search_ids(filters))
+    reader = csv.reader(io.StringIO(b"".join(ncm.iter_export(cache, filters, "csv", snap=snap, batch_size=4)).decode("utf-8")))
+    header, *rows = list(reader)
+    assert header == ncm.WANTED_COLUMNS
+    assert rows == [[str(r[c]) for c in ncm.WANTED_COLUMNS] for r in expected]
+
+
+def test_batches_do_not_change_output(cache):
+    snap = cache.snapshot()
+    filters = [("ALL", "queijo")]
+    whole = b"".join(ncm.iter_export(cache, filters, snap=snap, batch_size=100_000))
+    assert b"".join(ncm.iter_export(cache, filters, snap=snap, batch_size=3)) == whole
+
+
+def test_no_filters_exports_whole_catalog(cache):
+    snap = cache.snapshot()
+    rows = ndjson_rows(ncm.iter_export(cache, [], snap=snap))
+    assert len(rows) == len(snap)
+    assert rows[0] == snap.api_rows([0])[0]
+
+
+def test_no_match_exports_only_header(cache):
+    header = b"".join(ncm.iter_export(cache, [("ALL", "zzzz inexistente")], "csv"))
+    assert header.decode("utf-8").splitlines() == [",".join(ncm.WANTED_COLUMNS)]
+    assert b"".join(ncm.iter_export(cache, [("ALL", "zzzz inexistente")])) == b""
@@ -0,0 +1,72 @@
+# src/tests/test_fuzzy_index.py
+import random
+
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import FuzzyIndex, within_distance
+
+
+@pytest.fixture(scope="module")
+def catalog():
+    cache = ncm.ItemsCache()
+    return cache, cache.snapshot()
+
+
+def test_transposition_counts_as_one_edit():
+    assert within_distance("tirgo", "trigo", 1)
+    assert within_distance("mandicoa", "mandioca", 1)
+    assert not within_distance("integal", "intgeral", 1)
+    assert not within_distance("ca", "abc", 2)
+
+
+def test_max_distance_is_one():
+    assert [FuzzyIndex.max_distance(t) for t in ("po", "leite", "mandioca", "cristalizados")] == [0, 1, 1, 1]
+
+
+def test_typos_of_real_tokens(catalog):
+    _, snap = catalog
+    index = snap.fuzzy["DESCRIÇÃO TIPI"]
+    expected = {"tirgo": "trigo", "lelte": "leite", "mandicoa": "mandioca", "fairnha": "farinha", "crital": "cristal"}
+    for typo, token in expected.items():
+        assert token in index.vocab_terms([typo]), typo
+
+
+def test_every_single_edit_is_found(catalog):
+    # deleções de 1 nível: toda palavra do vocabulário a 1 edição tem que aparecer
+    _, snap = catalog
+    index = snap.fuzzy["DESCRIÇÃO TIPI"]
+    rng = random.Random(0)
+    tokens = [t for t in index._vocab if len(t) > 4 and t.isalpha()]
+    for token in rng.sample(tokens, 300):
+        i = rng.randrange(len(token) - 1)
+        typos = [
+            token[:i] + token[i + 1] + token[i] + token[i + 2:],   # inversão
+            token[:i] + "x" + token[i + 1:],                       # troca
+            token[:i] + token[i + 1:],                             # remoção
+            token[:i] + "q" + token[i:],                           # inserção
+        ]
+        for typo in typos:
+            if len(typo) > 3:
+                assert token in index.vocab_terms([typo]), (token, typo)
+
+
+def test_fuzzy_search_on_catalog(catalog):
+    cache, snap = catalog
+    typo = cache.search_ids([("DESCRIÇÃO TIPI", "farinha tirgo", "fuzzy")])
+    exact = cache.search_ids([("DESCRIÇÃO TIPI", "farinha trigo", "fuzzy")])
+    assert typo.size > 0 and typo.tolist() == exact.tolist()
+    assert all("trigo" in snap.rows[i]["DESCRIÇÃO TIPI"].lower() for i in typo.tolist())
+
+    rows = cache.search_ids([("ALL", "fairnha de mandicoa", "fuzzy")])
+    assert rows.size > 0
+
+
+@pytest.mark.parametrize("typo, correct", [("farinha de tirgo", "farinha de trigo"), ("leite integal", "leite integral")])
+def test_search_docstring_examples(catalog, typo, correct):
+    # exemplos da documentação de /itens/search (match=fuzzy)
+    cache, _ = catalog
+    found = cache.search_ids([("ALL", typo, "fuzzy")])
+    assert found.size > 0
+    assert found.tolist() == cache.search_ids([("ALL", correct, "fuzzy")]).tolist()
+    assert cache.search_ids([("ALL", typo)]).size == 0
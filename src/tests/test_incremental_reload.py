@@ -0,0 +1,80 @@
+# src/tests/test_incremental_reload.py
+import os
+import shutil
+import time
+
+import numpy as np
+import openpyxl
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from tests.conftest import WORKBOOK_DIR
+
+SOURCE = os.path.join(WORKBOOK_DIR, "Planilha_NCM.xlsx")
+KEEP_ROWS = 60
+
+
+def assert_same_catalog(a, b):
+    assert list(a.columns) == list(b.columns)
+    for c in a.columns:
+        assert np.asarray(a.columns[c]).tolist() == np.asarray(b.columns[c]).tolist(), c
+    for c in a.norm:
+        assert list(a.norm[c]) == list(b.norm[c]), c
+    assert a.rows == b.rows
+    assert list(a.legal_basis.uniques) == list(b.legal_basis.uniques)
+    assert a.version == b.version
+
+
+@pytest.fixture(scope="module")
+def trimmed_workbook(tmp_path_factory) -> str:
+    """Planilha_NCM.xlsx com as primeiras linhas de cada aba (mesmas abas e cabeçalhos)."""
+    wb = openpyxl.load_workbook(SOURCE)
+    for ws in wb.worksheets:
+        if ws.max_row > KEEP_ROWS:
+            ws.delete_rows(KEEP_ROWS + 1, ws.max_row - KEEP_ROWS)
+    path = str(tmp_path_factory.mktemp("planilha") / "base.xlsx")
+    wb.save(path)
+    return path
+
+
+def bump_mtime(path: str, seconds: int) -> None:
+    t = time.time() + seconds
+    os.utime(path, (t, t))
+
+
+def edit_cell(ws) -> None:
+    for row in ws.iter_rows(min_row=5, max_row=6):
+        for cell in row:
+            if isinstance(cell.value, str) and cell.value.strip():
+                cell.value += " EDITADO"
+                return
+
+
+def delete_row(ws) -> None:
+    ws.delete_rows(6)
+
+
+@pytest.mark.parametrize("edit", [edit_cell, delete_row])
+def test_reload_after_editing_one_sheet_matches_full_load(trimmed_workbook, tmp_path, monkeypatch, edit):
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", "")
+    path = str(tmp_path / "catalogo.xlsx")
+    shutil.copy(trimmed_workbook, path)
+    cache = ncm.ItemsCache(excel_path=path)
+    first = cache.snapshot()
+    sheets = cache.cache_stats()["last_load"]["sheets"]
+
+    wb = openpyxl.load_workbook(path)
+    edit(wb[wb.sheetnames[3]])
+    wb.save(path)
+    bump_mtime(path, 10)
+
+    reloaded = cache.snapshot()
+    assert reloaded is not first
+    stats = cache.cache_stats()["last_load"]
+    assert (stats["source"], stats["reparsed"], stats["reused"]) == ("spreadsheet", 1, sheets - 1)
+    full = ncm.ItemsCache(excel_path=path)
+    assert_same_catalog(reloaded, full.snapshot())
+    assert full.cache_stats()["last_load"]["reparsed"] == sheets
+    edited = cache.search_ids([("ALL", "editado")])
+    assert edited.tolist() == full.search_ids([("ALL", "editado")]).tolist()
+    assert edited.size == (edit is edit_cell)
@@ -0,0 +1,54 @@
+# src/tests/test_memory_report.py
+import sys
+
+import numpy as np
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+
+@pytest.fixture(scope="module")
+def report():
+    cache = ncm.ItemsCache()
+    return cache.snapshot(), cache.memory_report()
+
+
+def test_totals_add_up(report):
+    _, rep = report
+    structures = {s["structure"]: s["bytes"] for s in rep["structures"]}
+    assert list(structures) == list(ncm.CatalogSnapshot.STRUCTURES)
+    assert rep["columns_total_bytes"] == sum(c["total_bytes"] for c in rep["columns"])
+    assert rep["structures_total_bytes"] == sum(structures.values())
+    assert rep["total_bytes"] == rep["columns_total_bytes"] + rep["structures_total_bytes"]
+
+
+def test_payload_dicts_are_counted(report):
+    snap, rep = report
+    structures = {s["structure"]: s["bytes"] for s in rep["structures"]}
+    dict_overhead = sys.getsizeof(snap.rows) + sum(sys.getsizeof(r) for r in snap.rows)
+    assert structures["rows"] >= dict_overhead
+    assert structures["norm"] >= sum(v.nbytes for v in snap.norm.values())
+    assert all(structures[name] > 0 for name in ("trigrams", "bm25", "fuzzy", "suggest", "ncm_tree"))
+
+
+def test_shared_objects_count_once():
+    text = "x" * 1000
+    arr = np.array([text, text], dtype=object)
+    seen = set()
+    first = ncm._deep_sizeof({"a": arr, "b": arr[:1]}, seen)
+    assert first < 2 * sys.getsizeof(text)
+    assert ncm._deep_sizeof([text, arr], seen) == sys.getsizeof([text, arr])
+
+
+def test_mapping_proxies_are_not_undercounted():
+    from types import MappingProxyType
+
+    rows = tuple(MappingProxyType({"a": i}) for i in range(1000, 1100))
+    expected = sys.getsizeof(rows) + sum(sys.getsizeof(r) + sys.getsizeof(dict(r)) for r in rows)
+    assert ncm._deep_sizeof(rows, set()) >= expected
+
+
+def test_memory_route_registered_once():
+    from application.controllers.ncm_controller import router
+
+    assert [r.path for r in router.routes].count(f"{router.prefix}/memory") == 1
@@ -0,0 +1,102 @@
+# src/tests/test_ncm_search.py
+import re
+
+import numpy as np
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import NcmTreeIndex, format_ncm_prefix
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+def contains_all(cache, snap, q: str) -> np.ndarray:
+    """Busca "contém" em todas as colunas (comportamento de ALL antes do índice de NCM)."""
+    matcher = cache._filter_matcher(snap, ("ALL", ncm.normalize_for_compare(q, True)))
+    return np.flatnonzero(matcher(0, len(snap)))
+
+
+def numbers_from_text(snap, limit: int = 125) -> list:
+    found = {}
+    for col in ("ITEM", "DESCRIÇÃO DO PRODUTO", "DESCRIÇÃO TIPI", "DESCRIÇÃO COMPLETA"):
+        for text in snap.columns[col]:
+            for number in re.findall(r"\b\d{4}(?:\.\d{1,2})?\b", str(text)):
+                found.setdefault(number, None)
+    return sorted(found)[:limit]
+
+
+def test_all_keeps_every_contains_match(cache):
+    snap = cache.snapshot()
+    numbers = numbers_from_text(snap)
+    assert len(numbers) == 125
+    for q in numbers:
+        got = cache.search_ids([("ALL", q)])
+        baseline = contains_all(cache, snap, q)
+        subtree = np.flatnonzero(snap.ncm_tree.mask(q.replace(".", "")))
+        assert got.tolist() == np.union1d(baseline, subtree).tolist(), q
+
+
+@pytest.mark.parametrize("q, rows", [("0206", 81), ("0707", 43), ("8471", 36), ("0101.2", 2)])
+def test_all_counts_match_contains_baseline(cache, q, rows):
+    # contagens do catálogo empacotado antes do índice de NCM (busca "contém")
+    assert cache.search_ids([("ALL", q)]).size == rows
+    assert cache.search_ranked([("ALL", q)]).size == rows
+
+
+def test_ncm_field_is_prefix_only(cache):
+    snap = cache.snapshot()
+    ids = cache.search_ids([("NCM", "0206")])
+    assert ids.size == 10
+    assert all(snap.rows[i]["NCM"].replace(".", "").startswith("0206") for i in ids.tolist())
+
+
+def ncm_digits(snap) -> list:
+    return [re.sub(r"\D", "", str(r["NCM"]))[:8] for r in snap.rows]
+
+
+def test_tree_index_on_small_catalog():
+    tree = NcmTreeIndex(["0101.21.00", "0101.29.00", "0102.21.10", "0101.21.00", "", "0201.10.00"])
+    assert tree.rows("01").tolist() == [0, 1, 2, 3]
+    assert tree.rows("01012").tolist() == [0, 1, 3]
+    assert tree.mask("0201").tolist() == [False] * 5 + [True]
+    assert tree.children("") == (2, [("01", 4, 3), ("02", 1, 1)])
+    assert tree.children("01") == (4, [("0101", 3, 2), ("0102", 1, 1)])
+    assert tree.children("0101") == (5, [("01012", 3, 2)])
+    assert tree.children("01012100") == (None, [])
+
+
+@pytest.mark.parametrize("prefix", ["", "04", "0402", "0402.2", "0402.21"])
+def test_children_add_up_to_parent(cache, prefix):
+    snap = cache.snapshot()
+    digits = ncm_digits(snap)
+    node = cache.ncm_children(prefix)
+    p = prefix.replace(".", "")
+    assert node["total_rows"] == sum(d.startswith(p) for d in digits)
+    assert node["children"]
+    for child in node["children"]:
+        under = [d for d in digits if d.startswith(child["digits"])]
+        assert child["rows"] == len(under) and child["ncms"] == len(set(under))
+        assert child["code"] == format_ncm_prefix(child["digits"])
+    # linhas com NCM mais curto que o nível (ou vazio) não entram nos filhos
+    assert sum(c["rows"] for c in node["children"]) <= node["total_rows"]
+
+
+def test_children_levels_and_errors(cache):
+    assert cache.ncm_children("")["level"] == "capitulo"
+    assert cache.ncm_children("0402")["level"] == "subposicao1"
+    assert cache.ncm_children("0402.21")["prefix"] == "0402.21"
+    for bad in ("04a", "0402.21.10.1"):
+        with pytest.raises(ValueError):
+            cache.ncm_children(bad)
+
+
+@pytest.mark.parametrize("q", ["04", "0402", "0402.2", "04022", "0402.21.10"])
+def test_ncm_field_prefix_is_subtree(cache, q):
+    snap = cache.snapshot()
+    p = q.replace(".", "")
+    expected = [i for i, d in enumerate(ncm_digits(snap)) if d.startswith(p)]
+    assert expected
+    assert cache.search_ids([("NCM", q)]).tolist() == expected
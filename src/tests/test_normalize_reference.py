@@ -0,0 +1,79 @@
+# src/tests/test_normalize_reference.py
+import hashlib
+import json
+
+import pandas as pd
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+# a normalização não pode depender de comportamento do pandas marcado para mudar
+pytestmark = pytest.mark.filterwarnings("error::FutureWarning")
+
+# Catálogo normalizado de cada planilha empacotada, congelado a partir do normalizador
+# original (ItemsCache._load_excel antes da vetorização): (linhas, digest das colunas,
+# digest do _debug_sheets). Mudança de normalização tem que atualizar isto de propósito.
+REFERENCE = {
+    "Planilha_NCM.xls": (
+        13236,
+        "e5b6572d1c34965605efab2e42bffd72aac309ea44c922487974d6ed60beca91",
+        "feb0997ce5d5ba70525e2e77bd0210f35458c942d88a54d7709b4688eb73460a",
+    ),
+    "Planilha_NCM.xlsx": (
+        12121,
+        "340fb8adfc10efbf12e266e6dfb4ed362d0dd1bb585e2de91635a77dfc0f65da",
+        "83d01f61c71d4147416db0facb48cb23fe23b6f33c797f982e98a132faba6f38",
+    ),
+    "Planilha_NCM2.xls": (
+        2532,
+        "d47311c276eee0adcca3053f7f591b9941c84283f8b7ebb02e50ea172035bd07",
+        "fdd00b37635f02cfae616bea3223c376d54062394a3854a6058a5770edfce203",
+    ),
+    "Planilha_NCM4.xls": (
+        2433,
+        "01284872f29dc7f204c44a133cac18a6ebff9f7eefc0937b2171d593e33f21e0",
+        "d2743f288fddb297907d5331f219e6c391fc9d50bfb2f111a2b24b913df5414c",
+    ),
+}
+
+
+def frame_digest(df: pd.DataFrame) -> str:
+    """SHA-256 dos nomes e de cada célula (como texto), coluna a coluna, na ordem."""
+    h = hashlib.sha256()
+    for c in df.columns:
+        h.update(str(c).encode())
+        h.update(b"\x1d")
+        for v in df[c].tolist():
+            h.update(str(v).encode())
+            h.update(b"\x1e")
+    return h.hexdigest()
+
+
+def debug_digest(debug: dict) -> str:
+    return hashlib.sha256(json.dumps(debug, sort_keys=True, default=str).encode()).hexdigest()
+
+
+def test_prepare_sheet_matches_reference(workbook, raw_sheets):
+    results = [
+        ncm._prepare_sheet(str(raw_name).strip(), raw)
+        for raw_name, raw in raw_sheets.items()
+        if not ncm._is_ignored_sheet(raw_name)
+    ]
+    df = pd.concat([frame for _, frame, debug in results if debug["rows_after"] > 0], ignore_index=True)
+
+    rows, columns, debug = REFERENCE[workbook]
+    assert len(df) == rows
+    assert frame_digest(df) == columns
+    assert debug_digest({name: d for name, _, d in results}) == debug
+
+
+def test_loaded_snapshot_matches_reference(workbook, workbook_path, monkeypatch):
+    # caminho completo da carga: segmentos por aba, colunas codificadas e STRING_POOL
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", "")
+    cache = ncm.ItemsCache(excel_path=workbook_path)
+    snap = cache.snapshot()
+
+    rows, columns, debug = REFERENCE[workbook]
+    assert len(snap) == rows
+    assert frame_digest(snap.to_frame()) == columns
+    assert debug_digest(cache._debug_sheets) == debug
@@ -0,0 +1,50 @@
+# src/tests/test_reload_signature.py
+import os
+import shutil
+
+from application.use_cases import ncm_use_cases as ncm
+from tests.conftest import WORKBOOK_DIR
+
+OLD = os.path.join(WORKBOOK_DIR, "Planilha_NCM4.xls")
+NEW = os.path.join(WORKBOOK_DIR, "Planilha_NCM2.xls")
+
+
+def test_file_replaced_during_load_is_picked_up(tmp_path, monkeypatch):
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", "")
+    path = str(tmp_path / "catalogo.xls")
+    shutil.copy(OLD, path)
+    file_digest = ncm._file_digest
+    replaced = []
+
+    def digest_then_replace(p):
+        # a planilha é trocada (rename atômico) enquanto a versão antiga é processada
+        out = file_digest(p)
+        if not replaced:
+            shutil.copy(NEW, p + ".new")
+            os.replace(p + ".new", p)
+            replaced.append(p)
+        return out
+
+    monkeypatch.setattr(ncm, "_file_digest", digest_then_replace)
+    cache = ncm.ItemsCache(excel_path=path)
+    first = cache.snapshot()
+    second = cache.snapshot()
+
+    assert replaced
+    assert second is not first
+    assert second.version == file_digest(NEW)[:16]
+    assert cache.snapshot() is second
+
+
+def test_rewrite_with_same_mtime_is_detected(tmp_path, monkeypatch):
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", "")
+    path = str(tmp_path / "catalogo.xls")
+    shutil.copy(OLD, path)
+    cache = ncm.ItemsCache(excel_path=path)
+    first = cache.snapshot()
+
+    st = os.stat(path)
+    shutil.copyfile(NEW, path)
+    os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    assert cache.snapshot() is not first
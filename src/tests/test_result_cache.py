@@ -0,0 +1,46 @@
+# src/tests/test_result_cache.py
+import numpy as np
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import QueryResultCache
+from tests.conftest import WORKBOOK_DIR
+
+
+def test_peek_does_not_count():
+    cache = QueryResultCache(maxsize=2)
+    assert cache.peek(("a",)) is None
+    cache.put(("a",), np.arange(3))
+    assert cache.peek(("a",)).tolist() == [0, 1, 2]
+    assert (cache.stats()["hits"], cache.stats()["misses"]) == (0, 0)
+
+
+@pytest.fixture(scope="module")
+def items_cache():
+    mp = pytest.MonkeyPatch()
+    mp.setattr(ncm, "SNAPSHOT_DIR", "")
+    cache = ncm.ItemsCache(excel_path=f"{WORKBOOK_DIR}/Planilha_NCM2.xls")
+    cache.snapshot()
+    yield cache
+    mp.undo()
+
+
+def test_cursor_pages_leave_stats_untouched(items_cache):
+    filters = [("DESCRIÇÃO TIPI", "leite")]
+    before = items_cache._results.stats()
+
+    after, pages = -1, []
+    while True:
+        ids, has_more = items_cache.search_after(filters, after=after, limit=5)
+        pages.append(ids)
+        if not has_more:
+            break
+        after = int(ids[-1])
+
+    assert items_cache._results.stats() == before
+    # mesma resposta da busca completa, que passa a ficar no cache e é recortada
+    full = items_cache.search_ids(filters)
+    assert np.concatenate(pages).tolist() == full.tolist()
+    cached_page, _ = items_cache.search_after(filters, after=int(full[0]), limit=5)
+    assert cached_page.tolist() == full[1:6].tolist()
+    assert items_cache._results.stats()["misses"] == before["misses"] + 1
@@ -0,0 +1,54 @@
+# src/tests/test_snapshot_dir.py
+import os
+import pickle
+
+import pandas as pd
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+
+pytestmark = pytest.mark.skipif(not hasattr(os, "getuid"), reason="permissões POSIX")
+
+
+def small_snapshot() -> ncm.CatalogSnapshot:
+    df = pd.DataFrame({c: ["0101.21.00" if c == "NCM" else "x"] for c in ncm.WANTED_COLUMNS})
+    return ncm.CatalogSnapshot(df, version="t")
+
+
+def test_snapshot_dir_is_created_private(tmp_path, monkeypatch):
+    target = tmp_path / "snap"
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", str(target))
+
+    ncm._write_snapshot("d", small_snapshot(), {}, [])
+
+    assert os.stat(target).st_mode & 0o777 == 0o700
+    assert os.stat(ncm._snapshot_path("d")).st_mode & 0o077 == 0
+    assert ncm._read_snapshot("d")["snapshot"].version == "t"
+
+
+def test_shared_writable_dir_is_not_used(tmp_path, monkeypatch):
+    shared = tmp_path / "shared"
+    shared.mkdir()
+    os.chmod(shared, 0o777)
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", str(shared))
+    with open(ncm._snapshot_path("d"), "wb") as fh:
+        pickle.dump({"version": ncm.CATALOG_FORMAT_VERSION, "snapshot": small_snapshot()}, fh)
+
+    assert ncm._read_snapshot("d") is None
+
+
+def test_group_writable_snapshot_file_is_ignored(tmp_path, monkeypatch):
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", str(tmp_path / "snap"))
+    ncm._write_snapshot("d", small_snapshot(), {}, [])
+    os.chmod(ncm._snapshot_path("d"), 0o666)
+
+    assert ncm._read_snapshot("d") is None
+
+
+def test_symlinked_dir_is_not_used(tmp_path, monkeypatch):
+    real = tmp_path / "real"
+    real.mkdir(mode=0o700)
+    link = tmp_path / "link"
+    link.symlink_to(real)
+
+    assert ncm.ensure_private_dir(str(link)) is False
@@ -0,0 +1,58 @@
+# src/tests/test_string_pool.py
+import pandas as pd
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from tests.conftest import WORKBOOK_DIR
+
+
+def loaded_cache(text: str) -> ncm.ItemsCache:
+    df = pd.DataFrame({c: [text] for c in ncm.WANTED_COLUMNS})
+    cache = ncm.ItemsCache()
+    cache._snapshot = ncm.CatalogSnapshot(df, version=text)
+    return cache
+
+
+def in_pool(text: str) -> bool:
+    return text in ncm.STRING_POOL._strings
+
+
+@pytest.fixture
+def shared(monkeypatch):
+    caches = {}
+    monkeypatch.setattr(ncm, "_SHARED_CACHES", caches)
+    monkeypatch.setattr(ncm, "_PRUNE_PENDING", False)
+    return caches
+
+
+def test_prune_waits_for_a_load_in_progress(shared):
+    a, b = loaded_cache("texto de a"), loaded_cache("texto de b")
+    shared.update({"a": a, "b": b})
+    in_flight = "".join(["só da carga de b ", "em andamento"])
+
+    with b._reload_lock:
+        # b está carregando: já internou textos que nenhum snapshot servido tem
+        ncm.STRING_POOL.share_list([in_flight])
+        ncm._prune_string_pool(a, a.loaded_snapshot)
+        assert ncm._PRUNE_PENDING
+        assert in_pool(in_flight)
+
+    ncm._prune_string_pool(b, b.loaded_snapshot)
+    assert not ncm._PRUNE_PENDING
+    assert not in_pool(in_flight)
+    assert in_pool("texto de a") and in_pool("texto de b")
+
+
+def test_pending_prune_runs_after_first_load(shared, monkeypatch):
+    monkeypatch.setattr(ncm, "SNAPSHOT_DIR", "")
+    monkeypatch.setattr(ncm, "_PRUNE_PENDING", True)
+    stale = "".join(["texto de uma versão ", "que ninguém serve mais"])
+    ncm.STRING_POOL.share_list([stale])
+
+    cache = ncm.ItemsCache(excel_path=f"{WORKBOOK_DIR}/Planilha_NCM4.xls")
+    shared["ncm4"] = cache
+    snap = cache.snapshot()
+
+    assert not ncm._PRUNE_PENDING
+    assert not in_pool(stale)
+    assert in_pool(snap.rows[0]["NCM"])
@@ -0,0 +1,60 @@
+# src/tests/test_suggest.py
+import pytest
+
+from application.use_cases import ncm_use_cases as ncm
+from application.use_cases.ncm_indexes import SuggestIndex
+
+
+@pytest.fixture(scope="module")
+def cache():
+    return ncm.ItemsCache()
+
+
+@pytest.fixture
+def index():
+    ncms = ["0402.10.10", "0402.10.10", "0402.21.10", "0406.10.10", "0101.21.00", ""]
+    texts = ["leite em po", "leite integral", "leite", "queijo", "leitoes", "lei da ncm", "leite em po"]
+    return SuggestIndex(ncms, [texts])
+
+
+def test_ncm_prefix_in_code_order(index):
+    expected = [("0402.10.10", 2), ("0402.21.10", 1)]
+    assert index.ncm("0402", 10) == expected
+    assert index.ncm("040", 10) == expected + [("0406.10.10", 1)]
+    assert index.ncm("04022", 10) == [("0402.21.10", 1)]
+    assert index.ncm("0402", 1) == [("0402.10.10", 2)]
+    assert index.ncm("9", 10) == []
+
+
+def test_terms_by_distinct_descriptions(index):
+    # "leite em po" repetido conta uma vez; "da" é palavra vazia
+    assert index.terms("lei", 10) == [("leite", 3), ("lei", 1), ("leitoes", 1)]
+    assert index.terms("lei", 1) == [("leite", 3)]
+    assert index.terms("d", 10) == []
+    assert index.terms("x", 10) == []
+
+
+def test_suggest_ncm_from_catalog(cache):
+    snap = cache.snapshot()
+    out = cache.suggest("0402.2", limit=5)
+    assert out and len(out) <= 5
+    for s in out:
+        assert s["kind"] == "ncm" and s["value"].replace(".", "").startswith("04022")
+        assert s["count"] == sum(1 for r in snap.rows if r["NCM"].strip() == s["value"])
+    assert [s["value"] for s in out] == sorted(s["value"] for s in out)
+    assert cache.suggest("0402 2", limit=5) == out
+
+
+def test_suggest_completes_last_term(cache):
+    out = cache.suggest("Farinha de tri", limit=3)
+    assert out and len(out) <= 3
+    assert all(s["kind"] == "term" and s["value"].startswith("farinha de tri") for s in out)
+    assert "farinha de trigo" in [s["value"] for s in out]
+    counts = [s["count"] for s in out]
+    assert counts == sorted(counts, reverse=True)
+
+
+def test_suggest_empty_query(cache):
+    assert cache.suggest("") == []
+    assert cache.suggest("   ") == []
+    assert cache.suggest("zzzzqqq") == []